@@ -2,6 +2,9 @@
 import curses
 import csv
 import feedparser
+import hashlib
+import fcntl
+import json
 import sqlite3
 import requests
 import time
@@ -13,9 +16,36 @@ import configparser
 from textwrap import wrap
 import re
 import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import atexit
 import threading
-from datetime import datetime
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime, formatdate
+from email.message import EmailMessage
+from email.headerregistry import Address
+from email.generator import BytesGenerator
+import email.policy
+from html import escape
 import argparse
+import sys
+import functools
+import contextlib
+import queue
+import socket
+import socketserver
+import shlex
+import tempfile
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, FIRST_COMPLETED
+from concurrent.futures import wait as futures_wait
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlsplit, urlunsplit, urljoin, unquote
+from collections import OrderedDict
+from bisect import bisect_left
+from itertools import groupby
+from operator import itemgetter
+from lxml import etree as ET
+from lxml import html as LH
 
 program = "Feedln"
 version = "1.0.5"
@@ -23,7 +53,50 @@ database = "feedln.sq3"
 feedfile = "feedln.csv"
 cfgfile = "feedln.cfg"
 logfile = "feedln.log"
-reqtimeout = 8
+log_size = 1  # MB of the log file, before it is rotated
+log_backups = 3  # Rotated log files kept
+reqtimeout = 8  # Read timeout
+connect_timeout = 4
+max_failures = 5  # Failures in a row, before a feed is skipped for the cooldown
+failure_cooldown = 6 * 3600
+refresh_deadline = 600  # Seconds a full refresh may take
+cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "feedln")
+cache_size = 200  # MB of linked pages, images and media kept offline
+prefetch_workers = 4
+shared_cache = ""  # Directory of feed responses shared between users, disabled if empty
+shared_cache_ttl = 900  # Seconds a shared response is reused
+daemon_interval = 1800  # Seconds between refreshes of the daemon
+fast_parser = True  # Parse plain RSS 2.0 and Atom with lxml, feedparser for the rest
+parse_workers = 0  # Processes parsing feeds during large refreshes, 0 or 1 to parse in the main one
+parse_chunk = 4  # Feeds sent to a parse worker at a time
+rules_file = ""  # Ingest rules, next to the feeds file if empty
+rewrite_redirects = False  # Write the new address of permanently redirected feeds to the feeds file
+download_dir = os.path.join(os.path.expanduser("~"), "Downloads", "feedln")  # Enclosures and queued links
+download_workers = 3  # Downloads running at the same time
+download_rate = 0  # KB/s of all downloads together, 0 for no limit
+download_manager = None
+ingest_rules = None  # (mtime, IngestRules) of the rules file, compiled once
+daemon_socket = ""  # Socket of the daemon, set when the interface is attached to it
+daemon_client = None
+BACKOFF_BASE = 60
+RENDER_CACHE_SIZE = 32  # Entry layouts kept in memory, one per entry and width
+LAYOUT_CHUNK = 40  # Paragraphs of an entry wrapped at a time
+PAD_PAGES = 4  # Screens of wrapped lines drawn in the pad of an entry
+PRERENDER_AHEAD = 3  # Entries rendered in background, before and after the current one
+QUERY_CACHE_SIZE = 256  # Query results kept in memory
+QUERY_CACHE_MAX_ROWS = 20000  # Larger results are not cached
+VIEW_PAGE_SIZE = 200  # Items loaded at a time in the smart views
+READ_JOURNAL_SIZE = 50  # Bulk read state changes kept for undo
+READ_JOURNAL_IDS = 1000  # Larger changes are journaled by their condition
+PERMANENT_REDIRECTS = (301, 308)
+TRACKING_PARAMS = re.compile(r"utm_\w+|fbclid|gclid|dclid|msclkid|yclid|mc_cid|mc_eid|_hsenc|_hsmi|igshid", re.I)
+DOWNLOAD_CHUNK = 65536
+DOWNLOAD_SAVE_INTERVAL = 2  # Seconds between saves of the download progress
+SYNC_PENDING_DAYS = 60  # Synced read states of items not fetched yet are kept this long
+LOG_TAIL_BYTES = 256 * 1024  # End of the log file shown in the log screen
+LOG_LEVELS = ("INFO", "WARNING", "ERROR")
+PARSE_POOL_MIN_FEEDS = 20  # Smaller refreshes are parsed in the main process
+PARSE_POOL_MIN_BYTES = 16384  # Smaller feeds too
 
 browser = os.environ["BROWSER"]  # get settings from environment
 media = os.environ["PLAYER"]  # "mpv"
@@ -31,35 +104,124 @@ xterm = "-fa 'Monospace' -fs 14"
 editor = os.environ["EDITOR"]
 
 SPEAK = "espeak"
+TTS_RATE = 175  # Words per minute, espeak's default
+TTS_PAUSE = 0.4  # Seconds between sentences
+TTS_LEAD = 0.5  # Seconds before the end of a sentence, the next one is written
+TTS_MAX_SENTENCE = 300  # Longer sentences are spoken in parts
 FETCHONLOAD = False
 
 
+# Split a text into sentences, the units the speech can be skipped by
+def split_sentences(text):
+    sentences = []
+    for paragraph in text.splitlines():
+        for sentence in re.split(r"(?<=[.!?:;])\s+", paragraph.strip()):
+            sentences.extend(wrap(sentence, TTS_MAX_SENTENCE))
+    return sentences
+
+
+# Seconds the synthesizer takes to say a sentence, at TTS_RATE words per minute
+def speaking_time(sentence):
+    return len(sentence.split()) * 60 / TTS_RATE + TTS_PAUSE
+
+
 class InterruptibleTTS:
+    """
+    One synthesizer process, started without a shell, reads the text from
+    stdin and speaks it line by line, a sentence per line. Sentences are
+    written as the previous one is about to end, so speech starts at once
+    and the sentence being spoken is known, for skipping forward and back.
+    Skipping or stopping kills only this child process, and the next
+    sentence starts a new one.
+    """
     def __init__(self):
-        self.speaking = False
         self.enabled = False
+        self.process = None
+        self.sentences = []
+        self.position = 0  # Next sentence to write
+        self.spoken_by = 0  # Time the written sentences should be spoken by
+        self.condition = threading.Condition()
+        self.thread = None
+
+    @property
+    def speaking(self):
+        return self.position < len(self.sentences) or time.time() < self.spoken_by
 
     def speak(self, text):
-        def run():
-            self.speaking = True
-            os.system(SPEAK+' "'+text+'" >/dev/null 2>&1')
-            self.speaking = False
+        self.play([text])
+
+    # Speak texts one after the other, like a playlist of titles
+    def play(self, texts):
+        if not self.enabled: return
+        sentences = [sentence for text in texts for sentence in split_sentences(text)]
+        with self.condition:
+            if self.speaking:
+                self.kill()
+            self.sentences = sentences
+            self.position = 0
+            self.condition.notify()
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    # Restart from the sentence after (1) or before (-1) the one being spoken
+    def skip(self, step):
         if not self.enabled: return
-        self.thread = threading.Thread(target=run)
-        self.thread.start()
+        with self.condition:
+            if not self.sentences:
+                return
+            current = max(0, self.position - 1)
+            self.kill()
+            self.position = min(max(0, current + step), len(self.sentences))
+            self.condition.notify()
 
     def stop(self):
         if not self.enabled: return
-        if self.speaking:
-            os.system("killall espeak >/dev/null 2>&1")
-            self.speaking = False
+        with self.condition:
+            self.kill()
+            self.sentences = []
+            self.position = 0
+            self.condition.notify()
+
+    def kill(self):
+        if self.process:
+            self.process.kill()
+            self.process.wait()
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+            self.process = None
+        self.spoken_by = 0
+
+    # espeak with no text arguments (and without --stdin, which reads to the end first) speaks stdin by line
+    def write(self, sentence):
+        try:
+            if self.process is None or self.process.poll() is not None:
+                self.process = subprocess.Popen([SPEAK, "-s", str(TTS_RATE)], stdin=subprocess.PIPE,
+                                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                                encoding="utf-8", errors="replace")
+            self.process.stdin.write(sentence + "\n")
+            self.process.stdin.flush()
+        except OSError:
+            self.process = None
+
+    def run(self):
+        with self.condition:
+            while True:
+                if self.position >= len(self.sentences):
+                    self.condition.wait()
+                    continue
+                delay = self.spoken_by - TTS_LEAD - time.time()
+                if delay > 0:
+                    self.condition.wait(delay)
+                    continue
+                sentence = self.sentences[self.position]
+                self.position += 1
+                self.write(sentence)
+                self.spoken_by = max(self.spoken_by, time.time()) + speaking_time(sentence)
 
 
-logging.basicConfig(
-    filename=logfile,  # Log file name
-    level=logging.INFO,      # Log level
-    format='%(asctime)s - %(levelname)s - %(message)s'  # Log message format
-)
 
 
 def parse_arguments():
@@ -70,16 +232,79 @@ def parse_arguments():
                         default=feedfile)
     parser.add_argument('-F', '--fetch', action='store_true',
                         help='Fetch all feeds, on load')
+    parser.add_argument('--daemon', action='store_true',
+                        help='Run in background, fetching feeds and serving the interface over a Unix socket')
+    parser.add_argument('--local', action='store_true',
+                        help="Use the database directly, even if a daemon is running")
+    parser.add_argument('--import-opml', metavar='OPML',
+                        help='Import feeds from an OPML file into the feeds file and exit')
+    parser.add_argument('--export-opml', metavar='OPML',
+                        help='Export feeds to an OPML file and exit')
+    parser.add_argument('--export-items', metavar='NDJSON',
+                        help="Export feed items as NDJSON ('-' for stdout) and exit")
+    parser.add_argument('--import-items', metavar='NDJSON',
+                        help="Import feed items from NDJSON ('-' for stdin) and exit")
+    parser.add_argument('--export-archive', metavar='TARGET',
+                        help='Export feed items to an mbox file, a Maildir or an HTML file and exit. '
+                             'Items already in the archive are skipped')
+    parser.add_argument('--archive-format', choices=sorted(ARCHIVE_FORMATS),
+                        help='Format of --export-archive, by default from the target name')
+    parser.add_argument('--search', help='Export only items with this text in title, summary or content')
+    parser.add_argument('--feed', help='Export only items of this feed (name or URL)')
+    parser.add_argument('--category', help='Export only items of this category')
+    parser.add_argument('--since', type=parse_date, metavar='YYYY-MM-DD',
+                        help='Export only items updated since this date')
+    parser.add_argument('--until', type=parse_date, metavar='YYYY-MM-DD',
+                        help='Export only items updated before this date')
+    parser.add_argument('--unread', dest='read', action='store_const', const=0,
+                        help='Export only unread items')
+    parser.add_argument('--read', dest='read', action='store_const', const=1,
+                        help='Export only read items')
+    parser.add_argument('--since-id', type=int, metavar='ID',
+                        help='Export only items after this id, the last id of a previous export')
+    parser.add_argument('--sync-export', metavar='FILE',
+                        help="Write the read state changes since the last export to FILE ('-' for stdout) "
+                             "and exit")
+    parser.add_argument('--sync-import', metavar='FILE',
+                        help="Apply read state changes written by --sync-export ('-' for stdin) and exit")
+    parser.add_argument('--compare-parsers', nargs='*', metavar='FILE',
+                        help='Parse saved feeds, or all feeds if none given, with both the fast parser '
+                             'and feedparser, show the differences and exit')
+    parser.add_argument('--save-samples', metavar='DIR',
+                        help='With --compare-parsers, also save the feeds it parses to DIR, like the samples '
+                             'directory of the parser tests')
     return parser.parse_args()
 
 
-def log_event(message):
+def log_event(message, level=logging.INFO):
     """Log an event with the specified message."""
-    logging.info(message)  # Log the message as an info level event
+    logging.log(level, message)
+
+
+# Log through a queue, the file is written and rotated by a listener thread
+def setup_logging(to_file=True):
+    root = logging.getLogger()
+    if not to_file:
+        # Nothing is written to the terminal either, it belongs to curses
+        root.addHandler(logging.NullHandler())
+        return
+    handler = RotatingFileHandler(logfile, maxBytes=log_size * 1024 * 1024, backupCount=log_backups,
+                                  encoding="utf-8")
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    log_queue = queue.SimpleQueue()
+    root.setLevel(logging.INFO)
+    root.addHandler(QueueHandler(log_queue))
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+    atexit.register(listener.stop)  # Writes what is still queued
 
 
 def load_config():
     global media, xterm, editor,reqtimeout, media, browser, xterm, editor, reqtimeout
+    global connect_timeout, max_failures, failure_cooldown, refresh_deadline
+    global cache_dir, cache_size, prefetch_workers, shared_cache, shared_cache_ttl, daemon_interval
+    global fast_parser, parse_workers, parse_chunk, log_size, log_backups, rules_file, rewrite_redirects
+    global download_dir, download_workers, download_rate
     config_file = cfgfile  # Assuming cfgfile is the path to your config file
     if os.path.exists(config_file):
         config = configparser.ConfigParser()
@@ -90,6 +315,26 @@ def load_config():
             xterm = config['Settings'].get('xterm', xterm)
             editor = config['Settings'].get('editor', editor)
             reqtimeout = int(config['Settings'].get('reqtimeout', reqtimeout))
+            connect_timeout = int(config['Settings'].get('connect_timeout', connect_timeout))
+            max_failures = int(config['Settings'].get('max_failures', max_failures))
+            failure_cooldown = int(config['Settings'].get('failure_cooldown', failure_cooldown))
+            refresh_deadline = int(config['Settings'].get('refresh_deadline', refresh_deadline))
+            cache_dir = os.path.expanduser(config['Settings'].get('cache_dir', cache_dir))
+            cache_size = int(config['Settings'].get('cache_size', cache_size))
+            prefetch_workers = int(config['Settings'].get('prefetch_workers', prefetch_workers))
+            shared_cache = os.path.expanduser(config['Settings'].get('shared_cache', shared_cache))
+            shared_cache_ttl = int(config['Settings'].get('shared_cache_ttl', shared_cache_ttl))
+            daemon_interval = int(config['Settings'].get('daemon_interval', daemon_interval))
+            fast_parser = config['Settings'].getboolean('fast_parser', fast_parser)
+            parse_workers = int(config['Settings'].get('parse_workers', parse_workers))
+            parse_chunk = max(1, int(config['Settings'].get('parse_chunk', parse_chunk)))
+            log_size = int(config['Settings'].get('log_size', log_size))
+            log_backups = int(config['Settings'].get('log_backups', log_backups))
+            rules_file = os.path.expanduser(config['Settings'].get('rules_file', rules_file))
+            rewrite_redirects = config['Settings'].getboolean('rewrite_redirects', rewrite_redirects)
+            download_dir = os.path.expanduser(config['Settings'].get('download_dir', download_dir))
+            download_workers = max(1, int(config['Settings'].get('download_workers', download_workers)))
+            download_rate = int(config['Settings'].get('download_rate', download_rate))
     else:
         if not editor: editor = "nano"
         if not browser: browser = "firefox"
@@ -101,7 +346,7 @@ def check_feed_file():
     if not os.path.exists(feedfile):
         with open(feedfile, mode='w', newline='') as file:
             writer = csv.writer(file)
-            writer.writerow(["Name", "URL", "Category", "Tags"])  # Write header
+            writer.writerow(["Name", "URL", "Category", "Tags", "Fulltext"])  # Write header
             writer.writerow(["CP737 Blog", "https://cp737.net/blog.rss", "xqtr", ""])  # Add a default feed
 
 
@@ -114,6 +359,183 @@ def is_program_installed(program_name):
         return False
 
 
+# Commands of the daemon's socket API, name -> (function, notifies subscribers)
+DAEMON_API = {}
+
+
+# Connection to a running feedln daemon, used in place of the database connection
+class DaemonClient:
+    """
+    Requests and responses are single lines of JSON over the daemon's Unix
+    socket: {"cmd": name, "args": [...], "kwargs": {...}} -> {"result": ...}
+    or {"error": ...}
+    """
+    def __init__(self, path):
+        self.path = path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.file = self.sock.makefile("rwb")
+        self.lock = threading.Lock()
+        self.version = 0  # Updates announced by the daemon
+
+    def call(self, cmd, *args, **kwargs):
+        request = {"cmd": cmd, "args": args, "kwargs": kwargs}
+        line = json.dumps(request, ensure_ascii=False).encode("utf-8")
+        with self.lock:
+            self.file.write(line + b"\n")
+            self.file.flush()
+            response = self.file.readline()
+        if not response:
+            raise ConnectionError("Connection to daemon closed")
+        response = json.loads(response)
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response["result"]
+
+    # Count the update events of the daemon, on a second connection
+    def subscribe(self):
+        def run():
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(self.path)
+                sock.sendall(b'{"cmd": "subscribe"}\n')
+                for line in sock.makefile("rb"):
+                    if json.loads(line).get("event") == "updated":
+                        self.version += 1
+        threading.Thread(target=run, daemon=True).start()
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+# Make a function callable through the daemon, when conn is a DaemonClient
+def daemon_api(name, notify=False, record=None):
+    """
+    Parameters:
+        name: Command of the socket API
+        notify: The command changes data, subscribers are told about it
+        record: Record class of the rows in the result, rebuilt on the client side
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(conn, *args, **kwargs):
+            if isinstance(conn, DaemonClient):
+                result = conn.call(name, *args, **kwargs)
+                if record:
+                    return [record(*row) for row in result]
+                return result
+            return function(conn, *args, **kwargs)
+        DAEMON_API[name] = (wrapper, notify)
+        return wrapper
+    return decorator
+
+
+# Check for a running daemon on the socket
+def connect_daemon(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        return DaemonClient(path)
+    except OSError:
+        return None
+
+
+# A connection for a worker thread, to the daemon or the database
+def open_worker_connection():
+    if daemon_socket:
+        return DaemonClient(daemon_socket)
+    # sqlite connections can't be shared between threads
+    return sqlite3.connect(database)
+
+
+def is_attached(conn):
+    return isinstance(conn, DaemonClient)
+
+
+# Refuse a maintenance action, that needs direct access to the database
+def local_only(stdscr, conn):
+    if is_attached(conn):
+        footerpop(stdscr, "Not available while attached to the daemon", 2, 1)
+        return True
+    return False
+
+
+# Results of the read queries of the screens, keyed by query and parameters
+class QueryCache:
+    """
+    Entries are valid for one data version: a counter bumped by ingest,
+    mark read and cleanup (data_changed), plus PRAGMA data_version, which
+    changes when another connection or process commits.
+    """
+    def __init__(self, size, max_rows):
+        self.size = size
+        self.max_rows = max_rows
+        self.entries = OrderedDict()
+        self.entries_version = None
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def bump(self):
+        with self.lock:
+            self.version += 1
+
+    def current_version(self, conn):
+        return self.version, conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def get(self, key, version):
+        with self.lock:
+            if version != self.entries_version:
+                self.entries.clear()
+                self.entries_version = version
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True, self.entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, version, result):
+        if isinstance(result, list) and len(result) > self.max_rows:
+            return  # Too large to keep around
+        with self.lock:
+            if version != self.entries_version:
+                return
+            self.entries[key] = result
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+query_cache = QueryCache(QUERY_CACHE_SIZE, QUERY_CACHE_MAX_ROWS)
+
+
+# Tell the query cache that the data changed
+def data_changed():
+    query_cache.bump()
+
+
+# Serve a read query from the query cache
+def cached_query(function):
+    @functools.wraps(function)
+    def wrapper(conn, *args, **kwargs):
+        key = (function.__name__, id(conn), args, tuple(sorted(kwargs.items())))
+        version = query_cache.current_version(conn)
+        found, result = query_cache.get(key, version)
+        if not found:
+            result = function(conn, *args, **kwargs)
+            query_cache.put(key, version, result)
+        return result
+    return wrapper
+
+
+# Add a column to an existing table, if it doesn't have it yet
+def add_column(cursor, table, column, definition):
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
 # Database setup
 def setup_database():
     global database
@@ -158,6 +580,189 @@ def setup_database():
             FOREIGN KEY (feed_id) REFERENCES feeds (id)
         )
     """)
+    # Columns added after the first release
+    add_column(cursor, "feeds", "fulltext", "INTEGER NOT NULL DEFAULT 0")
+    add_column(cursor, "feed_items", "full_content", "TEXT")
+    add_column(cursor, "feed_items", "starred", "INTEGER NOT NULL DEFAULT 0")
+    # Indexes of the smart views
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_items_updated ON feed_items (last_updated)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_items_unread ON feed_items (last_updated) WHERE is_read = 0")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_items_starred ON feed_items (last_updated) WHERE starred = 1")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS read_journal (
+            id INTEGER PRIMARY KEY,
+            created INTEGER NOT NULL DEFAULT 0,
+            label TEXT,
+            mark INTEGER NOT NULL
+        )
+    """)
+    # Large changes are journaled by their condition, and runs of the items it matched
+    add_column(cursor, "read_journal", "condition", "TEXT")
+    add_column(cursor, "read_journal", "params", "TEXT")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS read_journal_items (
+            journal_id INTEGER,
+            item_id INTEGER,
+            PRIMARY KEY (journal_id, item_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS read_journal_ranges (
+            journal_id INTEGER,
+            first_id INTEGER,
+            last_id INTEGER,
+            PRIMARY KEY (journal_id, first_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS feed_status (
+            feed_id INTEGER PRIMARY KEY,
+            failures INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            last_failure INTEGER NOT NULL DEFAULT 0,
+            retry_after INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS resource_cache (
+            url TEXT PRIMARY KEY,
+            hash TEXT NOT NULL,
+            ext TEXT NOT NULL DEFAULT '',
+            size INTEGER NOT NULL DEFAULT 0,
+            content_type TEXT,
+            fetched INTEGER NOT NULL DEFAULT 0,
+            last_used INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sync_state (
+            path TEXT PRIMARY KEY,
+            mtime REAL NOT NULL DEFAULT 0,
+            hash TEXT
+        )
+    """)
+    # Append-only journal of read state changes, exchanged by --sync-export
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'state_journal'")
+    new_journal = cursor.fetchone() is None
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS state_journal (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_id INTEGER NOT NULL,
+            is_read INTEGER NOT NULL,
+            changed INTEGER NOT NULL,
+            remote INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_state_journal_item ON state_journal (item_id)")
+    if new_journal:
+        # Items read before the journal existed lose to any dated change
+        cursor.execute("INSERT INTO state_journal (item_id, is_read, changed) "
+                       "SELECT id, 1, 0 FROM feed_items WHERE is_read = 1")
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS journal_read_state AFTER UPDATE OF is_read ON feed_items
+        WHEN OLD.is_read IS NOT NEW.is_read
+        BEGIN
+            INSERT INTO state_journal (item_id, is_read, changed)
+            VALUES (NEW.id, NEW.is_read, CAST(strftime('%s', 'now') AS INTEGER));
+        END
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sync_marks (
+            name TEXT PRIMARY KEY,
+            seq INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sync_pending (
+            feed_url TEXT,
+            title TEXT,
+            is_read INTEGER NOT NULL,
+            changed INTEGER NOT NULL,
+            PRIMARY KEY (feed_url, title)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS enclosures (
+            id INTEGER PRIMARY KEY,
+            item_id INTEGER NOT NULL,
+            url TEXT NOT NULL,
+            length INTEGER NOT NULL DEFAULT 0,
+            type TEXT,
+            UNIQUE (item_id, url)
+        )
+    """)
+    # Download queue of the download manager, kept across restarts
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS downloads (
+            id INTEGER PRIMARY KEY,
+            url TEXT UNIQUE,
+            item_id INTEGER,
+            path TEXT NOT NULL,
+            size INTEGER NOT NULL DEFAULT 0,
+            done INTEGER NOT NULL DEFAULT 0,
+            state TEXT NOT NULL DEFAULT 'queued',
+            error TEXT,
+            added INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    # Permanent redirects seen by the fetcher, applied to the urls of the feeds file
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'feed_redirects'")
+    if cursor.fetchone() is None:
+        # Compare the feeds file again, to merge the feeds that only differ by their url form
+        cursor.execute("DELETE FROM sync_state")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS feed_redirects (
+            old_url TEXT PRIMARY KEY,
+            new_url TEXT NOT NULL,
+            seen INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    # Tags of the feeds file, and of items tagged by the ingest rules
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'tags'")
+    new_tags = cursor.fetchone() is None
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS tags (
+            id INTEGER PRIMARY KEY,
+            name TEXT UNIQUE
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS feed_tags (
+            tag_id INTEGER,
+            feed_id INTEGER,
+            PRIMARY KEY (tag_id, feed_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_feed_tags_feed ON feed_tags (feed_id)")
+    cursor.execute("PRAGMA table_info(item_tags)")
+    if "tag" in [row[1] for row in cursor.fetchall()]:
+        # Item tags were stored by name before the tags table
+        cursor.execute("ALTER TABLE item_tags RENAME TO item_tags_by_name")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS item_tags (
+            tag_id INTEGER,
+            item_id INTEGER,
+            PRIMARY KEY (tag_id, item_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_item_tags_item ON item_tags (item_id)")
+    if new_tags:
+        cursor.execute("SELECT id, tags FROM feeds WHERE tags != ''")
+        for feed_id, tags in cursor.fetchall():
+            link_feed_tags(cursor, feed_id, split_tags(tags))
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'item_tags_by_name'")
+    if cursor.fetchone():
+        cursor.execute("INSERT OR IGNORE INTO tags (name) SELECT DISTINCT tag FROM item_tags_by_name")
+        cursor.execute("INSERT OR IGNORE INTO item_tags (tag_id, item_id) "
+                       "SELECT t.id, i.item_id FROM item_tags_by_name i JOIN tags t ON t.name = i.tag")
+        cursor.execute("DROP TABLE item_tags_by_name")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS saved_search_items (
+            search TEXT,
+            item_id INTEGER,
+            PRIMARY KEY (search, item_id)
+        ) WITHOUT ROWID
+    """)
     conn.commit()
     return conn
 
@@ -189,6 +794,20 @@ def confirm(stdscr,text):
         return False
 
 
+# Read a line of text on the footer
+def prompt(stdscr, text):
+    footer(stdscr, text, 3)
+    stdscr.refresh()
+    curses.echo()
+    curses.curs_set(1)
+    stdscr.attron(curses.color_pair(4) | curses.A_BOLD)
+    answer = stdscr.getstr(curses.LINES-1, len(text)).decode('utf-8').strip()
+    stdscr.attroff(curses.color_pair(4) | curses.A_BOLD)
+    curses.noecho()
+    curses.curs_set(0)
+    return answer
+
+
 def clean_database(stdscr):
     global database,feedfile
     if confirm(stdscr,"Clean old feed items? Write 'yes' to confirm:"):
@@ -199,7 +818,11 @@ def clean_database(stdscr):
             feeds = cursor.fetchall()
             for feed in feeds:
                 cursor.execute(f"DELETE FROM feed_items WHERE feed_id = {feed[0]} ORDER BY last_updated DESC LIMIT 10")
+            cursor.execute("DELETE FROM item_tags WHERE item_id NOT IN (SELECT id FROM feed_items)")
+            cursor.execute("DELETE FROM saved_search_items WHERE item_id NOT IN (SELECT id FROM feed_items)")
+            cursor.execute("DELETE FROM enclosures WHERE item_id NOT IN (SELECT id FROM feed_items)")
             conn.commit()
+            data_changed()
         except Exception as e:
                 footer(stdscr,f"Error: {e}",1)
                 stdscr.refresh()
@@ -219,9 +842,24 @@ def delete_database_file(stdscr):
             cursor.execute("DROP TABLE IF EXISTS feed_categories")
             cursor.execute("DROP TABLE IF EXISTS categories")
             cursor.execute("DROP TABLE IF EXISTS feeds")
+            cursor.execute("DROP TABLE IF EXISTS sync_state")
+            cursor.execute("DROP TABLE IF EXISTS feed_status")
+            cursor.execute("DROP TABLE IF EXISTS read_journal_items")
+            cursor.execute("DROP TABLE IF EXISTS read_journal_ranges")
+            cursor.execute("DROP TABLE IF EXISTS read_journal")
+            cursor.execute("DROP TABLE IF EXISTS state_journal")
+            cursor.execute("DROP TABLE IF EXISTS sync_marks")
+            cursor.execute("DROP TABLE IF EXISTS sync_pending")
+            cursor.execute("DROP TABLE IF EXISTS item_tags")
+            cursor.execute("DROP TABLE IF EXISTS feed_tags")
+            cursor.execute("DROP TABLE IF EXISTS tags")
+            cursor.execute("DROP TABLE IF EXISTS feed_redirects")
+            cursor.execute("DROP TABLE IF EXISTS enclosures")
+            cursor.execute("DROP TABLE IF EXISTS saved_search_items")
             # Recreate tables
             conn = setup_database()  # Recreate the database and tables
             load_feeds_to_db(feedfile, conn)
+            data_changed()
             footer(stdscr,f"Database has been reset and tables recreated.")
             stdscr.refresh()
             time.sleep(1)
@@ -235,133 +873,544 @@ def delete_database_file(stdscr):
 
 
 # Export all feeds to OPML file
-def export_opml(stdscr, conn, filename="feedln.opml"):
+def write_opml(conn, filename):
+    """
+    Stream feeds from database to an OPML file, one category at a time
+    Parameters:
+        conn: Database connection
+        filename: Output OPML filename
+    Returns:
+        Number of feed outlines written
+    """
+    cursor = conn.cursor()
+    # Feeds ordered by category, so each category is written in one pass
+    cursor.execute("""
+        SELECT COALESCE(c.name, 'Uncategorized') AS category, f.name, f.url,
+               (SELECT GROUP_CONCAT(t.name, ',') FROM feed_tags ft JOIN tags t ON ft.tag_id = t.id
+                WHERE ft.feed_id = f.id)
+        FROM feeds f
+        LEFT JOIN feed_categories fc ON f.id = fc.feed_id
+        LEFT JOIN categories c ON fc.category_id = c.id
+        ORDER BY category ASC, f.name ASC
+    """)
+    count = 0
+    with ET.xmlfile(filename, encoding="utf-8") as xf:
+        xf.write_declaration()
+        with xf.element("opml", version="2.0"):
+            head = ET.Element("head")
+            ET.SubElement(head, "title").text = f"{program} Export"
+            ET.SubElement(head, "dateCreated").text = time.strftime("%a, %d %b %Y %H:%M:%S %z")
+            xf.write(head)
+            with xf.element("body"):
+                for category, feeds in groupby(cursor, key=itemgetter(0)):
+                    with xf.element("outline", text=category, title=category):
+                        for _, name, url, tags in feeds:
+                            attrib = {"type": "rss", "text": name or url, "title": name or url, "xmlUrl": url}
+                            if tags:
+                                attrib["category"] = tags
+                            xf.write(ET.Element("outline", attrib))
+                            count += 1
+    return count
+
+
+def export_opml(stdscr, conn, filename=None):
     """
     Export feeds from database to OPML format
     Parameters:
         stdscr: Curses window object
         conn: Database connection
-        filename: Output OPML filename (default: feedln.opml)
+        filename: Output OPML filename (default: feedln-<timestamp>.opml)
     """
     try:
-        cursor = conn.cursor()
-        # Get all feeds with their categories
-        cursor.execute("""
-            SELECT f.name, f.url, GROUP_CONCAT(c.name) as categories, f.tags
-            FROM feeds f
-            LEFT JOIN feed_categories fc ON f.id = fc.feed_id
-            LEFT JOIN categories c ON fc.category_id = c.id
-            GROUP BY f.id
-        """)
-        feeds = cursor.fetchall()
-
-        # Create OPML structure
-        opml = '<?xml version="1.0" encoding="UTF-8"?>\n'
-        opml += '<opml version="2.0">\n'
-        opml += '  <head>\n'
-        opml += f'    <title>Feedln Export</title>\n'
-        opml += f'    <dateCreated>{time.strftime("%a, %d %b %Y %H:%M:%S %z")}</dateCreated>\n'
-        opml += '  </head>\n'
-        opml += '  <body>\n'
-
-        # Track unique categories
-        categories = {}
-
-        # First pass: organize feeds by category
-        for feed in feeds:
-            feed_categories = feed[2].split(',') if feed[2] else ['Uncategorized']
-            for category in feed_categories:
-                category = category.strip()
-                if category not in categories:
-                    categories[category] = []
-                categories[category].append(feed)
-
-        # Second pass: write feeds organized by category
-        for category in sorted(categories.keys()):
-            category = category.replace("&","&amp;")
-            opml += f'    <outline text="{category}" title="{category}">\n'
-            for feed in categories[category]:
-                title = feed[0].replace('"', '&quot;')
-                url = feed[1].replace('"', '&quot;')
-                tags = feed[3] if feed[3] else ''
-                title = title.replace("&","&amp;")
-                opml += f'      <outline type="rss" text="{title}" title="{title}" xmlUrl="{url}"'
-                if tags:
-                    opml += f' category="{tags}"'
-                opml += '/>\n'
-            opml += '    </outline>\n'
-
-        opml += '  </body>\n'
-        opml += '</opml>'
-
-        # Write to file
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"feedln-{timestamp}.opml"
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(opml)
-
-        footerpop(stdscr, f"Feeds exported to {filename}")
+        if not filename:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"feedln-{timestamp}.opml"
+        count = write_opml(conn, filename)
+        footerpop(stdscr, f"{count} feeds exported to {filename}")
         log_event(f"Feeds exported to OPML file: {filename}")
 
     except Exception as e:
         footerpop(stdscr, f"Error exporting OPML: {str(e)}", 1)
-        log_event(f"Error exporting OPML: {str(e)}")
+        log_event(f"Error exporting OPML: {str(e)}", logging.ERROR)
 
 
-# Load feeds from CSV into database
-def load_feeds_to_db(csv_file, conn):
-    cursor = conn.cursor()
-    with open(csv_file, mode="r") as file:
+# Import feeds from OPML file
+def import_opml(opml_file, conn, csv_file):
+    """
+    Stream an OPML file and merge its feeds into the feeds file and database.
+    Nested outlines without xmlUrl become the category path (Parent/Child),
+    the category attribute of a feed goes to Tags. Feeds already in the
+    feeds file are skipped.
+    Parameters:
+        opml_file: Input OPML filename
+        conn: Database connection
+        csv_file: Path to the CSV file with feeds
+    Returns:
+        Tuple of (feeds added, duplicates skipped)
+    """
+    known = {feed_url_key(url) for url in read_feeds_csv(csv_file)}
+    new_feeds = {}
+    path = []
+    skipped = 0
+    context = ET.iterparse(opml_file, events=("start", "end"), tag="outline",
+                           recover=True, huge_tree=True)
+    for event, elem in context:
+        xml_url = (elem.get("xmlUrl") or "").strip()
+        if event == "start":
+            if not xml_url:
+                path.append((elem.get("text") or elem.get("title") or "").strip())
+            continue
+
+        if not xml_url:
+            path.pop()
+        elif feed_url_key(xml_url) in known:
+            skipped += 1
+        else:
+            category = "/".join(p for p in path if p) or "Uncategorized"
+            key = feed_url_key(xml_url)
+            if key in new_feeds:
+                # Same feed in several outlines, merge the categories
+                skipped += 1
+                if category not in new_feeds[key][2].split(";"):
+                    new_feeds[key][2] += f";{category}"
+            else:
+                title = (elem.get("title") or elem.get("text") or xml_url).strip()
+                new_feeds[key] = [title, clean_feed_url(xml_url), category, elem.get("category") or ""]
+
+        # Free the parsed outlines, to keep memory constant
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+    del context
+
+    if new_feeds:
+        append_feeds_csv(csv_file, new_feeds.values())
+        sync_feeds(conn, csv_file)
+    log_event(f"Imported OPML file {opml_file}: {len(new_feeds)} added, {skipped} skipped")
+    return len(new_feeds), skipped
+
+
+def import_opml_prompt(stdscr, conn):
+    global feedfile
+    filename = prompt(stdscr, "OPML file to import: ")
+    if not filename:
+        footerpop(stdscr, "Abort!", color=1)
+        return False
+    try:
+        footer(stdscr, f"Importing {filename}...")
+        stdscr.refresh()
+        added, skipped = import_opml(os.path.expanduser(filename), conn, feedfile)
+        footerpop(stdscr, f"Imported {added} feeds, {skipped} duplicates skipped")
+        return added > 0
+    except Exception as e:
+        footerpop(stdscr, f"Error importing OPML: {str(e)}", 1)
+        log_event(f"Error importing OPML: {str(e)}", logging.ERROR)
+        return False
+
+
+# Read the feeds file into a dictionary, keyed by feed URL
+def read_feeds_csv(csv_file):
+    """
+    Read feeds from the CSV file
+    Parameters:
+        csv_file: Path to the CSV file with feeds
+    Returns:
+        Dictionary of url -> (name, tags, set of category names, fulltext flag),
+        urls without tracking parameters and one url per feed_url_key()
+    """
+    feeds = {}
+    urls = {}  # feed_url_key -> url in feeds
+    with open(csv_file, mode="r", newline="") as file:
         reader = csv.DictReader(file)
         for row in reader:
             # Skip empty lines or lines starting with '#'
-            if not row:
+            name = (row.get("Name") or "").strip()
+            url = (row.get("URL") or "").strip()
+            if not url or name.startswith('#'):
                 continue
+            url = clean_feed_url(url)
+            key = feed_url_key(url)
+            # Handle multiple categories, split by ';'
+            categories = {c.strip() for c in (row.get("Category") or "").split(";") if c.strip()}
+            if key in urls:
+                # Duplicate feed, keep the first name and merge the categories
+                known = urls[key]
+                feeds[known][2].update(categories)
+                if preferred_url(known, url) != known:
+                    feeds[url] = feeds.pop(known)
+                    urls[key] = url
+            else:
+                fulltext = 1 if (row.get("Fulltext") or "").strip().lower() in ("1", "y", "yes", "true") else 0
+                feeds[url] = (name, row.get("Tags") or "", categories, fulltext)
+                urls[key] = url
+    return feeds
+
+
+def file_hash(filename):
+    digest = hashlib.sha1()
+    with open(filename, mode="rb") as file:
+        for chunk in iter(lambda: file.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Append feeds to the end of the CSV file
+def append_feeds_csv(csv_file, rows):
+    with open(csv_file, mode='rb+') as file:
+        # Make sure the first new row doesn't end up on the last line
+        file.seek(0, os.SEEK_END)
+        if file.tell() > 0:
+            file.seek(-1, os.SEEK_END)
+            if file.read(1) not in (b"\n", b"\r"):
+                file.write(b"\n")
+    with open(csv_file, mode='a', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerows(rows)
+
+
+# Delete feeds and everything that belongs to them
+def delete_feeds(cursor, feed_ids):
+    for feed_id in feed_ids:
+        cursor.execute("DELETE FROM item_tags WHERE item_id IN (SELECT id FROM feed_items WHERE feed_id = ?)",
+                       (feed_id,))
+        cursor.execute("DELETE FROM saved_search_items WHERE item_id IN "
+                       "(SELECT id FROM feed_items WHERE feed_id = ?)", (feed_id,))
+        cursor.execute("DELETE FROM enclosures WHERE item_id IN (SELECT id FROM feed_items WHERE feed_id = ?)",
+                       (feed_id,))
+        cursor.execute("DELETE FROM feed_items WHERE feed_id = ?", (feed_id,))
+        cursor.execute("DELETE FROM feed_tags WHERE feed_id = ?", (feed_id,))
+        cursor.execute("DELETE FROM feed_categories WHERE feed_id = ?", (feed_id,))
+        cursor.execute("DELETE FROM feed_status WHERE feed_id = ?", (feed_id,))
+        cursor.execute("DELETE FROM feeds WHERE id = ?", (feed_id,))
+
+
+# Feed url without tracking parameters and fragment, with a lowercase host
+def clean_feed_url(url):
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:  # Like a broken IPv6 address, it is left as it is
+        return url.strip()
+    query = "&".join(param for param in parts.query.split("&")
+                     if param and not TRACKING_PARAMS.fullmatch(param.partition("=")[0]))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, query, ""))
 
-            if row['Name'].startswith('#'):
-                continue
+
+# Identity of a feed url: the same for http and https, with or without www. and a trailing slash
+def feed_url_key(url):
+    url = clean_feed_url(url)
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return url.lower()
+    host = parts.hostname or ""
+    try:
+        port = parts.port
+    except ValueError:
+        # A malformed port, the host is compared with it as written
+        host, port = parts.netloc.rpartition("@")[2], None
+    if host.startswith("www."):
+        host = host[4:]
+    if port and (parts.scheme, port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{port}"
+    key = host + parts.path.rstrip("/")
+    return f"{key}?{parts.query}" if parts.query else key
+
+
+# Of two urls of the same feed, the https one, else the first
+def preferred_url(url, other):
+    if other.startswith("https:") and not url.startswith("https:"):
+        return other
+    return url
+
+
+# Where permanent redirects recorded by the fetcher lead a url
+def resolve_redirects(redirects, url):
+    seen = {url}
+    while url in redirects and redirects[url] not in seen:
+        url = redirects[url]
+        seen.add(url)
+    return url
+
+
+# Merge a duplicate feed into another, with its items, categories and tags
+def merge_feeds(cursor, keep_id, duplicate_id):
+    # Items in both feeds keep the read and starred marks of either
+    cursor.execute("""
+        UPDATE feed_items AS kept SET is_read = MAX(kept.is_read, dup.is_read),
+                                      starred = MAX(kept.starred, dup.starred)
+        FROM feed_items AS dup
+        WHERE dup.feed_id = ? AND kept.feed_id = ? AND kept.title = dup.title
+          AND (kept.is_read < dup.is_read OR kept.starred < dup.starred)
+    """, (duplicate_id, keep_id))
+    cursor.execute("UPDATE OR IGNORE feed_items SET feed_id = ? WHERE feed_id = ?", (keep_id, duplicate_id))
+    cursor.execute("INSERT OR IGNORE INTO feed_categories (feed_id, category_id) "
+                   "SELECT ?, category_id FROM feed_categories WHERE feed_id = ?", (keep_id, duplicate_id))
+    cursor.execute("INSERT OR IGNORE INTO feed_tags (tag_id, feed_id) "
+                   "SELECT tag_id, ? FROM feed_tags WHERE feed_id = ?", (keep_id, duplicate_id))
+    # What is left are the items the kept feed already had
+    delete_feeds(cursor, [duplicate_id])
+
+
+# Write the new urls of redirected feeds to the feeds file, keeping everything else as it is
+def rewrite_feeds_csv(csv_file, moved):
+    with open(csv_file, mode="r", newline="") as file:
+        rows = list(csv.reader(file))
+    if not rows or "URL" not in rows[0]:
+        return
+    column = rows[0].index("URL")
+    for row in rows[1:]:
+        if len(row) > column and clean_feed_url(row[column]) in moved:
+            row[column] = moved[clean_feed_url(row[column])]
+    directory = os.path.dirname(os.path.abspath(csv_file))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".csv")
+    with os.fdopen(fd, "w", newline="") as file:
+        csv.writer(file).writerows(rows)
+    os.replace(tmp, csv_file)
+
+
+# Tag names of the Tags column, separated by ';' or ',' like OPML categories
+def split_tags(text):
+    names = []
+    for name in re.split(r"[;,]", text or ""):
+        name = name.strip().strip("/").strip()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+# Link a feed to exactly these tags
+def link_feed_tags(cursor, feed_id, names):
+    cursor.execute("DELETE FROM feed_tags WHERE feed_id = ?", (feed_id,))
+    for name in names:
+        cursor.execute("INSERT OR IGNORE INTO tags (name) VALUES (?)", (name,))
+        cursor.execute("INSERT OR IGNORE INTO feed_tags (tag_id, feed_id) SELECT id, ? FROM tags WHERE name = ?",
+                       (feed_id, name))
+
+
+# Synchronize feeds from CSV into database
+def load_feeds_to_db(csv_file, conn, force=False):
+    """
+    Synchronize the database with the feeds file.
+    The mtime and hash of the file are recorded, so an unchanged file is
+    skipped. Otherwise the differences (new, changed and removed feeds and
+    category links) are applied in one transaction. Feeds are matched by
+    feed_url_key(), after the permanent redirects seen by the fetcher, and
+    duplicates are merged.
+    Parameters:
+        csv_file: Path to the CSV file with feeds
+        conn: Database connection
+        force: Compare with the database, even if the file is unchanged
+    Returns:
+        True if the database was changed
+    """
+    path = os.path.abspath(csv_file)
+    mtime = os.path.getmtime(csv_file)
+    cursor = conn.cursor()
+    cursor.execute("SELECT mtime, hash FROM sync_state WHERE path = ?", (path,))
+    state = cursor.fetchone()
+    if state and not force and state[0] == mtime:
+        return False
+    digest = file_hash(csv_file)
+    if state and not force and state[1] == digest:
+        # Touched but not changed, only remember the new mtime
+        cursor.execute("UPDATE sync_state SET mtime = ? WHERE path = ?", (mtime, path))
+        conn.commit()
+        return False
+
+    csv_feeds = read_feeds_csv(csv_file)
+    cursor.execute("SELECT old_url, new_url FROM feed_redirects")
+    redirects = dict(cursor.fetchall())
+    moved = {url: resolve_redirects(redirects, url) for url in csv_feeds if url in redirects}
+    moved = {old: new for old, new in moved.items() if new != old}
+    if moved and rewrite_redirects:
+        rewrite_feeds_csv(csv_file, moved)
+        mtime = os.path.getmtime(csv_file)
+        digest = file_hash(csv_file)
+        log_event(f"Feeds file {csv_file}: {len(moved)} redirected feeds rewritten")
+
+    added = updated = removed = relinked = merged = 0
+    with conn:
+        # Feeds that only differ by the form of their url are one feed
+        cursor.execute("SELECT url, id, name, tags, fulltext FROM feeds ORDER BY id")
+        db_feeds = {}
+        for row in cursor.fetchall():
+            key = feed_url_key(row[0])
+            if key in db_feeds:
+                merge_feeds(cursor, db_feeds[key][1], row[1])
+                merged += 1
+                if preferred_url(db_feeds[key][0], row[0]) != db_feeds[key][0]:
+                    cursor.execute("UPDATE feeds SET url = ? WHERE id = ?", (row[0], db_feeds[key][1]))
+                    db_feeds[key] = (row[0],) + db_feeds[key][1:]
             else:
-                try:
-                    cursor.execute(
-                        """
-                        INSERT OR IGNORE INTO feeds (name, url, tags)
-                        VALUES (?, ?, ?)
-                        """,
-                        (row["Name"], row["URL"], row.get("Tags", ""))
-                    )
-                    feed_id = cursor.lastrowid  # Get the last inserted feed ID
-
-                    # Handle multiple categories, split by ';'
-                    category_field = row.get("Category")  # Get the Category field
-                    if category_field:  # Check if the field is not None or empty
-                        categories = category_field.split(";")  # Split categories by semicolon
-                        for category in categories:
-                            category = category.strip()  # Remove whitespace
-                            cursor.execute(
-                                """
-                                INSERT OR IGNORE INTO categories (name)
-                                VALUES (?)
-                                """,
-                                (category,)
-                            )
-                            cursor.execute(
-                                """
-                                INSERT OR IGNORE INTO feed_categories (feed_id, category_id)
-                                SELECT ?, id FROM categories WHERE name = ?
-                                """,
-                                (feed_id, category)
-                            )
-                except sqlite3.IntegrityError as e:
-                    print(f"Skipping duplicate feed: {row['URL']} - {e}")
-                    pass
-    conn.commit()
+                db_feeds[key] = row
+        cursor.execute("""
+            SELECT fc.feed_id, c.name
+            FROM feed_categories fc
+            JOIN categories c ON fc.category_id = c.id
+        """)
+        db_links = {}
+        for feed_id, category in cursor.fetchall():
+            db_links.setdefault(feed_id, set()).add(category)
+
+        csv_urls = {}
+        for url in csv_feeds:
+            key = feed_url_key(moved.get(url, url))
+            if key in csv_urls:
+                # Redirected to another feed of the file
+                csv_feeds[csv_urls[key]][2].update(csv_feeds[url][2])
+            else:
+                csv_urls[key] = url
+        # Removed feeds
+        removed_ids = [db_feeds[key][1] for key in db_feeds if key not in csv_urls]
+        delete_feeds(cursor, removed_ids)
+        removed = len(removed_ids)
+
+        for key, csv_url in csv_urls.items():
+            name, tags, categories, fulltext = csv_feeds[csv_url]
+            url = moved.get(csv_url, csv_url)
+            if key in db_feeds:
+                db_url, feed_id, db_name, db_tags, db_fulltext = db_feeds[key]
+                url = preferred_url(url, db_url)
+                if (db_url, db_name, db_tags or "", db_fulltext) != (url, name, tags, fulltext):
+                    cursor.execute("UPDATE feeds SET url = ?, name = ?, tags = ?, fulltext = ? WHERE id = ?",
+                                   (url, name, tags, fulltext, feed_id))
+                    if split_tags(db_tags) != split_tags(tags):
+                        link_feed_tags(cursor, feed_id, split_tags(tags))
+                    updated += 1
+                linked = db_links.get(feed_id, set())
+            else:
+                cursor.execute("INSERT INTO feeds (name, url, tags, fulltext) VALUES (?, ?, ?, ?)",
+                               (name, url, tags, fulltext))
+                feed_id = cursor.lastrowid
+                link_feed_tags(cursor, feed_id, split_tags(tags))
+                linked = set()
+                added += 1
+
+            if linked == categories:
+                continue
+            relinked += 1
+            for category in linked - categories:
+                cursor.execute("""
+                    DELETE FROM feed_categories
+                    WHERE feed_id = ? AND category_id = (SELECT id FROM categories WHERE name = ?)
+                """, (feed_id, category))
+            for category in categories - linked:
+                cursor.execute("INSERT OR IGNORE INTO categories (name) VALUES (?)", (category,))
+                cursor.execute("""
+                    INSERT OR IGNORE INTO feed_categories (feed_id, category_id)
+                    SELECT ?, id FROM categories WHERE name = ?
+                """, (feed_id, category))
+
+        # Categories and tags left without feeds
+        cursor.execute("DELETE FROM categories WHERE id NOT IN (SELECT category_id FROM feed_categories)")
+        cursor.execute("DELETE FROM tags WHERE id NOT IN (SELECT tag_id FROM feed_tags) "
+                       "AND id NOT IN (SELECT tag_id FROM item_tags)")
+        cursor.execute("INSERT OR REPLACE INTO sync_state (path, mtime, hash) VALUES (?, ?, ?)", (path, mtime, digest))
+
+    data_changed()
+    log_event(f"Feeds synced from {csv_file}: {added} added, {updated} updated, {removed} removed, "
+              f"{relinked} relinked, {merged} merged")
+    return bool(added or updated or removed or relinked or merged)
+
+
+# Synchronize the feeds file, through the daemon if attached
+@daemon_api("sync", notify=True)
+def sync_feeds(conn, csv_file, force=False):
+    return load_feeds_to_db(csv_file, conn, force)
+
+
+# Records of the list screens, holding only the columns the lists use
+class Record:
+    __slots__ = ()
+
+    # Row factory for a cursor, the query selects the slots in order
+    @classmethod
+    def from_row(cls, cursor, row):
+        return cls(*row)
+
+    def values(self):
+        return [getattr(self, name) for name in self.__slots__]
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class CategoryRecord(Record):
+    __slots__ = ("name", "id")
+
+    def __init__(self, name, id):
+        self.name = name
+        self.id = id
+
+
+class FeedRecord(Record):
+    __slots__ = ("id", "name", "url", "tags")
+
+    def __init__(self, id, name, url, tags):
+        self.id = id
+        self.name = name
+        self.url = url
+        self.tags = tags
+
+
+class ItemRecord(Record):
+    __slots__ = ("id", "title", "is_read", "last_updated", "link", "feed_name", "starred")
+
+    def __init__(self, id, title, is_read, last_updated, link, feed_name, starred):
+        self.id = id
+        self.title = title
+        self.is_read = is_read
+        self.last_updated = last_updated
+        self.link = link
+        self.feed_name = feed_name
+        self.starred = starred
+
+
+class TagRecord(Record):
+    __slots__ = ("id", "name", "feeds", "items", "unread")
+
+    def __init__(self, id, name, feeds, items, unread):
+        self.id = id
+        self.name = name
+        self.feeds = feeds
+        self.items = items
+        self.unread = unread
+
+
+class DownloadRecord(Record):
+    __slots__ = ("id", "url", "path", "size", "done", "state", "error", "speed")
+
+    def __init__(self, id, url, path, size, done, state, error, speed=0):
+        self.id = id
+        self.url = url
+        self.path = path
+        self.size = size
+        self.done = done
+        self.state = state
+        self.error = error
+        self.speed = speed
+
+
+FEED_COLUMNS = "f.id, f.name, f.url, f.tags"
+ITEM_COLUMNS = "fi.id, fi.title, fi.is_read, fi.last_updated, fi.link, f.name, fi.starred"
+
+
+# Records go over the daemon's socket as lists of their values
+def record_to_json(value):
+    if isinstance(value, Record):
+        return value.values()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
 
 
 # Fetch categories from database
+@daemon_api("list", record=CategoryRecord)
+@cached_query
 def fetch_categories(conn, orderby=1):
+    cursor = conn.cursor()
+    cursor.row_factory = CategoryRecord.from_row
     if orderby == 1:
         # Order by name
-        cursor = conn.cursor()
         cursor.execute("""
             SELECT DISTINCT name, id 
             FROM categories 
@@ -369,7 +1418,6 @@ def fetch_categories(conn, orderby=1):
         """)
     elif orderby == 2:
         # Order by id
-        cursor = conn.cursor()
         cursor.execute("""
             SELECT DISTINCT name, id 
             FROM categories 
@@ -377,25 +1425,21 @@ def fetch_categories(conn, orderby=1):
         """)
     elif orderby == 3:
         # Order by unread count
-        cursor = conn.cursor()
         cursor.execute("""
-            SELECT c.name, c.id, COUNT(CASE WHEN fi.is_read = 0 THEN 1 END) as unread_count
+            SELECT c.name, c.id
             FROM categories c
             LEFT JOIN feed_categories fc ON c.id = fc.category_id
             LEFT JOIN feeds f ON fc.feed_id = f.id
             LEFT JOIN feed_items fi ON f.id = fi.feed_id
             GROUP BY c.name, c.id
-            ORDER BY unread_count DESC, c.name ASC
+            ORDER BY COUNT(CASE WHEN fi.is_read = 0 THEN 1 END) DESC, c.name ASC
         """)
-
-    categories = cursor.fetchall()
-    # If using unread count query, strip the count from result
-    # if orderby == 3:
-    #    return [(category[0], category[1]) for category in categories]
-    return [(category[0], category[1]) for category in categories]
+    return cursor.fetchall()
 
 
 # Fetch feeds by category
+@daemon_api("feeds", record=FeedRecord)
+@cached_query
 def fetch_feeds_by_category(conn, category, orderby='c.name'):
     forder = "c.name"
     if orderby == 1:
@@ -404,162 +1448,1241 @@ def fetch_feeds_by_category(conn, category, orderby='c.name'):
         forder = "f.id"
     elif orderby == 3:
         forder = "f.url"
-    elif orderby == 4:
+    cursor = conn.cursor()
+    cursor.row_factory = FeedRecord.from_row
+    if orderby == 4:
         # Order by unread count
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT f.id, f.name AS feed_name, f.url, f.tags,
-                   COUNT(CASE WHEN fi.is_read = 0 THEN 1 END) as unread_count
+        cursor.execute(f"""
+            SELECT {FEED_COLUMNS}
             FROM feeds f
             JOIN feed_categories fc ON f.id = fc.feed_id
             JOIN categories c ON fc.category_id = c.id
             LEFT JOIN feed_items fi ON f.id = fi.feed_id
             WHERE c.name = ?
             GROUP BY f.id, f.name, f.url, f.tags
-            ORDER BY unread_count DESC
+            ORDER BY COUNT(CASE WHEN fi.is_read = 0 THEN 1 END) DESC
         """, (category,))
-        feeds = cursor.fetchall()
-        return feeds  # Return the list of feeds with unread counts
+        return cursor.fetchall()
 
     # Original query for other sort orders
-    cursor = conn.cursor()
     cursor.execute(f"""
-        SELECT f.id, f.name AS feed_name, f.url, f.tags 
+        SELECT {FEED_COLUMNS}
         FROM feeds f
         JOIN feed_categories fc ON f.id = fc.feed_id
         JOIN categories c ON fc.category_id = c.id
         WHERE c.name = ? 
         ORDER BY {forder} ASC
     """, (category,))
-    feeds = cursor.fetchall()
-    return feeds  # Return the list of feeds
+    return cursor.fetchall()  # Return the list of feeds
 
 
 # Fetch items for a feed
+@daemon_api("items", record=ItemRecord)
+@cached_query
 def fetch_feed_items(conn, feed_id,sort=1):
     #1 sort by date
     # 2 sort by title
     cursor = conn.cursor()
-    if sort == 1:
-        sql = "SELECT id, title, summary, is_read, last_updated, created, link FROM feed_items WHERE feed_id = ? ORDER BY last_updated DESC"
-    elif sort == 2 :
-        sql = "SELECT id, title, summary, is_read, last_updated, created, link FROM feed_items WHERE feed_id = ? ORDER BY title DESC"
+    cursor.row_factory = ItemRecord.from_row
+    order = "fi.last_updated DESC" if sort == 1 else "fi.title DESC"
     cursor.execute(
-        sql , (feed_id,)
+        f"SELECT {ITEM_COLUMNS} FROM feed_items fi JOIN feeds f ON fi.feed_id = f.id WHERE fi.feed_id = ? ORDER BY {order}",
+        (feed_id,)
     )
     return cursor.fetchall()
 
 
-# Update feed items in database
-def update_feed_items(stdscr,conn, feed):
-    global reqtimeout
-    cursor = conn.cursor()
+# Seconds to wait from a Retry-After header, which is a number or a HTTP date
+def parse_retry_after(value):
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
     try:
-        response = requests.get(feed[2], timeout=reqtimeout)
-        if response.status_code == 200:
-            parsed_feed = feedparser.parse(response.content)  # Parse the content with feedparser
-            for entry in parsed_feed.entries:
-                updated_parsed = entry.get("updated_parsed")
-                created_parsed = entry.get("created_parsed")
-
-                timestamp_update = int(time.mktime(updated_parsed)) if updated_parsed else 0
-                timestamp_create = int(time.mktime(created_parsed)) if created_parsed else 0
-                content = entry.get("content", [{}])[0].get("value", "")
-                cursor.execute(
-                    """
-                    INSERT OR IGNORE INTO feed_items (feed_id, title, summary, content, last_updated, created, link)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (feed[0], entry.title, entry.summary, content, timestamp_update, timestamp_create, entry.link)
-                )
-        else:
-            txt = f"Failed to retrieve: {feed[2]} Code:{response.status_code}"
-            footerpop(stdscr,txt,1)
-            log_event(txt) 
-    except:
-        txt = f"Timedout to retrieve: {feed[2]}"
-        footerpop(stdscr,txt,1)
-        log_event(txt) 
-    
-    conn.commit()
-    
-def get_feed_item_counts_by_category(conn, category):
-    #print(category)
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:  # HTTP dates are GMT, naive ones would be taken as local time
+        moment = moment.replace(tzinfo=timezone.utc)
+    return max(0, int(moment.timestamp() - time.time()))
+
+
+# Remember the result of a fetch, to back off from failing feeds
+def record_feed_result(conn, feed_id, error, retry_after=None):
+    """
+    Parameters:
+        conn: Database connection
+        feed_id: Feed that was fetched
+        error: None on success, else a description of the failure
+        retry_after: Seconds the server asked to wait, if any
+    """
     cursor = conn.cursor()
+    if not error:
+        cursor.execute("DELETE FROM feed_status WHERE feed_id = ?", (feed_id,))
+        return
+    cursor.execute("SELECT failures FROM feed_status WHERE feed_id = ?", (feed_id,))
+    row = cursor.fetchone()
+    failures = (row[0] if row else 0) + 1
+    if retry_after is not None:
+        delay = retry_after
+    else:
+        # Exponential backoff: 1, 2, 4... minutes, up to the cooldown
+        delay = min(BACKOFF_BASE * 2 ** (failures - 1), failure_cooldown)
+    if failures >= max_failures:
+        # Circuit open, skip the feed until the cooldown passes
+        delay = max(delay, failure_cooldown)
+    now = int(time.time())
     cursor.execute("""
-        SELECT COUNT(fi.id) AS total_items, 
-               SUM(CASE WHEN fi.is_read = 0 THEN 1 ELSE 0 END) AS total_unread
-        FROM feed_items fi
-        JOIN feeds f ON fi.feed_id = f.id
-        WHERE f.id IN (SELECT feed_id FROM feed_categories WHERE category_id = ?)
-    """, (category,))
-    return cursor.fetchone()
+        INSERT OR REPLACE INTO feed_status (feed_id, failures, last_error, last_failure, retry_after)
+        VALUES (?, ?, ?, ?, ?)
+    """, (feed_id, failures, error, now, now + delay))
 
-def get_feed_item_counts_by_feed(conn, feed):
+
+# Feeds that should not be fetched yet, because of failures
+def backed_off_feeds(conn):
     cursor = conn.cursor()
-    cursor.execute("""
-        SELECT COUNT(fi.id) AS total_items, 
-               SUM(CASE WHEN fi.is_read = 0 THEN 1 ELSE 0 END) AS total_unread
-        FROM feed_items fi
-        JOIN feeds f ON fi.feed_id = f.id
-        WHERE f.id = ?
-    """, (feed,))
-    return cursor.fetchone()
+    cursor.execute("SELECT feed_id FROM feed_status WHERE retry_after > ?", (int(time.time()),))
+    return {row[0] for row in cursor.fetchall()}
 
-def maxlength(stdscr):
-    height, width = stdscr.getmaxyx()
-    return width
 
-def clear_feeds_not_in_csv(stdscr,conn, csv_file):
-    if not confirm(stdscr,"Erase orphan feeds? Write 'yes' to confirm:"):
-        return
-    
-    # Load feeds from CSV
-    csv_feeds = set()
-    with open(csv_file, mode="r") as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            csv_feeds.add(row["URL"])  # Assuming URL is the unique identifier
+# Normalize an url, so the same feed gets the same cache key
+def normalize_url(url):
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:  # Malformed port or address
+        return url.strip()
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if port and (scheme, port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{port}"
+    return urlunsplit((scheme, host, parts.path or "/", parts.query, ""))
+
+
+# Raw feed responses, shared between users in the shared_cache directory
+class SharedResponseCache:
+    """
+    Each url is stored as <key>.body and <key>.json (validators and fetch
+    time), where key is the sha256 of the normalized url. A <key>.lock
+    file serializes the instances fetching the same url, so only one of
+    them goes to the network and the others reuse its response. The lock
+    is taken on a read-only descriptor, so the other users only need to
+    read the file, whoever created it. Only feed responses are shared,
+    never read state.
+    """
+    def __init__(self, directory, ttl):
+        self.directory = directory
+        self.ttl = ttl
 
-    cursor = conn.cursor()
-    # Fetch current feeds from the database
-    cursor.execute("SELECT url FROM feeds")
-    db_feeds = cursor.fetchall()
+    def base(self, url):
+        key = hashlib.sha256(normalize_url(url).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, key)
 
-    # Identify feeds to delete
-    feeds_to_delete = [feed[0] for feed in db_feeds if feed[0] not in csv_feeds]
+    def read_meta(self, base):
+        try:
+            with open(base + ".json", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
 
-    # Delete feeds not in CSV
-    for url in feeds_to_delete:
-        cursor.execute("DELETE FROM feeds WHERE url = ?", (url,))
-    
-    # Delete categories that have no feeds
-    cursor.execute("DELETE FROM feeds WHERE category NOT IN (SELECT DISTINCT category FROM feeds)")
-    
-    conn.commit()
+    def read_body(self, base):
+        with open(base + ".body", mode="rb") as file:
+            return file.read()
 
-def update_feeds_by_category(conn, category,stdscr):
-    feeds = fetch_feeds_by_category(conn, category)
-    for i,feed in enumerate(feeds):
-        text = f"{i+1:3}/{len(feeds):3}| {category:12}|{feed[2]:25}"
-        footer(stdscr,text)
-        stdscr.refresh()
-        update_feed_items(stdscr,conn, feed)
+    def is_fresh(self, meta):
+        return meta is not None and time.time() - meta.get("fetched", 0) < self.ttl
 
-# 0 Unread : 1 Read
-def mark_all_items_as(conn, feed_id,mark):
+    # Write a file atomically, readable by the other users
+    def write(self, path, data):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        try:
+            os.fchmod(fd, 0o664)
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def fetch(self, url, timeout):
+        """
+        Returns:
+            Tuple of (status code, body, headers, permanent new url or None)
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        base = self.base(url)
+        fd = os.open(base + ".lock", os.O_RDONLY | os.O_CREAT, 0o664)
+        with os.fdopen(fd, "rb") as lock:
+            if os.fstat(fd).st_uid == os.geteuid():
+                os.fchmod(fd, 0o664)
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            meta = self.read_meta(base)
+            if self.is_fresh(meta):
+                return 200, self.read_body(base), {}, meta.get("moved")
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Another instance may have fetched it, while we waited
+            meta = self.read_meta(base)
+            if self.is_fresh(meta):
+                return 200, self.read_body(base), {}, meta.get("moved")
+
+            headers = {}
+            if meta and meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta and meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+            response = requests.get(url, timeout=timeout, headers=headers)
+            moved_to = permanent_location(response)
+            if response.status_code == 304 and meta:
+                body = self.read_body(base)
+            elif response.status_code == 200:
+                body = response.content
+                self.write(base + ".body", body)
+                meta = {"url": url,
+                        "etag": response.headers.get("ETag"),
+                        "last_modified": response.headers.get("Last-Modified")}
+            else:
+                return response.status_code, response.content, response.headers, moved_to
+            meta["fetched"] = time.time()
+            meta["moved"] = moved_to
+            self.write(base + ".json", json.dumps(meta).encode("utf-8"))
+            return 200, body, response.headers, moved_to
+
+
+shared_response_cache = None
+
+
+# Fields stored for each entry: (title, summary, content, updated, created, link)
+ATOM_NS = "{http://www.w3.org/2005/Atom}"
+RSS_CONTENT = "{http://purl.org/rss/1.0/modules/content/}encoded"
+DC_DATE = "{http://purl.org/dc/elements/1.1/}date"
+XHTML_NS = "{http://www.w3.org/1999/xhtml}"
+MEDIA_DESCRIPTION = ".//{http://search.yahoo.com/mrss/}description"
+
+
+# feedparser gives UTC struct_time, the ingest always stored it with mktime
+def struct_to_timestamp(parsed):
+    return int(time.mktime(parsed)) if parsed else 0
+
+
+def parse_entries_feedparser(body):
+    entries = []
+    for entry in feedparser.parse(body).entries:
+        # dict.get skips feedparser's deprecated updated -> published mapping and its warning
+        updated_parsed = dict.get(entry, "updated_parsed") or entry.get("published_parsed")
+        content = entry.get("content", [{}])[0].get("value", "")
+        enclosures = tuple(enclosure_tuple(enclosure.get("href", ""), enclosure.get("length"), enclosure.get("type"))
+                           for enclosure in entry.get("enclosures", []) if enclosure.get("href"))
+        entries.append((entry.get("title", ""), entry.get("summary", ""), content,
+                        struct_to_timestamp(updated_parsed), struct_to_timestamp(entry.get("created_parsed")),
+                        entry.get("link", ""), enclosures))
+    return entries
+
+
+# Enclosure of an entry as (url, length, type), the length is 0 when the feed doesn't give it
+def enclosure_tuple(url, length, media_type):
+    length = str(length or "").strip()
+    return url.strip(), int(length) if length.isdigit() else 0, media_type or ""
+
+
+# Parse an RFC 822 or ISO 8601 date, like feedparser would store it
+def feed_date_to_timestamp(text, rfc822):
+    """
+    Returns:
+        Timestamp, 0 for a missing date or None if the date can't be parsed
+    """
+    if not text or not text.strip():
+        return 0
+    text = text.strip()
+    try:
+        if rfc822:
+            moment = parsedate_to_datetime(text)
+            if moment.tzinfo is None:  # feedparser drops dates without a zone
+                return None
+        else:
+            if not re.match(r"\d{4}-\d\d-\d\d", text):  # Other ISO forms are read differently
+                return None
+            moment = datetime.fromisoformat(text.replace("z", "Z"))
+    except (TypeError, ValueError, IndexError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return struct_to_timestamp(time.gmtime(moment.timestamp()))
+
+
+def element_text(element):
+    return "".join(element.itertext()).strip() if element is not None else ""
+
+
+# Like feedparser, entry links are resolved against xml:base
+def resolve_base(element, href):
+    return urljoin(element.base, href) if href and element.base else href
+
+
+# feedparser sanitizes html, scripts and styles are the part that shows in the text
+def strip_scripts(html):
+    if "<s" not in html.lower():
+        return html
+    return re.sub(r"<(script|style)\b.*?</\1\s*>", "", html, flags=re.IGNORECASE | re.DOTALL)
+
+
+def atom_text(element):
+    """
+    Text of an Atom text construct, the inner markup for type="xhtml"
+    Returns:
+        The text or None if the content is not inline text or html
+    """
+    if element is None:
+        return ""
+    kind = element.get("type", "text")
+    if element.get("src") or element.get("mode") == "base64":
+        return None
+    if kind == "xhtml":
+        div = element.find(XHTML_NS + "div")
+        if div is None:
+            return None
+        ET.cleanup_namespaces(div)
+        inner = (div.text or "") + "".join(ET.tostring(child, encoding="unicode", with_tail=True) for child in div)
+        return strip_scripts(re.sub(r' xmlns(:\w+)?="[^"]*"', "", inner).strip())
+    if kind not in ("text", "html", "text/plain", "text/html"):
+        return None
+    return strip_scripts((element.text or "").strip())
+
+
+def parse_rss_item(item):
+    title = element_text(item.find("title"))
+    description = item.find("description")
+    content = strip_scripts(element_text(item.find(RSS_CONTENT)))
+    summary = strip_scripts(element_text(description)) if description is not None else content
+    media_description = item.find(MEDIA_DESCRIPTION)
+    if media_description is not None:
+        # feedparser merges it into summary or content depending on the order, leave that to it
+        if description is not None or content:
+            return None
+        summary = element_text(media_description)
+    link = item.find("link")
+    guid = item.find("guid")
+    if link is None and guid is not None and guid.get("isPermaLink", "true") != "false":
+        link = guid
+    link = resolve_base(link, element_text(link)) if link is not None else ""
+    # dc:date and atom:updated are update dates, pubDate is used when they are missing
+    updated = item.findtext(DC_DATE) or item.findtext(ATOM_NS + "updated")
+    updated = feed_date_to_timestamp(updated, False) if updated else feed_date_to_timestamp(item.findtext("pubDate"), True)
+    if updated is None:
+        return None
+    enclosures = tuple(enclosure_tuple(element.get("url", ""), element.get("length"), element.get("type"))
+                       for element in item.iterfind("enclosure") if element.get("url"))
+    return title, summary, content, updated, 0, link, enclosures
+
+
+def parse_atom_entry(entry):
+    title = atom_text(entry.find(ATOM_NS + "title"))
+    summary = atom_text(entry.find(ATOM_NS + "summary"))
+    content = atom_text(entry.find(ATOM_NS + "content"))
+    if title is None or summary is None or content is None:
+        return None
+    if entry.find(ATOM_NS + "summary") is None:
+        summary = content
+    media_description = entry.find(MEDIA_DESCRIPTION)
+    if media_description is not None:
+        if summary or content:
+            return None
+        summary = element_text(media_description)
+    # Like feedparser, the id is the link of entries without an alternate link
+    link = element_text(entry.find(ATOM_NS + "id"))
+    for element in entry.iterfind(ATOM_NS + "link"):
+        if element.get("rel", "alternate") == "alternate":
+            link = resolve_base(element, element.get("href", ""))
+            break
+    updated = entry.findtext(ATOM_NS + "updated") or entry.findtext(ATOM_NS + "published")
+    updated = feed_date_to_timestamp(updated, False)
+    if updated is None:
+        return None
+    # Like feedparser, links without a type are text/html
+    enclosures = tuple(enclosure_tuple(resolve_base(element, element.get("href", "")), element.get("length"),
+                                       element.get("type", "text/html"))
+                       for element in entry.iterfind(ATOM_NS + "link")
+                       if element.get("rel") == "enclosure" and element.get("href"))
+    return title, summary, content, updated, 0, link, enclosures
+
+
+# What feedparser and lxml raise on content they can't handle, other exceptions are bugs
+PARSE_ERRORS = (ValueError, TypeError, AttributeError, LookupError, ET.Error)
+
+FAST_PARSER = ET.XMLParser(resolve_entities=False, no_network=True, remove_comments=True,
+                           remove_pis=True, strip_cdata=True)
+
+
+# Parse well-formed RSS 2.0 and Atom 1.0 straight from the tree
+def parse_entries_fast(body):
+    """
+    Returns:
+        List of (title, summary, content, updated, created, link, enclosures), or
+        None when the feed has to be left to feedparser
+    """
+    try:
+        root = ET.fromstring(body, FAST_PARSER)
+    except (ET.XMLSyntaxError, ValueError):
+        return None
+    if root.tag == "rss" and root.get("version", "").startswith("2."):
+        items, parse_item = root.iterfind("channel/item"), parse_rss_item
+    elif root.tag == ATOM_NS + "feed":
+        items, parse_item = root.iterfind(ATOM_NS + "entry"), parse_atom_entry
+    else:
+        return None
+    entries = []
+    for item in items:
+        entry = parse_item(item)
+        if entry is None:
+            return None
+        entries.append(entry)
+    return entries
+
+
+def parse_entries(body, use_fast_parser=True):
+    entries = parse_entries_fast(body) if use_fast_parser else None
+    if entries is None:
+        entries = parse_entries_feedparser(body)
+    return entries
+
+
+# Text of an html field, markup that feedparser sanitizes or reserializes differently doesn't count
+def rendered_text(html):
+    return " ".join(" ".join(html_to_lines(html)).split())
+
+
+# Check the fast parser against feedparser, on saved feeds or on the feeds of the database
+def compare_parsers(sources, out=sys.stdout):
+    """
+    Parameters:
+        sources: Iterable of (name, body)
+        out: Stream the differences are written to
+    Returns:
+        Tuple of (feeds compared, feeds left to feedparser, differences, fast seconds, feedparser seconds)
+    """
+    fields = ("title", "summary", "content", "updated", "created", "link", "enclosures")
+    compared = fallbacks = differences = 0
+    fast_time = slow_time = 0.0
+    for name, body in sources:
+        start = time.perf_counter()
+        fast = parse_entries_fast(body)
+        fast_time += time.perf_counter() - start
+        start = time.perf_counter()
+        slow = parse_entries_feedparser(body)
+        slow_time += time.perf_counter() - start
+        if fast is None:
+            fallbacks += 1
+            print(f"{name}: left to feedparser", file=out)
+            continue
+        compared += 1
+        if len(fast) != len(slow):
+            differences += 1
+            print(f"{name}: {len(fast)} entries, feedparser {len(slow)}", file=out)
+            continue
+        for number, (fast_entry, slow_entry) in enumerate(zip(fast, slow)):
+            for field, fast_value, slow_value in zip(fields, fast_entry, slow_entry):
+                if field in ("summary", "content"):
+                    same = rendered_text(fast_value) == rendered_text(slow_value)
+                else:
+                    same = fast_value == slow_value
+                if not same:
+                    differences += 1
+                    print(f"{name}: entry {number} {field}: {fast_value!r} != {slow_value!r}", file=out)
+    return compared, fallbacks, differences, fast_time, slow_time
+
+
+def feed_bodies(conn, files):
+    if files:
+        for filename in files:
+            with open(filename, "rb") as file:
+                yield filename, file.read()
+        return
+    for feed_id, url in conn.execute("SELECT id, url FROM feeds ORDER BY id"):
+        try:
+            status_code, body, headers, _ = fetch_feed(url, (connect_timeout, reqtimeout))
+        except requests.exceptions.RequestException as e:
+            print(f"{url}: {e}", file=sys.stderr)
+            continue
+        if status_code == 200:
+            yield url, body
+
+
+# Save the feeds being compared, named after their url, to grow the corpus of the parser tests
+def save_bodies(sources, directory):
+    os.makedirs(directory, exist_ok=True)
+    for name, body in sources:
+        filename = re.sub(r"[^\w.-]+", "-", re.sub(r"^\w+://", "", name)).strip("-")[:120] or "feed"
+        if not filename.endswith(".xml"):
+            filename += ".xml"
+        with open(os.path.join(directory, filename), "wb") as file:
+            file.write(body)
+        yield name, body
+
+
+# Get a feed, from the shared cache if it is configured
+def fetch_feed(url, timeout):
+    """
+    Returns:
+        Tuple of (status code, body, headers, permanent new url or None)
+    """
+    if shared_response_cache:
+        try:
+            return shared_response_cache.fetch(url, timeout)
+        except requests.exceptions.RequestException:
+            raise
+        except OSError as e:  # Unusable cache directory, the feed is fetched directly
+            log_event(f"Shared cache failed for <{url}>: {e}", logging.WARNING)
+    response = requests.get(url, timeout=timeout)
+    return response.status_code, response.content, response.headers, permanent_location(response)
+
+
+# The url a response was permanently moved to, by the redirects at the start of its chain
+def permanent_location(response):
+    location = None
+    for hop in response.history:
+        if hop.status_code not in PERMANENT_REDIRECTS:
+            break
+        location = urljoin(hop.url, hop.headers.get("Location", ""))
+    return location
+
+
+# Download a feed, within the refresh deadline
+def download_feed(feed, deadline=None):
+    """
+    Returns:
+        Tuple of (body or None, error or None, retry after or None, permanent new url or None)
+    """
+    global reqtimeout, connect_timeout
+    read_timeout = reqtimeout
+    if deadline:
+        read_timeout = max(1, min(reqtimeout, deadline - time.time()))
+    try:
+        status_code, body, headers, moved_to = fetch_feed(feed.url, (connect_timeout, read_timeout))
+    except requests.exceptions.ConnectTimeout:
+        return None, "Connection timed out", None, None
+    except requests.exceptions.Timeout:
+        return None, "Read timed out", None, None
+    except requests.exceptions.ConnectionError:
+        return None, "Connection failed", None, None
+    except requests.exceptions.RequestException as e:
+        return None, f"Request failed: {e}", None, None
+    except OSError as e:
+        return None, f"Download failed: {e}", None, None
+    if status_code != 200:
+        retry_after = None
+        if status_code in (429, 503):
+            retry_after = parse_retry_after(headers.get("Retry-After"))
+        return None, f"Code:{status_code}", retry_after, None
+    return body, None, None, moved_to
+
+
+# Move a feed to the url its server permanently redirects to, merging it with a feed already there
+def move_feed(conn, feed, url):
+    cursor = conn.cursor()
+    with conn:
+        cursor.execute("INSERT OR REPLACE INTO feed_redirects (old_url, new_url, seen) VALUES (?, ?, ?)",
+                       (feed.url, url, int(time.time())))
+        cursor.execute("SELECT id, url FROM feeds WHERE id != ?", (feed.id,))
+        key = feed_url_key(url)
+        existing = [feed_id for feed_id, other in cursor.fetchall() if feed_url_key(other) == key]
+        if existing:
+            merge_feeds(cursor, existing[0], feed.id)
+        else:
+            cursor.execute("UPDATE feeds SET url = ? WHERE id = ?", (url, feed.id))
+    data_changed()
+    log_event(f"Feed moved permanently: {feed.name} <{feed.url}> -> <{url}>")
+    feed.url = url
+    if existing:
+        feed.id = existing[0]
+
+
+# Parse downloaded feeds into rows for feed_items, runs in the parse workers too
+def parse_feed_bodies(chunk, use_fast_parser=True):
+    """
+    Parameters:
+        chunk: List of (feed id, body)
+        use_fast_parser: The fast_parser setting, workers don't read the config
+    Returns:
+        List of (feed id, rows, error)
+    """
+    results = []
+    for feed_id, body in chunk:
+        try:
+            rows = [(feed_id,) + entry for entry in parse_entries(body, use_fast_parser)]
+            results.append((feed_id, rows, None))
+        except PARSE_ERRORS as e:
+            results.append((feed_id, None, f"Parse error: {e}"))
+    return results
+
+
+RULE_FIELDS = ("title", "summary", "link", "feed", "category", "tags")
+RULE_ACTIONS = ("delete", "read", "tag", "search")
+
+
+# Pattern of a rule condition: /regex/ (/regex/i ignores case) or comma separated keywords
+def rule_pattern(value):
+    match = re.fullmatch(r"/(.*)/(i?)", value.strip(), re.S)
+    if match:
+        return f"(?i:{match[1]})" if match[2] else f"(?:{match[1]})"
+    keywords = [re.escape(keyword.strip()) for keyword in value.split(",") if keyword.strip()]
+    return "(?i:" + "|".join(keywords) + ")" if keywords else None
+
+
+# Rules of the rules file, applied to the new items of a feed as they are stored
+class IngestRules:
+    """
+    Every field has one combined pattern of all the rules that test it, so
+    an item that matches no rule costs one search per field, however many
+    rules there are. The feed, category and tags fields are the same for a
+    whole batch, and are tested once. Patterns with groups are left out of
+    the combined ones, as groups and backreferences are numbered across the
+    whole pattern, and are only tested with their rule.
+    """
+    def __init__(self, rules):
+        self.rules = rules  # List of (name, {field: compiled pattern}, [(action, argument)])
+        self.combined = {}
+        for field in RULE_FIELDS:
+            patterns = [conditions[field] for _, conditions, _ in self.rules
+                        if field in conditions and not conditions[field].groups]
+            if patterns:
+                self.combined[field] = re.compile("|".join(pattern.pattern for pattern in patterns))
+        # Fields of each rule in the combined patterns, the rule fails with them
+        self.combined_fields = [{field for field, pattern in conditions.items() if not pattern.groups}
+                                for _, conditions, _ in self.rules]
+        self.uses_categories = "category" in self.combined or any(
+            "category" in conditions for _, conditions, _ in self.rules)
+
+    # Fields of the rules that can't match anything in these values
+    def failed_fields(self, values):
+        return {field for field, combined in self.combined.items()
+                if field in values and not combined.search(values[field])}
+
+    def match(self, values, failed):
+        actions = []
+        for (name, conditions, rule_actions), combined_fields in zip(self.rules, self.combined_fields):
+            if failed.intersection(combined_fields):
+                continue
+            if all(pattern.search(values[field]) for field, pattern in conditions.items()):
+                actions.extend(rule_actions)
+        return actions
+
+    def apply(self, conn, feed, rows):
+        """
+        Parameters:
+            conn: Database connection
+            feed: FeedRecord the rows belong to
+            rows: Rows of (feed id, title, summary, content, last_updated, created, link, enclosures)
+        Returns:
+            Tuple of (rows no rule matched, [(row, is_read, tags, searches)]).
+            Deleted rows are in neither
+        """
+        values = {"feed": f"{feed.name}\n{feed.url}", "tags": feed.tags or "", "category": ""}
+        if self.uses_categories:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT c.name FROM categories c JOIN feed_categories fc ON fc.category_id = c.id
+                WHERE fc.feed_id = ?
+            """, (feed.id,))
+            values["category"] = "\n".join(row[0] for row in cursor.fetchall())
+        feed_failed = self.failed_fields(values)
+        plain = []
+        filed = []
+        deleted = 0
+        for row in rows:
+            values["title"], values["summary"], values["link"] = row[1] or "", row[2] or "", row[6] or ""
+            actions = self.match(values, feed_failed | self.failed_fields(
+                {"title": values["title"], "summary": values["summary"], "link": values["link"]}))
+            if not actions:
+                plain.append(row)
+            elif ("delete", None) in actions:
+                deleted += 1
+            else:
+                filed.append((row, int(("read", None) in actions),
+                              {argument for action, argument in actions if action == "tag"},
+                              {argument for action, argument in actions if action == "search"}))
+        if deleted:
+            log_event(f"Rules dropped {deleted} items of {feed.name}")
+        return plain, filed
+
+
+# Read and compile the rules file, an INI file with a section per rule
+def load_rules(filename):
+    """
+    Each section is a rule: conditions on the fields of RULE_FIELDS, that
+    all have to match, and an action line with one or more of delete,
+    read, tag NAME and search NAME, separated by commas. Invalid rules are
+    logged and skipped.
+    Returns:
+        IngestRules
+    """
+    config = configparser.ConfigParser(interpolation=None)
+    try:
+        config.read(filename, encoding="utf-8")
+    except (configparser.Error, UnicodeDecodeError, OSError) as e:
+        log_event(f"Rules file {filename}: {e}", logging.ERROR)
+        return IngestRules([])
+    rules = []
+    for name in config.sections():
+        section = config[name]
+        try:
+            conditions = {}
+            for field in RULE_FIELDS:
+                pattern = rule_pattern(section[field]) if field in section else None
+                if pattern:
+                    conditions[field] = re.compile(pattern)
+            actions = []
+            for action in section.get("action", "").split(","):
+                action, _, argument = action.strip().partition(" ")
+                argument = argument.strip() or None
+                if action not in RULE_ACTIONS or (argument is None) != (action in ("delete", "read")):
+                    raise ValueError(f"invalid action '{section.get('action', '')}'")
+                actions.append((action, argument))
+            unknown = set(section) - set(RULE_FIELDS) - {"action"}
+            if unknown:
+                raise ValueError(f"unknown field {', '.join(sorted(unknown))}")
+            if not conditions:
+                raise ValueError("no conditions")
+        except (re.error, ValueError) as e:
+            log_event(f"Rule [{name}] in {filename} skipped: {e}", logging.ERROR)
+            continue
+        rules.append((name, conditions, actions))
+    return IngestRules(rules)
+
+
+# Rules of the rules file, compiled again only when the file changes
+def current_rules():
+    global ingest_rules
+    try:
+        mtime = os.path.getmtime(rules_file)
+    except OSError:
+        return None
+    if ingest_rules is None or ingest_rules[0] != mtime:
+        ingest_rules = (mtime, load_rules(rules_file))
+    return ingest_rules[1]
+
+
+# Insert the items the rules matched, and file the new ones in their tags and saved searches
+def store_filed_items(conn, filed):
     cursor = conn.cursor()
-    cursor.execute("UPDATE feed_items SET is_read = ? WHERE feed_id = ?", (mark,feed_id,))
+    for row, is_read, tags, searches in filed:
+        cursor.execute("""
+            INSERT OR IGNORE INTO feed_items (feed_id, title, summary, content, last_updated, created, link, is_read)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, tuple(row[:7]) + (is_read,))
+        if cursor.rowcount != 1:
+            continue  # Already stored, and filed, by an earlier refresh
+        item_id = cursor.lastrowid
+        for tag in tags:
+            cursor.execute("INSERT OR IGNORE INTO tags (name) VALUES (?)", (tag,))
+            cursor.execute("INSERT OR IGNORE INTO item_tags (tag_id, item_id) SELECT id, ? FROM tags WHERE name = ?",
+                           (item_id, tag))
+        cursor.executemany("INSERT OR IGNORE INTO saved_search_items (search, item_id) VALUES (?, ?)",
+                           [(search, item_id) for search in searches])
+
+
+# Enclosures of stored items, the items are found by their feed and title
+def store_enclosures(conn, rows):
+    conn.executemany("""
+        INSERT OR IGNORE INTO enclosures (item_id, url, length, type)
+        SELECT id, ?, ?, ? FROM feed_items WHERE feed_id = ? AND title = ?
+    """, ((url, length, media_type, row[0], row[1])
+          for row in rows if len(row) > 7 for url, length, media_type in row[7]))
+
+
+# Store the parsed items of a feed, and the result of its update
+def store_feed_items(conn, feed, rows, error=None, retry_after=None, deadline=None):
+    """
+    Parameters:
+        rows: Rows of (feed id, title, summary, content, last_updated, created, link, enclosures)
+        deadline: Time when the whole refresh has to be finished
+    Returns:
+        None on success, else a description of the failure
+    """
+    if rows is not None:
+        try:
+            rules = current_rules()
+            filed = []
+            if rules and rows:
+                rows, filed = rules.apply(conn, feed, rows)
+            conn.executemany(
+                """
+                INSERT OR IGNORE INTO feed_items (feed_id, title, summary, content, last_updated, created, link)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (row[:7] for row in rows)
+            )
+            if filed:
+                store_filed_items(conn, filed)
+            store_enclosures(conn, rows + [row for row, _, _, _ in filed])
+            fetch_full_articles(conn, feed.id, deadline)
+            apply_pending_states(conn, feed)
+        except sqlite3.Error as e:
+            error = f"Storage error: {e}"
+    if error:
+        log_event(f"Failed to retrieve: {feed.name} <{feed.url}> {error}", logging.WARNING)
+    record_feed_result(conn, feed.id, error, retry_after)
     conn.commit()
+    data_changed()
+    return error
 
-# 0 Unread : 1 Read
-def mark_category_as(conn,category,stdscr,mark):
+
+# Update feed items in database
+def update_feed_items(conn, feed, deadline=None):
+    """
+    Fetch a feed and store its new items
+    Parameters:
+        conn: Database connection
+        feed: FeedRecord
+        deadline: Time when the whole refresh has to be finished
+    Returns:
+        None on success, else a description of the failure
+    """
+    body, error, retry_after, moved_to = download_feed(feed, deadline)
+    if moved_to:
+        move_feed(conn, feed, moved_to)
+    rows = None
+    if body is not None:
+        (feed_id, rows, error), = parse_feed_bodies([(feed.id, body)], fast_parser)
+    return store_feed_items(conn, feed, rows, error, retry_after, deadline)
+
+
+# Find the main article of a web page, readability style
+def extract_article(page):
+    """
+    Score the blocks of text of a page by their paragraphs, and return
+    the best one, penalized by its link density.
+    Parameters:
+        page: HTML of the page, as bytes or text
+    Returns:
+        HTML of the article, or "" if nothing looks like one
+    """
+    try:
+        doc = LH.fromstring(page)
+    except (ET.ParserError, ValueError):
+        return ""
+    for bad in doc.xpath("//script|//style|//noscript|//nav|//header|//footer|//aside|//form|//iframe"):
+        bad.drop_tree()
+
+    scores = {}
+    for p in doc.iter("p", "pre", "blockquote"):
+        text = p.text_content().strip()
+        if len(text) < 25:
+            continue
+        score = 1 + text.count(",") + min(len(text) // 100, 3)
+        parent = p.getparent()
+        if parent is None:
+            continue
+        scores[parent] = scores.get(parent, 0) + score
+        grandparent = parent.getparent()
+        if grandparent is not None:
+            scores[grandparent] = scores.get(grandparent, 0) + score / 2
+    if not scores:
+        return ""
+
+    def link_density(node):
+        text_length = len(node.text_content()) or 1
+        return sum(len(a.text_content()) for a in node.iter("a")) / text_length
+
+    best = max(scores, key=lambda node: scores[node] * (1 - link_density(node)))
+    return LH.tostring(best, encoding="unicode")
+
+
+# Fetch an entry's web page and extract the article
+def fetch_article(link, deadline=None):
+    read_timeout = reqtimeout
+    if deadline:
+        read_timeout = max(1, min(reqtimeout, deadline - time.time()))
+    try:
+        response = requests.get(link, timeout=(connect_timeout, read_timeout))
+        response.raise_for_status()
+        return extract_article(response.content)
+    except Exception as e:
+        # Stored as empty, so it isn't fetched again
+        log_event(f"Error extracting article {link}: {str(e)}", logging.ERROR)
+        return ""
+
+
+# Extract the full articles of unread items, for feeds that opted in
+def fetch_full_articles(conn, feed_id, deadline=None):
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT fi.id, fi.link FROM feed_items fi
+        JOIN feeds f ON fi.feed_id = f.id
+        WHERE f.id = ? AND f.fulltext = 1 AND fi.is_read = 0
+              AND fi.full_content IS NULL AND fi.link != ''
+    """, (feed_id,))
+    items = cursor.fetchall()
+    if not items:
+        return
+
+    # Articles cut short by the deadline are left for the next refresh, or extracted when opened
+    def fetch(link):
+        if deadline and time.time() >= deadline:
+            return None
+        article = fetch_article(link, deadline)
+        if not article and deadline and time.time() >= deadline:
+            return None
+        return article
+
+    with ThreadPoolExecutor(max_workers=prefetch_workers) as pool:
+        articles = pool.map(fetch, [item[1] for item in items])
+        for (item_id, _), article in zip(items, articles):
+            if article is not None:
+                cursor.execute("UPDATE feed_items SET full_content = ? WHERE id = ?", (article, item_id))
+
+
+# Results of a refresh, shown once at the end
+class RefreshReport:
+    def __init__(self, conn):
+        self.deadline = time.time() + refresh_deadline
+        self.backed_off = backed_off_feeds(conn)
+        self.done = set()
+        self.fetched = 0
+        self.failed = []
+        self.skipped = 0
+        self.missed = 0
+        self.parser = None  # ParsePool of a large refresh
+
+    def result(self, feed, error):
+        if error:
+            self.failed.append((feed, error))
+        else:
+            self.fetched += 1
+
+
+parse_executor = None
+
+
+def get_parse_executor():
+    global parse_executor
+    if parse_executor is None:
+        # Spawned, forking a process with curses and daemon threads running isn't safe
+        parse_executor = ProcessPoolExecutor(max_workers=parse_workers,
+                                             mp_context=multiprocessing.get_context("spawn"))
+    return parse_executor
+
+
+# Parses downloaded feeds in worker processes, while the next feeds download
+class ParsePool:
+    def __init__(self, conn, report):
+        self.conn = conn
+        self.report = report
+        self.feeds = {}  # Feeds waiting for their parse, by id
+        self.chunk = []
+        self.pending = {}  # Future -> feed ids of its chunk
+
+    def add(self, feed, body):
+        self.feeds[feed.id] = feed
+        if len(body) < PARSE_POOL_MIN_BYTES:
+            # Sending it to a worker costs more than parsing it here
+            self.store(parse_feed_bodies([(feed.id, body)], fast_parser))
+            return
+        self.chunk.append((feed.id, body))
+        if len(self.chunk) >= parse_chunk:
+            self.submit()
+        self.collect()
+
+    def submit(self):
+        global parse_executor
+        if not self.chunk:
+            return
+        chunk, self.chunk = self.chunk, []
+        try:
+            future = get_parse_executor().submit(parse_feed_bodies, chunk, fast_parser)
+        except BrokenProcessPool:
+            parse_executor = None
+            self.store(parse_feed_bodies(chunk, fast_parser))
+            return
+        self.pending[future] = [feed_id for feed_id, body in chunk]
+
+    def store(self, results):
+        for feed_id, rows, error in results:
+            feed = self.feeds.pop(feed_id)
+            self.report.result(feed, store_feed_items(self.conn, feed, rows, error, deadline=self.report.deadline))
+
+    # Store the chunks the workers are done with, waiting when too many are in flight
+    def collect(self, wait=False):
+        while self.pending:
+            block = wait or len(self.pending) > 2 * parse_workers
+            done, not_done = futures_wait(self.pending, timeout=None if block else 0,
+                                          return_when=FIRST_COMPLETED)
+            for future in done:
+                feed_ids = self.pending.pop(future)
+                try:
+                    results = future.result()
+                except Exception as e:  # The worker died, or a bug in the parser
+                    results = [(feed_id, None, f"Parse worker failed: {e!r}") for feed_id in feed_ids]
+                self.store(results)
+            if not done:
+                return
+
+    def finish(self):
+        self.submit()
+        self.collect(wait=True)
+
+
+@daemon_api("category_counts")
+@cached_query
+def get_feed_item_counts_by_category(conn, category):
+    #print(category)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT COUNT(fi.id) AS total_items, 
+               SUM(CASE WHEN fi.is_read = 0 THEN 1 ELSE 0 END) AS total_unread
+        FROM feed_items fi
+        JOIN feeds f ON fi.feed_id = f.id
+        WHERE f.id IN (SELECT feed_id FROM feed_categories WHERE category_id = ?)
+    """, (category,))
+    return cursor.fetchone()
+
+@daemon_api("feed_counts")
+@cached_query
+def get_feed_item_counts_by_feed(conn, feed):
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT COUNT(fi.id) AS total_items, 
+               SUM(CASE WHEN fi.is_read = 0 THEN 1 ELSE 0 END) AS total_unread
+        FROM feed_items fi
+        JOIN feeds f ON fi.feed_id = f.id
+        WHERE f.id = ?
+    """, (feed,))
+    return cursor.fetchone()
+
+def maxlength(stdscr):
+    height, width = stdscr.getmaxyx()
+    return width
+
+def clear_feeds_not_in_csv(stdscr,conn, csv_file):
+    if not confirm(stdscr,"Erase orphan feeds? Write 'yes' to confirm:"):
+        return
+    # A forced sync removes feeds, items and categories not in the CSV file
+    sync_feeds(conn, csv_file, force=True)
+
+def update_feeds_by_category(conn, category, report, progress=None):
     feeds = fetch_feeds_by_category(conn, category)
-    for feed in feeds:
-        text = f"Marking: {feed[2]}"
-        footer(stdscr,text)
+    for i,feed in enumerate(feeds):
+        if feed.id in report.done:
+            continue
+        report.done.add(feed.id)
+        if time.time() > report.deadline:
+            report.missed += 1
+            continue
+        if feed.id in report.backed_off:
+            report.skipped += 1
+            continue
+        if progress:
+            progress(f"{i+1:3}/{len(feeds):3}| {category:12}|{feed.url:25}")
+        if report.parser:
+            body, error, retry_after, moved_to = download_feed(feed, report.deadline)
+            if moved_to:
+                move_feed(conn, feed, moved_to)
+            if body is None:
+                report.result(feed, store_feed_items(conn, feed, None, error, retry_after))
+            else:
+                report.parser.add(feed, body)
+        else:
+            report.result(feed, update_feed_items(conn, feed, report.deadline))
+
+# Refresh categories, parsing in worker processes when there are enough feeds to pay for them
+def refresh_categories(conn, categories, report, progress=None):
+    if parse_workers > 1 and (os.cpu_count() or 1) > 1:
+        feed_ids = {feed.id for category in categories for feed in fetch_feeds_by_category(conn, category)}
+        if len(feed_ids - report.backed_off) >= PARSE_POOL_MIN_FEEDS:
+            report.parser = ParsePool(conn, report)
+    try:
+        for category in categories:
+            update_feeds_by_category(conn, category, report, progress)
+    finally:
+        if report.parser:
+            report.parser.finish()
+
+# Fetch the feeds of several categories, within the refresh deadline
+def update_categories(conn, categories, stdscr):
+    if is_attached(conn):
+        fetch_now(conn, categories)
+        footerpop(stdscr, "Refresh queued in the daemon", 1, 0)
+        return
+    def progress(text):
+        footer(stdscr, text)
         stdscr.refresh()
-        mark_all_items_as(conn, feed[0],mark)
+    report = RefreshReport(conn)
+    refresh_categories(conn, categories, report, progress)
+    display_refresh_report(stdscr, report)
+
+def display_refresh_report(stdscr, report):
+    if not (report.failed or report.missed):
+        text = f"Fetched {report.fetched} feeds"
+        if report.skipped:
+            text += f", {report.skipped} failing feeds skipped"
+        footerpop(stdscr, text, 1, 0)
+        return
+    stdscr.clear()
+    header(stdscr, f"Refresh: {report.fetched} fetched, {len(report.failed)} failed, "
+                   f"{report.skipped} skipped, {report.missed} not fetched (deadline)")
+    height, width = stdscr.getmaxyx()
+    for i, (feed, error) in enumerate(report.failed[:height-2]):
+        stdscr.addstr(i+1, 0, f"{error:22.22} | {feed.name} <{feed.url}>"[:width-1])
+    footer(stdscr, "Press a key to go back...")
+    stdscr.refresh()
+    stdscr.getch()
+
+
+# Condition on feed_items for all feeds in a category
+def category_condition(category):
+    return ("feed_id IN (SELECT fc.feed_id FROM feed_categories fc "
+            "JOIN categories c ON fc.category_id = c.id WHERE c.name = ?)", [category])
+
+
+# 0 Unread : 1 Read
+def mark_items_as(conn, condition, params, mark, label):
+    """
+    Mark all feed items matching a condition, in one statement.
+    The change is recorded in the read journal, so it can be reverted with
+    undo_mark(). Up to READ_JOURNAL_IDS changed items are listed by id.
+    Larger changes store the condition, and the id ranges of the runs of
+    items it matched that all changed, which are few when the unread
+    items are mostly the newer ones.
+    Parameters:
+        conn: Database connection
+        condition: SQL condition on feed_items
+        params: Parameters of the condition
+        mark: 0 Unread : 1 Read
+        label: Description of the change, shown on undo
+    Returns:
+        Number of items changed
+    """
+    params = list(params)
+    cursor = conn.cursor()
+    with conn:
+        cursor.execute(f"SELECT COUNT(*) FROM feed_items WHERE is_read != ? AND ({condition})", [mark] + params)
+        changed = cursor.fetchone()[0]
+        if changed == 0:
+            return 0
+        if changed > READ_JOURNAL_IDS:
+            cursor.execute("INSERT INTO read_journal (created, label, mark, condition, params) VALUES (?, ?, ?, ?, ?)",
+                           (int(time.time()), label, mark, condition, json.dumps(params)))
+            journal_id = cursor.lastrowid
+            # The items of a run are as far apart among the matched items as among the changed ones
+            cursor.execute(f"""
+                INSERT INTO read_journal_ranges (journal_id, first_id, last_id)
+                SELECT ?, MIN(id), MAX(id) FROM (
+                    SELECT id, is_read != ? AS changes,
+                           ROW_NUMBER() OVER (ORDER BY id)
+                           - ROW_NUMBER() OVER (PARTITION BY is_read != ? ORDER BY id) AS run
+                    FROM feed_items WHERE {condition}
+                ) WHERE changes GROUP BY run
+            """, [journal_id, mark, mark] + params)
+        else:
+            cursor.execute("INSERT INTO read_journal (created, label, mark) VALUES (?, ?, ?)",
+                           (int(time.time()), label, mark))
+            journal_id = cursor.lastrowid
+            cursor.execute(f"""
+                INSERT INTO read_journal_items (journal_id, item_id)
+                SELECT ?, id FROM feed_items WHERE is_read != ? AND ({condition})
+            """, [journal_id, mark] + params)
+        cursor.execute(f"UPDATE feed_items SET is_read = ? WHERE is_read != ? AND ({condition})",
+                       [mark, mark] + params)
+        # Keep only the latest changes in the journal
+        for table in ("read_journal_items", "read_journal_ranges"):
+            cursor.execute(f"""
+                DELETE FROM {table} WHERE journal_id IN
+                (SELECT id FROM read_journal ORDER BY id DESC LIMIT -1 OFFSET ?)
+            """, (READ_JOURNAL_SIZE,))
+        cursor.execute("""
+            DELETE FROM read_journal WHERE id IN
+            (SELECT id FROM read_journal ORDER BY id DESC LIMIT -1 OFFSET ?)
+        """, (READ_JOURNAL_SIZE,))
+    data_changed()
+    log_event(f"{label}: {changed} items")
+    return changed
+
+
+# Revert the last bulk read state change
+@daemon_api("undo", notify=True)
+def undo_mark(conn):
+    """
+    Returns:
+        Tuple of (label, items restored) or None if the journal is empty
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, label, mark, condition, params FROM read_journal ORDER BY id DESC LIMIT 1")
+    last = cursor.fetchone()
+    if not last:
+        return None
+    journal_id, label, mark, condition, params = last
+    with conn:
+        if condition is None:
+            cursor.execute("""
+                UPDATE feed_items SET is_read = ?
+                WHERE id IN (SELECT item_id FROM read_journal_items WHERE journal_id = ?)
+            """, (1 - mark, journal_id))
+        else:
+            cursor.execute(f"""
+                UPDATE feed_items SET is_read = ?
+                WHERE id IN (SELECT fi.id FROM read_journal_ranges r
+                             JOIN feed_items fi ON fi.id BETWEEN r.first_id AND r.last_id
+                             WHERE r.journal_id = ?)
+                AND is_read = ? AND ({condition})
+            """, [1 - mark, journal_id, mark] + json.loads(params))
+        restored = cursor.rowcount
+        cursor.execute("DELETE FROM read_journal_items WHERE journal_id = ?", (journal_id,))
+        cursor.execute("DELETE FROM read_journal_ranges WHERE journal_id = ?", (journal_id,))
+        cursor.execute("DELETE FROM read_journal WHERE id = ?", (journal_id,))
+    data_changed()
+    log_event(f"Undo {label}: {restored} items")
+    return label, restored
+
+
+def undo_mark_pop(stdscr, conn):
+    undone = undo_mark(conn)
+    if undone:
+        footerpop(stdscr, f"Undone: {undone[0]} ({undone[1]} items)", 1)
+    else:
+        footerpop(stdscr, "Nothing to undo", 1)
+
+
+def mark_state(mark):
+    return "read" if mark else "unread"
+
+
+# 0 Unread : 1 Read
+@daemon_api("mark_feed", notify=True)
+def mark_all_items_as(conn, feed_id,mark):
+    return mark_items_as(conn, "feed_id = ?", [feed_id], mark, f"Feed marked as {mark_state(mark)}")
+
+# 0 Unread : 1 Read
+@daemon_api("mark_category", notify=True)
+def mark_category_as(conn,category,mark):
+    condition, params = category_condition(category)
+    return mark_items_as(conn, condition, params, mark, f"{category} marked as {mark_state(mark)}")
+
+# 0 Unread : 1 Read
+@daemon_api("mark_all", notify=True)
+def mark_everything_as(conn, mark):
+    return mark_items_as(conn, "1", [], mark, f"All items marked as {mark_state(mark)}")
+
+# Mark items older than a number of days as read
+@daemon_api("mark_older", notify=True)
+def mark_older_as_read(conn, days, category=None):
+    condition, params = "last_updated < ?", [int(time.time()) - days * 86400]
+    label = f"Items older than {days} days marked as read"
+    if category:
+        cat_condition, cat_params = category_condition(category)
+        condition += f" AND {cat_condition}"
+        params += cat_params
+        label = f"{category}: {label}"
+    return mark_items_as(conn, condition, params, 1, label)
+
+# Mark the items of a category search as read/unread
+@daemon_api("mark_search", notify=True)
+def mark_search_as(conn, category, search_text, search_where, mark):
+    condition, params = category_condition(category)
+    search, search_params = search_condition(search_text, search_where)
+    if search:
+        condition += f" AND {search}"
+        params += search_params
+    label = f"{category}" + (f" '{search_text}'" if search_text else "") + f" marked as {mark_state(mark)}"
+    return mark_items_as(conn, condition, params, mark, label)
 
 # Add a new feed to the CSV file
 def add_new_feed(stdscr, conn):
@@ -608,23 +2731,143 @@ def add_new_feed(stdscr, conn):
 
     try:
         # Add to CSV file
-        with open(feedfile, mode='a', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow([name, url, category, ""])
+        append_feeds_csv(feedfile, [[name, url, category, ""]])
         footerpop(stdscr, "Feed added successfully!")
         log_event(f"New feed added: {name} ({url})")
 
-        load_feeds_to_db(feedfile, conn)
+        sync_feeds(conn, feedfile)
 
     except Exception as e:
         footerpop(stdscr, f"Error adding feed: {str(e)}", 1)
-        log_event(f"Error adding feed: {str(e)}")
+        log_event(f"Error adding feed: {str(e)}", logging.ERROR)
         False
 
     curses.noecho()
     curses.curs_set(0)
     return True
 
+# Numbers for the statistics screen
+@daemon_api("stats")
+def fetch_stats(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM feeds")
+    feeds = cursor.fetchone()[0]
+    cursor.execute("SELECT COUNT(*), SUM(CASE WHEN is_read = 0 THEN 1 ELSE 0 END) FROM feed_items")
+    items, unread = cursor.fetchone()
+    cursor.execute("SELECT COUNT(*), SUM(size) FROM (SELECT DISTINCT hash, ext, size FROM resource_cache)")
+    files, cached = cursor.fetchone()
+    hits, misses = query_cache.hits, query_cache.misses
+    return [
+        ("Database", format_file_size(os.path.getsize(database))),
+        ("Feeds", feeds),
+        ("Items", items),
+        ("Unread items", unread or 0),
+        ("Failing feeds skipped", len(backed_off_feeds(conn))),
+        ("Query cache entries", f"{len(query_cache.entries)} / {query_cache.size}"),
+        ("Query cache hits", hits),
+        ("Query cache misses", misses),
+        ("Query cache hit rate", f"{100 * hits / max(1, hits + misses):.1f}%"),
+        ("Rendered entries cached", f"{len(render_cache.entries)} / {render_cache.size}"),
+        ("Offline cache", f"{files} files, {format_file_size(cached or 0)} / {cache_size} MB"),
+    ]
+
+
+def display_stats(stdscr, conn):
+    stdscr.clear()
+    header(stdscr, "Statistics" + (" (daemon)" if is_attached(conn) else ""))
+    for i, (name, value) in enumerate(fetch_stats(conn)):
+        stdscr.addstr(i + 2, 0, f"{name:>24}: {value}")
+    footer(stdscr, "Press a key to go back...")
+    stdscr.refresh()
+    stdscr.getch()  # Wait for user input before returning
+
+
+# Read the end of the log file, as (level, line), so its size doesn't matter
+def read_log_tail(filename, size=LOG_TAIL_BYTES):
+    try:
+        with open(filename, "rb") as file:
+            end = file.seek(0, os.SEEK_END)
+            file.seek(max(0, end - size))
+            data = file.read()
+    except OSError:
+        return []
+    if end > size:
+        data = data[data.find(b"\n") + 1:]  # The first line is cut
+    entries = []
+    level = LOG_LEVELS[0]
+    for line in data.decode("utf-8", "replace").splitlines():
+        parts = line.split(" - ", 2)
+        if len(parts) == 3 and parts[1] in LOG_LEVELS:
+            level = parts[1]
+        entries.append((level, line))  # Lines of a traceback keep the level of their event
+    return entries
+
+
+# Follow the log file, filtered by level and by a feed name or URL
+def display_log(stdscr):
+    min_level = 0
+    feed_filter = ""
+    follow = True
+    top = 0
+    state = None
+    entries = []
+    stdscr.timeout(1000)  # Check the file for new lines every second
+    try:
+        while True:
+            try:
+                stat = os.stat(logfile)
+                current = (stat.st_size, stat.st_mtime)
+            except OSError:
+                current = None
+            if current != state:
+                state = current
+                entries = read_log_tail(logfile)
+            lines = [(level, line) for level, line in entries
+                     if LOG_LEVELS.index(level) >= min_level and feed_filter.lower() in line.lower()]
+            rows = curses.LINES - 2
+            if follow:
+                top = max(0, len(lines) - rows)
+            stdscr.clear()
+            header(stdscr, f": Log [Level: {LOG_LEVELS[min_level]}+] [Feed: {feed_filter or 'all'}]")
+            width = maxlength(stdscr)
+            for i, (level, line) in enumerate(lines[top:top + rows]):
+                attr = curses.color_pair(1) | curses.A_BOLD if level != "INFO" else curses.color_pair(1)
+                stdscr.addstr(i + 1, 0, line[:width - 1], attr)
+            footer(stdscr, "ESC:Back | l:Level | /:Feed filter | End:Follow")
+            stdscr.refresh()
+
+            key = stdscr.getch()
+            if key == 27 or key == curses.KEY_LEFT:
+                break
+            elif key == ord("q"):
+                exit(0)
+            elif key == curses.KEY_UP and top > 0:
+                top -= 1
+                follow = False
+            elif key == curses.KEY_DOWN and top < len(lines) - rows:
+                top += 1
+            elif key == curses.KEY_PPAGE:
+                top = max(0, top - rows)
+                follow = False
+            elif key == curses.KEY_NPAGE:
+                top = max(0, min(len(lines) - rows, top + rows))
+            elif key == curses.KEY_HOME:
+                top = 0
+                follow = False
+            elif key == curses.KEY_END:
+                follow = True
+            elif key == ord("l"):
+                min_level = (min_level + 1) % len(LOG_LEVELS)
+            elif key == ord("/"):
+                stdscr.timeout(-1)
+                feed_filter = prompt(stdscr, "Feed name or URL (empty for all): ")
+                stdscr.timeout(1000)
+            if top >= len(lines) - rows:
+                follow = True
+    finally:
+        stdscr.timeout(-1)
+
+
 # Function to display help information
 def display_help_categories(stdscr):
     stdscr.clear()
@@ -640,16 +2883,26 @@ def display_help_categories(stdscr):
         "u: Mark Category as Unread\n"
         "o: Change Sort Order (Name, ID, Unread count)\n"
         "O: Export feeds to OPML file\n"
+        "I: Import feeds from OPML file\n"
+        "i: Statistics and cache information\n"
+        "P: Prefetch links/images of unread items, for offline reading\n"
         "R: Mark All Categories as read\n"
         "U: Mark All Categories as unread\n"
+        "D: Mark items older than N days as read\n"
+        "z: Undo last mark as read/unread\n"
         "e: Edit Feeds with text editor\n"
         "s: Speak Text Menu\n"
         "x: Stop Speaking\n"
+        "[/]: Speak previous/next sentence\n"
         "/: Search Categories for Text\n"
-        "l: Watch log file, if Exists, with External Editor\n"
+        "l: Log, filtered by level and feed\n"
         "!: Delete Database file. Reopen the Program!\n"
         "#: Clear Database from Feeds, that don't Exist in Feeds File\n"
         "TAB: Browse Category\n"
+        "v: Views: All unread, Last 24h, Starred, Folders of the rules\n"
+        "t: Tags, browse by one tag or by all/any of several\n"
+        "n: Download the new episodes (enclosures of unread items) of the category\n"
+        "d: Downloads queue\n"
     )
     stdscr.addstr(1, 0, help_text)
     footer(stdscr,"Press a key to go back...")
@@ -667,10 +2920,16 @@ def display_help_feed_items(stdscr):
         "q: Quit\n"
         "r: Mark Feed as read\n"
         "u: Mark Feed as unread\n"
+        "R: Mark all listed items as read\n"
+        "U: Mark all listed items as unread\n"
+        "z: Undo last mark of all items\n"
+        "*: Star/Unstar item\n"
+        "E: Export listed items to mbox, Maildir or HTML (category)\n"
         "t: Sort by Title\n"
         "d: Sort by Date\n"
         "s: Speak Text Menu\n"
         "x: Stop Speaking\n"
+        "[/]: Speak previous/next sentence\n"
         "PgDn: Scroll Down\n"
         "PgUp: Scroll Up\n"
         "h: Help\n"
@@ -691,6 +2950,7 @@ def display_help_entry(stdscr):
         "ESC/Left: Back\n"
         "q: Quit\n"
         "e: Export to text file\n"
+        "*: Star/Unstar\n"
         "o: Open Link in Browser\n"
         "1: Copy Title to clipboard\n"
         "2: Copy Link to clipboard\n"
@@ -698,6 +2958,7 @@ def display_help_entry(stdscr):
         "4: Copy Content to clipboard\n"
         "s: Speak Text Menu\n"
         "x: Stop Speaking\n"
+        "[/]: Speak previous/next sentence\n"
         "h: Help\n"
     )
     stdscr.addstr(1, 0, help_text)
@@ -717,9 +2978,11 @@ def display_help_feeds(stdscr):
         "f: Update Feed\n"
         "r: Mark Feed as read\n"
         "u: Mark Feed as unread\n"
+        "z: Undo last mark as read/unread\n"
         "o: Change Sort Order (Name, ID, Unread count...)\n"
         "s: Speak Text Menu\n"
         "x: Stop Speaking\n"
+        "[/]: Speak previous/next sentence\n"
         "PgDn: Scroll Down\n"
         "PgUp: Scroll Up\n"
         "h: Help\n"
@@ -783,8 +3046,7 @@ def display_categories(stdscr, conn):
 
     if FETCHONLOAD:
         FETCHONLOAD = False
-        for cat in categories:
-            update_feeds_by_category(conn, cat[0], stdscr)
+        update_categories(conn, [cat.name for cat in categories], stdscr)
 
     while True:
         max_display = curses.LINES - 2  # Maximum number of categories to display
@@ -793,14 +3055,14 @@ def display_categories(stdscr, conn):
 
         # Display categories within the current view
         for i in range(start_index, min(start_index + max_display, len(categories))):
-            total = get_feed_item_counts_by_category(conn, categories[i][1])
+            total = get_feed_item_counts_by_category(conn, categories[i].id)
             
             #print(total)
             #stdscr.getch()
             
             all_items = total[0] if total and total[0] is not None else 0  # Default to 0 if None
             unread = total[1] if total and total[1] is not None else 0  # Default to 0 if None
-            line = f"> {unread:5} | {all_items:5} | {categories[i][0]}" if i == current_category else f"  {unread:5} | {all_items:5} | {categories[i][0]}"
+            line = f"> {unread:5} | {all_items:5} | {categories[i].name}" if i == current_category else f"  {unread:5} | {all_items:5} | {categories[i].name}"
             if unread > 0:
                 stdscr.addstr(i - start_index + 1, 0, line, curses.color_pair(1) | curses.A_BOLD)
             else:
@@ -838,16 +3100,19 @@ def display_categories(stdscr, conn):
             current_category = len(categories) - 1  # Scroll to the end
             start_index = max(0, len(categories) - max_display)
         elif key == ord("\n") or key == curses.KEY_RIGHT:  # Enter key
-            display_feeds(stdscr, conn, categories[current_category][0])
+            display_feeds(stdscr, conn, categories[current_category].name)
         elif key == 9:  # TAB Key
-            display_category_feed_items(stdscr, conn, categories[current_category][0])
+            display_category_feed_items(stdscr, conn, categories[current_category].name)
+        elif key == ord("v"):  # Smart views
+            choose_view(stdscr, conn)
+        elif key == ord("t"):
+            display_tags(stdscr, conn)
         elif key == ord("/"):
-            search_category(stdscr, conn, categories[current_category][0])
+            search_category(stdscr, conn, categories[current_category].name)
         elif key == ord("f"):  # Fetch one category
-            update_feeds_by_category(conn, categories[current_category][0], stdscr)
+            update_categories(conn, [categories[current_category].name], stdscr)
         elif key == ord("F"):  # Update All Categories
-            for cat in categories:
-                update_feeds_by_category(conn, cat[0], stdscr)
+            update_categories(conn, [cat.name for cat in categories], stdscr)
         elif key == ord("q") or key == curses.KEY_LEFT or key == 27:
             break
         elif key == ord("a"):
@@ -856,48 +3121,82 @@ def display_categories(stdscr, conn):
                 current_category = 0
                 start_index = 0
         elif key == ord("r"):  # Mark Category as read
-            mark_category_as(conn, categories[current_category][0], stdscr, 1)
+            mark_category_as(conn, categories[current_category].name, 1)
         elif key == ord("u"):  # Mark Category as unread
-            mark_category_as(conn, categories[current_category][0], stdscr, 0)
+            mark_category_as(conn, categories[current_category].name, 0)
         elif key == ord("R"):  # Mark All Categories as read
-            for cat in categories:
-                mark_category_as(conn, cat[0], stdscr, 1)
+            mark_everything_as(conn, 1)
         elif key == ord("U"):  # Mark All Categories as unread
-            for cat in categories:
-                mark_category_as(conn, cat[0], stdscr, 0)
+            mark_everything_as(conn, 0)
+        elif key == ord("D"):  # Mark old items as read
+            days = prompt(stdscr, "Mark as read, items older than days: ")
+            if days.isdigit():
+                count = mark_older_as_read(conn, int(days))
+                footerpop(stdscr, f"{count} items marked as read")
+        elif key == ord("z"):  # Undo last mark
+            undo_mark_pop(stdscr, conn)
         elif key == ord("h"):  # Help key
             display_help_categories(stdscr)
         elif key == ord("!"):
-            delete_database_file(stdscr)
+            if not local_only(stdscr, conn):
+                delete_database_file(stdscr)
         elif key == ord("%"):
-            clean_database(stdscr)
+            if not local_only(stdscr, conn):
+                clean_database(stdscr)
         elif key == ord("#"):
             clear_feeds_not_in_csv(stdscr,conn,feedfile)
+            categories = fetch_categories(conn,orderi)
+            current_category = 0
+            start_index = 0
         elif key == ord("e"):
             os.system(f"xterm {xterm} -e {editor} {feedfile}")
+            if sync_feeds(conn, feedfile):
+                categories = fetch_categories(conn,orderi)
+                current_category = 0
+                start_index = 0
         elif key == ord("l"):
-            os.system(f"xterm {xterm} -e {editor} {logfile}")
+            display_log(stdscr)
         elif key == ord("o"):
             orderi += 1
             if orderi > 3: orderi = 1
             categories = fetch_categories(conn,orderi)
         elif key == ord("x"):
             tts.stop()
+        elif key in (ord("["), ord("]")):
+            tts.skip(1 if key == ord("]") else -1)
         elif key == ord("s"): 
             height, width = stdscr.getmaxyx()
-            stdscr.addstr(height-1, 0, str("Speak: [T]itle [C]ancel").ljust(width-1), curses.color_pair(4) | curses.A_BOLD)
+            stdscr.addstr(height-1, 0, str("Speak: [T]itle [U]nread titles [C]ancel").ljust(width-1), curses.color_pair(4) | curses.A_BOLD)
             key = stdscr.getch()
             if key == ord("t"):
-                tts.speak(categories[current_category][0])
+                tts.speak(categories[current_category].name)
+            elif key == ord("u"):
+                speak_unread_titles(conn, categories[current_category].name)
             elif key == ord("c"):
                 pass
+        elif key == ord("P"):  # Prefetch links of unread items
+            prefetch_category(stdscr, conn, categories[current_category].name)
+        elif key == ord("n"):
+            queue_episodes_pop(stdscr, conn, categories[current_category].name)
+        elif key == ord("d"):
+            display_downloads(stdscr, conn)
         elif key == ord("O"):  # Capital O for OPML export
-            export_opml(stdscr, conn)
+            if not local_only(stdscr, conn):
+                export_opml(stdscr, conn)
+        elif key == ord("i"):
+            display_stats(stdscr, conn)
+        elif key == ord("I"):  # Capital I for OPML import
+            if import_opml_prompt(stdscr, conn):
+                categories = fetch_categories(conn,orderi)
+                current_category = 0
+                start_index = 0
 
 def header(stdscr,text):
     global database
     height, width = stdscr.getmaxyx()
     db_size = f"DB:{format_file_size(os.path.getsize(database))}"
+    if daemon_client and daemon_client.version:
+        db_size = f"[{daemon_client.version} updates] {db_size}"
     stdscr.addstr(0,0," "*(width-1), curses.color_pair(2) | curses.A_BOLD)
     stdscr.addstr(0, 0, text[:width-1], curses.color_pair(2) | curses.A_BOLD)
     stdscr.addstr(0,width-len(db_size)-1,db_size, curses.color_pair(2) | curses.A_BOLD)
@@ -950,11 +3249,11 @@ def display_feeds(stdscr, conn, category):
 
         # Display the feeds with pagination
         for i in range(start_index, min(start_index + max_display, len(feeds))):
-            total_items, total_unread = get_feed_item_counts_by_feed(conn, feeds[i][0])
+            total_items, total_unread = get_feed_item_counts_by_feed(conn, feeds[i].id)
             total_items = total_items if total_items is not None else 0
             total_unread = total_unread if total_unread is not None else 0
             
-            text = f" {total_unread:5} | {total_items:5} | {feeds[i][1]}"
+            text = f" {total_unread:5} | {total_items:5} | {feeds[i].name}"
             if i == current_feed:
                 text = ">" + text
             else:
@@ -1001,7 +3300,14 @@ def display_feeds(stdscr, conn, category):
             display_feed_items(stdscr, conn, feeds[current_feed], category)
         elif key == ord('f'):
             footer(stdscr, "Fetching Feed...")
-            update_feed_items(stdscr,conn, feeds[current_feed])
+            stdscr.refresh()
+            if is_attached(conn):
+                fetch_now(conn, feed_ids=[feeds[current_feed].id])
+                error = None
+            else:
+                error = update_feed_items(conn, feeds[current_feed])
+            if error:
+                footerpop(stdscr, f"Failed to retrieve: {feeds[current_feed].url} {error}", 2, 1)
         elif key == 27 or key == curses.KEY_LEFT:  # ESC key
             break
         elif key == ord("q") or key == 27:
@@ -1014,23 +3320,27 @@ def display_feeds(stdscr, conn, category):
         elif key == ord("h"):
             display_help_feeds(stdscr)
         elif key == ord("r"):
-            mark_all_items_as(conn, feeds[current_feed][0],1)
+            mark_all_items_as(conn, feeds[current_feed].id,1)
         elif key == ord("u"):
-            mark_all_items_as(conn, feeds[current_feed][0],0)
+            mark_all_items_as(conn, feeds[current_feed].id,0)
+        elif key == ord("z"):  # Undo last mark
+            undo_mark_pop(stdscr, conn)
         elif key == ord("x"):
             tts.stop()
+        elif key in (ord("["), ord("]")):
+            tts.skip(1 if key == ord("]") else -1)
         elif key == ord("s"):
             height, width = stdscr.getmaxyx()
             stdscr.addstr(height-1, 0, str("Speak: [T]itle [C]ancel").ljust(width-1), curses.color_pair(4) | curses.A_BOLD)
             key = stdscr.getch()
             if key == ord("t"):
-                tts.speak(feeds[current_feed][1])
+                tts.speak(feeds[current_feed].name)
             elif key == ord("c"):
                 pass
 
 # Function to display feed items
 def display_feed_items(stdscr, conn, feed,category=""):
-    feed_items = fetch_feed_items(conn, feed[0])
+    feed_items = fetch_feed_items(conn, feed.id)
     current_item = 0
     start_index = 0  # Track the starting index for display
 
@@ -1041,24 +3351,24 @@ def display_feed_items(stdscr, conn, feed,category=""):
     
     while True:
         stdscr.clear()
-        unread_count = sum(1 for item in feed_items if not item[3])  # Count unread items
-        header(stdscr, f": {category} : {feed[1]} [Unread : {unread_count}]")
+        unread_count = sum(1 for item in feed_items if not item.is_read)  # Count unread items
+        header(stdscr, f": {category} : {feed.name} [Unread : {unread_count}]")
         max_display = curses.LINES - 2  # Maximum number of items to display
         max_length = maxlength(stdscr) - 1  # Leave space for cursor
        
         # Display the feed items with proper length handling
         if feed_items:
             for i in range(start_index, min(start_index + max_display, len(feed_items))):
-                title = feed_items[i][1][:max_length - 3]  # Reserve space for status
-                last_updated = time.strftime('%Y-%m-%d', time.localtime(feed_items[i][4]))  # Format last updated timestamp
+                title = feed_items[i].title[:max_length - 3]  # Reserve space for status
+                last_updated = time.strftime('%Y-%m-%d', time.localtime(feed_items[i].last_updated))  # Format last updated timestamp
                 display_str = f"> {last_updated} | {title}" if i == current_item else f"  {last_updated} | {title}"
                 try:
-                    if feed_items[i][3]==1:
+                    if feed_items[i].is_read==1:
                         stdscr.addstr(i - start_index + 1, 0, display_str[:max_length-2],curses.color_pair(1))  
                     else:
                         stdscr.addstr(i - start_index + 1, 0, display_str[:max_length-2],curses.color_pair(1)|curses.A_BOLD)  
                 except:
-                    stdscr.addstr(i - start_index + 1, 0, f"Error {feed_items[i][2]}")  
+                    stdscr.addstr(i - start_index + 1, 0, f"Error {feed_items[i].id}")  
         
         footer(stdscr, "q:quit | Enter:Select | ESC:Back | h:help")
         stdscr.refresh()
@@ -1087,23 +3397,33 @@ def display_feed_items(stdscr, conn, feed,category=""):
                 current_item = min(len(feed_items) - 1, current_item + max_display)
         elif key == ord("\n") or key == curses.KEY_RIGHT:  # Enter key
             if len(feed_items) > 0:
-                mark_item_as_read(conn, feed_items[current_item][0])
+                mark_item_as_read(conn, feed_items[current_item].id)
+                prerender_neighbours(stdscr, feed_items, current_item)
                 display_feed_entry(stdscr, conn, feed_items[current_item])
-                feed_items = fetch_feed_items(conn, feed[0])
+                feed_items = fetch_feed_items(conn, feed.id)
         elif key == 27 or key == curses.KEY_LEFT:  # ESC key
             break
         elif key == ord("q"):
             exit(0)
         elif key == ord("d"):
-            feed_items = fetch_feed_items(conn, feed[0])
+            feed_items = fetch_feed_items(conn, feed.id)
         elif key == ord("t"):
-            feed_items = fetch_feed_items(conn, feed[0], 2)
+            feed_items = fetch_feed_items(conn, feed.id, 2)
         elif key == ord("r"):  # Mark Category as read
-            mark_item_as_read(conn, feed_items[current_item][0])
-            feed_items = fetch_feed_items(conn, feed[0])
+            mark_item_as_read(conn, feed_items[current_item].id)
+            feed_items = fetch_feed_items(conn, feed.id)
         elif key == ord("u"):  # Mark Category as unread
-            mark_item_as_read(conn, feed_items[current_item][0],0)
-            feed_items = fetch_feed_items(conn, feed[0])
+            mark_item_as_read(conn, feed_items[current_item].id,0)
+            feed_items = fetch_feed_items(conn, feed.id)
+        elif key == ord("R") or key == ord("U"):  # Mark all items of the feed
+            mark_all_items_as(conn, feed.id, 1 if key == ord("R") else 0)
+            feed_items = fetch_feed_items(conn, feed.id)
+        elif key == ord("z"):  # Undo last mark
+            undo_mark_pop(stdscr, conn)
+            feed_items = fetch_feed_items(conn, feed.id)
+        elif key == ord("*"):
+            if feed_items:
+                toggle_star_pop(stdscr, conn, feed_items[current_item].id)
         elif key == ord("h"):
             display_help_feed_items(stdscr)
         elif key == curses.KEY_HOME:  # Home key
@@ -1114,18 +3434,43 @@ def display_feed_items(stdscr, conn, feed,category=""):
             start_index = max(0, len(feed_items) - max_display)  # Adjust start index if needed
         elif key == ord("x"):
             tts.stop()
+        elif key in (ord("["), ord("]")):
+            tts.skip(1 if key == ord("]") else -1)
         elif key == ord("s"):
             height, width = stdscr.getmaxyx()
             stdscr.addstr(height-1, 0, str("Speak: [T]itle c[A]tegory [C]ancel").ljust(width-1), curses.color_pair(4) | curses.A_BOLD)
             key = stdscr.getch()
             if key == ord("t"):
-                tts.speak(feed_items[current_item][1])
+                tts.speak(feed_items[current_item].title)
             elif key == ord("a"):
-                tts.speak(feed[1])
+                tts.speak(feed.name)
             elif key == ord("c"):
                 pass
 
 
+# Search condition on feed_items
+def search_condition(search_text, search_where='all', prefix=""):
+    """
+    Build the SQL condition for a text search
+    Parameters:
+        search_text: Text to search for, None or empty for no condition
+        search_where: Where to search ('all', 'title', 'content', 'summary')
+        prefix: Table alias prefix of the columns, like "fi."
+    Returns:
+        Tuple of (SQL condition or "", list of parameters)
+    """
+    if not search_text:
+        return "", []
+    search_text = f"%{search_text}%"  # Add wildcards for LIKE query
+    if search_where in ('title', 'content', 'summary'):
+        return f"{prefix}{search_where} LIKE ?", [search_text]
+    # 'all' - search in title, content, and summary
+    return (f"({prefix}title LIKE ? OR {prefix}content LIKE ? OR {prefix}summary LIKE ?)",
+            [search_text] * 3)
+
+
+@daemon_api("search", record=ItemRecord)
+@cached_query
 def get_feed_items_bycategory(conn, category, search_text=None, search_where='all'):
     """
     Get feed items by category with optional search functionality
@@ -1135,13 +3480,13 @@ def get_feed_items_bycategory(conn, category, search_text=None, search_where='al
         search_text: Optional text to search for
         search_where: Where to search ('all', 'title', 'content', 'summary')
     Returns:
-        List of feed items matching the criteria
+        List of ItemRecord matching the criteria
     """
     cursor = conn.cursor()
+    cursor.row_factory = ItemRecord.from_row
     
     # Base SQL query
-    sql = """SELECT fi.id, fi.title, fi.summary, fi.is_read, fi.last_updated, fi.created, fi.link,
-             f.name as feed_name
+    sql = f"""SELECT {ITEM_COLUMNS}
              FROM feed_items fi
              JOIN feeds f ON fi.feed_id = f.id
              JOIN feed_categories fc ON f.id = fc.feed_id
@@ -1151,24 +3496,10 @@ def get_feed_items_bycategory(conn, category, search_text=None, search_where='al
     params = [category]
     
     # Add search conditions if search_text is provided
-    if search_text:
-        search_text = f"%{search_text}%"  # Add wildcards for LIKE query
-        if search_where == 'title':
-            sql += " AND fi.title LIKE ?"
-            params.append(search_text)
-        elif search_where == 'content':
-            sql += " AND fi.content LIKE ?"
-            params.append(search_text)
-        elif search_where == 'summary':
-            sql += " AND fi.summary LIKE ?"
-            params.append(search_text)
-        else:  # 'all' - search in title, content, and summary
-            sql += """ AND (
-                fi.title LIKE ? OR 
-                fi.content LIKE ? OR 
-                fi.summary LIKE ?
-            )"""
-            params.extend([search_text] * 3)
+    search, search_params = search_condition(search_text, search_where, "fi.")
+    if search:
+        sql += f" AND {search}"
+        params.extend(search_params)
     
     # Add ordering
     sql += " ORDER BY fi.last_updated DESC"
@@ -1176,6 +3507,11 @@ def get_feed_items_bycategory(conn, category, search_text=None, search_where='al
     cursor.execute(sql, params)
     return cursor.fetchall()
 
+# Read out the titles of the unread items of a category, newest first
+def speak_unread_titles(conn, category):
+    tts.play([item.title for item in get_feed_items_bycategory(conn, category) if not item.is_read])
+
+
 # Display Feed items by category
 def display_category_feed_items(stdscr, conn, category="", search_text=None, search_where='all'):
     feed_items = get_feed_items_bycategory(conn,category, search_text,search_where)
@@ -1184,26 +3520,26 @@ def display_category_feed_items(stdscr, conn, category="", search_text=None, sea
     
     while True:
         stdscr.clear()
-        unread_count = sum(1 for item in feed_items if not item[3])  # Count unread items
+        unread_count = sum(1 for item in feed_items if not item.is_read)  # Count unread items
         header(stdscr, f": {category} [Unread : {unread_count}]")
-        #header(stdscr, f": {category} : {feed[1]} [Unread : {unread_count}]")
+        #header(stdscr, f": {category} : {feed.name} [Unread : {unread_count}]")
         max_display = curses.LINES - 2  # Maximum number of items to display
         max_length = maxlength(stdscr) - 1  # Leave space for cursor
        
         # Display the feed items with proper length handling
         if feed_items:
             for i in range(start_index, min(start_index + max_display, len(feed_items))):
-                title = feed_items[i][1][:max_length - 20]  # Reserve space for status
-                feedname = feed_items[i][7][:15]
-                last_updated = time.strftime('%Y-%m-%d', time.localtime(feed_items[i][4]))  # Format last updated timestamp
+                title = feed_items[i].title[:max_length - 20]  # Reserve space for status
+                feedname = feed_items[i].feed_name[:15]
+                last_updated = time.strftime('%Y-%m-%d', time.localtime(feed_items[i].last_updated))  # Format last updated timestamp
                 display_str = f"> {last_updated} | {feedname:15} | {title}" if i == current_item else f"  {last_updated} | {feedname:15} | {title}"
                 try:
-                    if feed_items[i][3]==1:
+                    if feed_items[i].is_read==1:
                         stdscr.addstr(i - start_index + 1, 0, display_str[:max_length-2],curses.color_pair(1))  
                     else:
                         stdscr.addstr(i - start_index + 1, 0, display_str[:max_length-2],curses.color_pair(1)|curses.A_BOLD)  
                 except:
-                    stdscr.addstr(i - start_index + 1, 0, f"Error {feed_items[i][2]}")  
+                    stdscr.addstr(i - start_index + 1, 0, f"Error {feed_items[i].id}")  
         
         footer(stdscr, "q:quit | Enter:Select | ESC:Back | h:help")
         stdscr.refresh()
@@ -1232,7 +3568,8 @@ def display_category_feed_items(stdscr, conn, category="", search_text=None, sea
                 current_item = min(len(feed_items) - 1, current_item + max_display)
         elif key == ord("\n") or key == curses.KEY_RIGHT:  # Enter key
             if len(feed_items) > 0:
-                mark_item_as_read(conn, feed_items[current_item][0])
+                mark_item_as_read(conn, feed_items[current_item].id)
+                prerender_neighbours(stdscr, feed_items, current_item)
                 display_feed_entry(stdscr, conn, feed_items[current_item])
                 feed_items = get_feed_items_bycategory(conn,category,search_text,search_where)
         elif key == 27 or key == curses.KEY_LEFT:  # ESC key
@@ -1240,11 +3577,22 @@ def display_category_feed_items(stdscr, conn, category="", search_text=None, sea
         elif key == ord("q"):
             exit(0)
         elif key == ord("r"):  # Mark Category as read
-            mark_item_as_read(conn, feed_items[current_item][0])
+            mark_item_as_read(conn, feed_items[current_item].id)
             feed_items = get_feed_items_bycategory(conn,category,search_text,search_where)
         elif key == ord("u"):  # Mark Category as unread
-            mark_item_as_read(conn, feed_items[current_item][0],0)
+            mark_item_as_read(conn, feed_items[current_item].id,0)
+            feed_items = get_feed_items_bycategory(conn,category,search_text,search_where)
+        elif key == ord("R") or key == ord("U"):  # Mark all listed items
+            mark_search_as(conn, category, search_text, search_where, 1 if key == ord("R") else 0)
+            feed_items = get_feed_items_bycategory(conn,category,search_text,search_where)
+        elif key == ord("z"):  # Undo last mark
+            undo_mark_pop(stdscr, conn)
             feed_items = get_feed_items_bycategory(conn,category,search_text,search_where)
+        elif key == ord("*"):
+            if feed_items:
+                toggle_star_pop(stdscr, conn, feed_items[current_item].id)
+        elif key == ord("E"):
+            export_archive_prompt(stdscr, conn, category, search_text, search_where)
         elif key == ord("h"):
             display_help_feed_items(stdscr)
         elif key == curses.KEY_HOME:  # Home key
@@ -1255,36 +3603,375 @@ def display_category_feed_items(stdscr, conn, category="", search_text=None, sea
             start_index = max(0, len(feed_items) - max_display)  # Adjust start index if needed        
         elif key == ord("x"):
             tts.stop()
+        elif key in (ord("["), ord("]")):
+            tts.skip(1 if key == ord("]") else -1)
         elif key == ord("s"): 
             height, width = stdscr.getmaxyx()
-            stdscr.addstr(height-1, 0, str("Speak: [T]itle [C]ancel").ljust(width-1), curses.color_pair(4) | curses.A_BOLD)
+            stdscr.addstr(height-1, 0, str("Speak: [T]itle [U]nread titles [C]ancel").ljust(width-1), curses.color_pair(4) | curses.A_BOLD)
             key = stdscr.getch()
             if key == ord("t"):
-                tts.speak(feed_items[current_item][1])
+                tts.speak(feed_items[current_item].title)
+            elif key == ord("u"):
+                speak_unread_titles(conn, category)
             elif key == ord("c"):
                 pass
 
-# Function to mark an item as read
-def mark_item_as_read(conn, item_id,read=1):
-    cursor = conn.cursor()
-    cursor.execute("UPDATE feed_items SET is_read = ? WHERE id = ?", (read,item_id,))
-    conn.commit()
-
-# Function to display a single feed entry
-def display_feed_entry(stdscr, conn, feed_item):
-    global browser,media,xterm
+# Title, texts and date of an item
+@daemon_api("texts")
+def fetch_item_texts(conn, item_id):
     cursor = conn.cursor()
-    cursor.execute("SELECT title, summary, content, last_updated FROM feed_items WHERE id = ?", (feed_item[0],))
-    title, summary, content, last_updated = cursor.fetchone()
+    cursor.execute("SELECT title, summary, content, last_updated FROM feed_items WHERE id = ?", (item_id,))
+    return cursor.fetchone()
 
-    if not content:
-        content = summary
-    # Format the date
-    formatted_date = time.strftime('%Y-%m-%d', time.localtime(last_updated))
-    # Assuming the link is stored in the feed_item, you may need to adjust this based on your actual data structure
-    link = feed_item[6]  # Adjust this if the link is stored differently
 
-    soup = BeautifulSoup(content, "html.parser")
+# Smart views across all categories: name -> (title, condition, parameters)
+def view_condition(view):
+    if view == "unread":
+        return "All unread", "fi.is_read = 0", []
+    if view == "recent":
+        return "Last 24h", "fi.last_updated >= ?", [int(time.time()) - 86400]
+    if view.startswith("search:"):
+        return (f"Search: {view[7:]}",
+                "fi.id IN (SELECT item_id FROM saved_search_items WHERE search = ?)", [view[7:]])
+    if view.startswith("tags:"):
+        return tags_condition(view)
+    return "Starred", "fi.starred = 1", []
+
+
+# View of the items with all or any of some tags: 'tags:all:' or 'tags:any:' and the names, one per line
+def tags_view(names, match_all):
+    return ("tags:all:" if match_all else "tags:any:") + "\n".join(names)
+
+
+# Items tagged through their feed or by the rules, with indexed lookups of the tags
+def tags_condition(view):
+    mode, _, names = view[5:].partition(":")
+    names = names.split("\n")
+    tagged = ("(fi.feed_id IN (SELECT ft.feed_id FROM feed_tags ft JOIN tags t ON ft.tag_id = t.id "
+              "WHERE t.name {0}) OR fi.id IN (SELECT it.item_id FROM item_tags it "
+              "JOIN tags t ON it.tag_id = t.id WHERE t.name {0}))")
+    if mode == "all":
+        condition = " AND ".join(tagged.format("= ?") for _ in names)
+        params = [name for name in names for _ in range(2)]
+        return "Tags: " + " & ".join(names), condition, params
+    condition = tagged.format(f"IN ({', '.join('?' * len(names))})")
+    return "Tags: " + " | ".join(names), condition, names + names
+
+
+# Tags with their feed, item and unread counts
+@daemon_api("tags", record=TagRecord)
+@cached_query
+def fetch_tags(conn):
+    """
+    Items are counted once per feed, like the categories, and items tagged
+    by the rules are added unless their feed has the same tag.
+    Returns:
+        List of TagRecord, ordered by name
+    """
+    cursor = conn.cursor()
+    cursor.row_factory = TagRecord.from_row
+    cursor.execute("""
+        WITH feed_counts AS (
+            SELECT feed_id, COUNT(*) AS items, SUM(is_read = 0) AS unread
+            FROM feed_items GROUP BY feed_id
+        ), tagged AS (
+            SELECT ft.tag_id, fc.items, fc.unread
+            FROM feed_tags ft JOIN feed_counts fc ON fc.feed_id = ft.feed_id
+            UNION ALL
+            SELECT it.tag_id, 1, fi.is_read = 0
+            FROM item_tags it JOIN feed_items fi ON fi.id = it.item_id
+            WHERE NOT EXISTS (SELECT 1 FROM feed_tags ft WHERE ft.tag_id = it.tag_id AND ft.feed_id = fi.feed_id)
+        )
+        SELECT t.id, t.name, (SELECT COUNT(*) FROM feed_tags WHERE tag_id = t.id),
+               COALESCE(SUM(tagged.items), 0), COALESCE(SUM(tagged.unread), 0)
+        FROM tags t
+        LEFT JOIN tagged ON tagged.tag_id = t.id
+        GROUP BY t.id
+        ORDER BY t.name
+    """)
+    return cursor.fetchall()
+
+
+# Browse the tags, and open the items of one tag, or of all or any of the selected ones
+def display_tags(stdscr, conn):
+    current = 0
+    start_index = 0
+    selected = []
+    match_all = True
+    while True:
+        tags = fetch_tags(conn)
+        current = min(current, max(0, len(tags) - 1))
+        max_display = curses.LINES - 2
+        stdscr.clear()
+        mode = "all" if match_all else "any"
+        header(stdscr, f": Tags [{len(tags)}] [Selected: {len(selected)}, match {mode}]")
+        if not tags:
+            stdscr.addstr(2, 2, "No tags. Add them to the Tags column of the feeds file, separated by ';'")
+        for i in range(start_index, min(start_index + max_display, len(tags))):
+            tag = tags[i]
+            mark = "+" if tag.name in selected else " "
+            display_str = f"{mark}{tag.unread:>6} | {tag.items:>6} | {tag.feeds:>4} feeds | {tag.name}"
+            display_str = ("> " if i == current else "  ") + display_str
+            attr = curses.color_pair(1) | (curses.A_BOLD if tag.unread else 0)
+            stdscr.addstr(i - start_index + 1, 0, display_str[:maxlength(stdscr) - 2], attr)
+        footer(stdscr, "Enter:Open | Space:Select | m:Match all/any | c:Clear | ESC:Back")
+        stdscr.refresh()
+
+        key = stdscr.getch()
+        if key == curses.KEY_UP and current > 0:
+            current -= 1
+            start_index = min(start_index, current)
+        elif key == curses.KEY_DOWN and current < len(tags) - 1:
+            current += 1
+            if current >= start_index + max_display:
+                start_index += 1
+        elif key == curses.KEY_PPAGE:
+            start_index = max(0, start_index - max_display)
+            current = max(0, current - max_display)
+        elif key == curses.KEY_NPAGE:
+            if start_index + max_display < len(tags):
+                start_index += max_display
+            current = min(max(0, len(tags) - 1), current + max_display)
+        elif key == curses.KEY_HOME:
+            current = start_index = 0
+        elif key == ord(" ") and tags:
+            name = tags[current].name
+            if name in selected:
+                selected.remove(name)
+            else:
+                selected.append(name)
+        elif key == ord("m"):
+            match_all = not match_all
+        elif key == ord("c"):
+            selected = []
+        elif (key == ord("\n") or key == curses.KEY_RIGHT) and tags:
+            display_view(stdscr, conn, tags_view(selected or [tags[current].name], match_all))
+        elif key == 27 or key == curses.KEY_LEFT:
+            break
+        elif key == ord("q"):
+            exit(0)
+
+
+# Saved searches the ingest rules filed items in
+@daemon_api("folders")
+@cached_query
+def fetch_rule_folders(conn):
+    """
+    Returns:
+        List of (view, items, unread items)
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT 'search:' || s.search, COUNT(*), SUM(fi.is_read = 0)
+        FROM saved_search_items s JOIN feed_items fi ON fi.id = s.item_id
+        GROUP BY s.search
+        ORDER BY s.search
+    """)
+    return cursor.fetchall()
+
+
+# A page of a smart view, newest first
+@daemon_api("view", record=ItemRecord)
+def fetch_view_items(conn, view, before=None, limit=VIEW_PAGE_SIZE):
+    """
+    Each view has a matching index, and pages are read from the position
+    of the last loaded item, so a page costs the same anywhere in the view.
+    Parameters:
+        conn: Database connection
+        view: 'unread', 'recent', 'starred', 'search:NAME' or a tags_view()
+        before: (last_updated, id) of the last item of the previous page
+        limit: Items in a page
+    Returns:
+        List of ItemRecord
+    """
+    _, condition, params = view_condition(view)
+    if before:
+        condition += " AND (fi.last_updated, fi.id) < (?, ?)"
+        params = params + list(before)
+    cursor = conn.cursor()
+    cursor.row_factory = ItemRecord.from_row
+    cursor.execute(f"""
+        SELECT {ITEM_COLUMNS}
+        FROM feed_items fi
+        JOIN feeds f ON fi.feed_id = f.id
+        WHERE {condition}
+        ORDER BY fi.last_updated DESC, fi.id DESC
+        LIMIT ?
+    """, params + [limit])
+    return cursor.fetchall()
+
+
+@daemon_api("view_count")
+@cached_query
+def count_view_items(conn, view):
+    _, condition, params = view_condition(view)
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT COUNT(*) FROM feed_items fi WHERE {condition}", params)
+    return cursor.fetchone()[0]
+
+
+# Star or unstar an item, returns the new state
+@daemon_api("star", notify=True)
+def toggle_star(conn, item_id):
+    cursor = conn.cursor()
+    cursor.execute("UPDATE feed_items SET starred = 1 - starred WHERE id = ?", (item_id,))
+    cursor.execute("SELECT starred FROM feed_items WHERE id = ?", (item_id,))
+    conn.commit()
+    data_changed()
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def toggle_star_pop(stdscr, conn, item_id):
+    starred = toggle_star(conn, item_id)
+    footerpop(stdscr, "Starred" if starred else "Unstarred", 1, 0)
+    return starred
+
+
+# Display a smart view, loading pages as the cursor gets near the end
+def display_view(stdscr, conn, view):
+    title = view_condition(view)[0]
+    feed_items = fetch_view_items(conn, view)
+    more = len(feed_items) == VIEW_PAGE_SIZE
+    total = count_view_items(conn, view)
+    current_item = 0
+    start_index = 0  # Track the starting index for display
+
+    while True:
+        max_display = curses.LINES - 2  # Maximum number of items to display
+        # Load the next page, before the cursor reaches the end
+        while more and current_item + max_display >= len(feed_items):
+            last = feed_items[-1]
+            page = fetch_view_items(conn, view, (last.last_updated, last.id))
+            feed_items.extend(page)
+            more = len(page) == VIEW_PAGE_SIZE
+        current_item = min(current_item, max(0, len(feed_items) - 1))
+
+        stdscr.clear()
+        header(stdscr, f": {title} [Items : {total}]")
+        max_length = maxlength(stdscr) - 1  # Leave space for cursor
+
+        for i in range(start_index, min(start_index + max_display, len(feed_items))):
+            item = feed_items[i]
+            star = "*" if item.starred else " "
+            last_updated = time.strftime('%Y-%m-%d', time.localtime(item.last_updated))  # Format last updated timestamp
+            display_str = f"{star}{last_updated} | {item.feed_name[:15]:15} | {item.title}"
+            display_str = ("> " if i == current_item else "  ") + display_str
+            attr = curses.color_pair(1) if item.is_read == 1 else curses.color_pair(1) | curses.A_BOLD
+            stdscr.addstr(i - start_index + 1, 0, display_str[:max_length-2], attr)
+
+        footer(stdscr, "q:quit | Enter:Select | ESC:Back | *:Star | h:help")
+        stdscr.refresh()
+
+        key = stdscr.getch()
+
+        if key == curses.KEY_UP and current_item > 0:
+            current_item -= 1
+            if current_item < start_index:  # Adjust start_index if needed
+                start_index = max(0, start_index - 1)
+        elif key == curses.KEY_DOWN and current_item < len(feed_items) - 1:
+            current_item += 1
+            if current_item >= start_index + max_display:  # Adjust start_index if needed
+                start_index += 1
+        elif key == curses.KEY_PPAGE:  # Page Up
+            start_index = max(0, start_index - max_display)
+            current_item = max(0, current_item - max_display)
+        elif key == curses.KEY_NPAGE:  # Page Down
+            if start_index + max_display < len(feed_items):
+                start_index += max_display
+            current_item = min(len(feed_items) - 1, current_item + max_display)
+        elif key == curses.KEY_HOME:  # Home key
+            current_item = 0  # Scroll to the start
+            start_index = 0  # Reset start index
+        elif key == ord("\n") or key == curses.KEY_RIGHT:  # Enter key
+            if feed_items:
+                # The list isn't reloaded, so read items stay where they are
+                mark_item_as_read(conn, feed_items[current_item].id)
+                feed_items[current_item].is_read = 1
+                prerender_neighbours(stdscr, feed_items, current_item)
+                display_feed_entry(stdscr, conn, feed_items[current_item])
+        elif key == 27 or key == curses.KEY_LEFT:  # ESC key
+            break
+        elif key == ord("q"):
+            exit(0)
+        elif key == ord("r") or key == ord("u"):
+            if feed_items:
+                read = 1 if key == ord("r") else 0
+                mark_item_as_read(conn, feed_items[current_item].id, read)
+                feed_items[current_item].is_read = read
+        elif key == ord("*"):
+            if feed_items:
+                feed_items[current_item].starred = toggle_star_pop(stdscr, conn, feed_items[current_item].id)
+        elif key == ord("h"):
+            display_help_feed_items(stdscr)
+        elif key == ord("x"):
+            tts.stop()
+        elif key in (ord("["), ord("]")):
+            tts.skip(1 if key == ord("]") else -1)
+
+
+def choose_view(stdscr, conn):
+    footer(stdscr, "Views: [A]ll unread [L]ast 24h [S]tarred [F]olders [C]ancel", 3)
+    stdscr.refresh()
+    key = stdscr.getch()
+    if key == ord("a"):
+        display_view(stdscr, conn, "unread")
+    elif key == ord("l"):
+        display_view(stdscr, conn, "recent")
+    elif key == ord("s"):
+        display_view(stdscr, conn, "starred")
+    elif key == ord("f"):
+        choose_folder(stdscr, conn)
+
+
+# List the saved searches of the ingest rules, and open one as a view
+def choose_folder(stdscr, conn):
+    current = 0
+    start_index = 0
+    while True:
+        folders = fetch_rule_folders(conn)
+        current = min(current, max(0, len(folders) - 1))
+        max_display = curses.LINES - 2
+        stdscr.clear()
+        header(stdscr, f": Folders [{len(folders)}]")
+        if not folders:
+            stdscr.addstr(2, 2, f"No items filed yet. Rules with search actions go in {rules_file}")
+        for i in range(start_index, min(start_index + max_display, len(folders))):
+            view, total, unread = folders[i]
+            display_str = f"{view_condition(view)[0]:40} {unread:>6} / {total:<6}"
+            display_str = ("> " if i == current else "  ") + display_str
+            attr = curses.color_pair(1) | (curses.A_BOLD if unread else 0)
+            stdscr.addstr(i - start_index + 1, 0, display_str[:maxlength(stdscr) - 2], attr)
+        footer(stdscr, "Enter:Open | ESC:Back")
+        stdscr.refresh()
+
+        key = stdscr.getch()
+        if key == curses.KEY_UP and current > 0:
+            current -= 1
+            start_index = min(start_index, current)
+        elif key == curses.KEY_DOWN and current < len(folders) - 1:
+            current += 1
+            if current >= start_index + max_display:
+                start_index += 1
+        elif (key == ord("\n") or key == curses.KEY_RIGHT) and folders:
+            display_view(stdscr, conn, folders[current][0])
+        elif key == 27 or key == curses.KEY_LEFT:
+            break
+        elif key == ord("q"):
+            exit(0)
+
+
+# Function to mark an item as read
+@daemon_api("mark", notify=True)
+def mark_item_as_read(conn, item_id,read=1):
+    cursor = conn.cursor()
+    cursor.execute("UPDATE feed_items SET is_read = ? WHERE id = ?", (read,item_id,))
+    conn.commit()
+    data_changed()
+
+# Convert an entry's HTML to plain text lines
+def html_to_lines(content):
+    soup = BeautifulSoup(content or "", "html.parser")
     
     # Replace <br> with new lines and <p> with double new lines for paragraphs
     for br in soup.find_all("br"):
@@ -1300,52 +3987,273 @@ def display_feed_entry(stdscr, conn, feed_item):
         p.insert_after("]")
 
     # Get the plain text while preserving whitespace
-    plain_text = soup.get_text()
+    return soup.get_text().splitlines()
 
-    # Wrap the text to fit the terminal width
-    max_length = maxlength(stdscr) - 1  # Leave space for cursor
 
-    wrapped_lines = []
+# Read an entry and convert it to text lines, the layout is done by EntryLayout
+@daemon_api("entry")
+def read_feed_entry(conn, item_id):
+    """
+    Parameters:
+        conn: Database connection
+        item_id: Feed item id
+    Returns:
+        Tuple of (title, summary, content, last_updated, lines)
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT fi.title, fi.summary, fi.content, fi.last_updated, fi.full_content, fi.link, f.fulltext
+        FROM feed_items fi
+        LEFT JOIN feeds f ON fi.feed_id = f.id
+        WHERE fi.id = ?
+    """, (item_id,))
+    title, summary, content, last_updated, full_content, link, fulltext = cursor.fetchone()
+
+    if full_content is None and fulltext and link:
+        # Not extracted at ingest, do it on first open
+        full_content = fetch_article(link)
+        cursor.execute("UPDATE feed_items SET full_content = ? WHERE id = ?", (full_content, item_id))
+        conn.commit()
+    if full_content:
+        content = full_content
+    if not content:
+        content = summary
+    return title, summary, content, last_updated, html_to_lines(content)
 
-    lines = plain_text.splitlines()  # Split the text into lines
-    for line in lines:
-        if len(line)>max_length-1:
-            l = wrap(line,max_length-1, drop_whitespace=False, tabsize=4)
-            wrapped_lines.extend(l)
-        else:
-            wrapped_lines.append(line)
+
+# Bounded LRU cache of rendered entries, keyed by (item id, width)
+class RenderCache:
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+# Wrapped lines of an entry for a terminal width, laid out a chunk of paragraphs at a time
+class EntryLayout:
+    """
+    Only the chunks the reader scrolls to are wrapped, going down or up from
+    the chunk it was opened at. A long entry opens without wrapping all of it,
+    and after a resize only the paragraphs on the screen are wrapped again.
+    """
+    def __init__(self, entry, width, paragraph=0):
+        self.entry = entry  # (title, summary, content, last_updated, lines), shared by the widths
+        self.lines = entry[4]
+        self.width = width
+        self.first = self.last = paragraph // LAYOUT_CHUNK  # Chunks laid out, first to last - 1
+        self.wrapped = []
+        self.paragraphs = []  # Paragraph of each wrapped line
+
+    def wrap_chunk(self, chunk):
+        max_length = self.width - 1  # Leave space for cursor
+        wrapped, paragraphs = [], []
+        start = chunk * LAYOUT_CHUNK
+        for paragraph, line in enumerate(self.lines[start:start + LAYOUT_CHUNK], start):
+            if len(line) > max_length - 1:
+                parts = wrap(line, max_length - 1, drop_whitespace=False, tabsize=4)
+            else:
+                parts = [line]
+            wrapped.extend(parts)
+            paragraphs.extend([paragraph] * len(parts))
+        return wrapped, paragraphs
+
+    @property
+    def done(self):
+        return self.last * LAYOUT_CHUNK >= len(self.lines)
+
+    # Lay out chunks at the end, until there are count lines or the entry ends
+    def extend(self, count):
+        while len(self.wrapped) < count and not self.done:
+            wrapped, paragraphs = self.wrap_chunk(self.last)
+            self.wrapped.extend(wrapped)
+            self.paragraphs.extend(paragraphs)
+            self.last += 1
+
+    def prepend(self):
+        """
+        Returns:
+            Lines added before the laid out ones, the line indexes move down by as many
+        """
+        if self.first == 0:
+            return 0
+        self.first -= 1
+        wrapped, paragraphs = self.wrap_chunk(self.first)
+        self.wrapped[:0] = wrapped
+        self.paragraphs[:0] = paragraphs
+        return len(wrapped)
+
+    # Index of the first wrapped line of a paragraph, laying out its chunk if needed
+    def find(self, paragraph):
+        while paragraph < self.first * LAYOUT_CHUNK:
+            self.prepend()
+        while paragraph >= self.last * LAYOUT_CHUNK and not self.done:
+            self.extend(len(self.wrapped) + 1)
+        return bisect_left(self.paragraphs, paragraph)
+
+
+# Background worker, rendering the entries next to the one being read
+class EntryPrerenderer:
+    def __init__(self, cache):
+        self.cache = cache
+        self.pending = []
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def schedule(self, item_ids, width):
+        # Newer requests replace the pending ones, they are for another list position
+        with self.condition:
+            self.pending = [(item_id, width) for item_id in item_ids]
+            self.condition.notify()
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def run(self):
+        conn = open_worker_connection()
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                key = self.pending.pop(0)
+            if key in self.cache:
+                continue
+            try:
+                layout = EntryLayout(read_feed_entry(conn, key[0]), key[1])
+                layout.extend(1)
+                self.cache.put(key, layout)
+            except Exception as e:
+                log_event(f"Error rendering item {key[0]}: {str(e)}", logging.ERROR)
+
+
+render_cache = RenderCache(RENDER_CACHE_SIZE)
+prerenderer = EntryPrerenderer(render_cache)
+
+
+def get_entry_layout(conn, item_id, width, entry=None, paragraph=0):
+    """
+    Parameters:
+        entry: Text of the entry, when it is already read for another width
+        paragraph: Paragraph to show, a new layout starts from it
+    """
+    layout = render_cache.get((item_id, width))
+    # A layout made after a resize may start further down, the entry opens at the top
+    if layout is None or layout.first * LAYOUT_CHUNK > paragraph:
+        layout = EntryLayout(entry or (layout.entry if layout else read_feed_entry(conn, item_id)), width, paragraph)
+        render_cache.put((item_id, width), layout)
+    return layout
+
+
+# Pre-render the items after and before the current one in a list
+def prerender_neighbours(stdscr, feed_items, current_item):
+    item_ids = [feed_items[i].id for i in range(current_item + 1, min(current_item + PRERENDER_AHEAD + 1, len(feed_items)))]
+    item_ids += [feed_items[i].id for i in range(current_item - 1, max(current_item - PRERENDER_AHEAD - 1, -1), -1)]
+    prerenderer.schedule(item_ids, maxlength(stdscr))
+
+
+# Function to display a single feed entry
+def display_feed_entry(stdscr, conn, feed_item):
+    global browser,media,xterm
+    layout = get_entry_layout(conn, feed_item.id, maxlength(stdscr))
+    title, summary, content, last_updated, lines = layout.entry
+    link = feed_item.link
 
     current_line_index = 0
-    num_lines = len(wrapped_lines)
+    pad = None  # Holds the wrapped lines from pad_top, scrolled with prefresh
+    pad_top = 0
+    redraw = True
 
     while True:
-        stdscr.clear()
         max_length = maxlength(stdscr) - 1
-        stdscr.addstr(0, 0, f"Title:")
-        stdscr.addstr(0, max_length-28, f"Date:")
-        stdscr.addstr(1, 0, f"{title[:max_length]}", curses.A_BOLD)
-        stdscr.addstr(2, 0, f"<{link[:max_length-2]}>")
-        stdscr.addstr(0, max_length-22, f"{time.strftime('%Y-%m-%d / %H:%M:%S', time.localtime(last_updated))}", curses.A_BOLD)
-        stdscr.addstr(3, 0, "-"*max_length)
-
-        # Display the wrapped lines with scrolling
-        for i in range(current_line_index, min(current_line_index + curses.LINES - 5, num_lines)):
-            stdscr.addstr(i - current_line_index + 4, 0, wrapped_lines[i])
-
-        footer(stdscr, f"Esc/Left:Back | q:quit | h:help")
-        stdscr.refresh()
+        page = max(1, curses.LINES - 5)
+        if redraw:
+            stdscr.clear()
+            stdscr.addstr(0, 0, f"Title:")
+            stdscr.addstr(0, max_length-28, f"Date:")
+            stdscr.addstr(1, 0, f"{title[:max_length]}", curses.A_BOLD)
+            stdscr.addstr(2, 0, f"<{link[:max_length-2]}>")
+            stdscr.addstr(0, max_length-22, f"{time.strftime('%Y-%m-%d / %H:%M:%S', time.localtime(last_updated))}", curses.A_BOLD)
+            stdscr.addstr(3, 0, "-"*max_length)
+            footer(stdscr, f"Esc/Left:Back | q:quit | h:help")
+            stdscr.refresh()
+            redraw = False
+
+        # Draw the lines around the screen in the pad, when it scrolls out of them
+        layout.extend(current_line_index + page)
+        if pad is None or not pad_top <= current_line_index <= pad_top + page * (PAD_PAGES - 1):
+            pad_top = max(0, current_line_index - page)
+            layout.extend(pad_top + page * PAD_PAGES)
+            pad = curses.newpad(page * PAD_PAGES, max_length + 1)
+            for i, line in enumerate(layout.wrapped[pad_top:pad_top + page * PAD_PAGES]):
+                try:
+                    pad.addstr(i, 0, line)
+                except curses.error:
+                    pass  # Wider than the pad, like a line of tabs
+        pad.refresh(current_line_index - pad_top, 0, 4, 0, 3 + page, max_length)
 
         key = stdscr.getch()
 
-        if key == curses.KEY_UP and current_line_index > 0:
-            current_line_index -= 1
-        elif key == curses.KEY_DOWN and current_line_index < num_lines - (curses.LINES - 5):
-            current_line_index += 1
-        elif key == curses.KEY_PPAGE and current_line_index > 0:  # Page Up
-            current_line_index = max(0, current_line_index - (curses.LINES - 5))  # Scroll up by one page
-        elif key == curses.KEY_NPAGE and current_line_index < num_lines - (curses.LINES - 5):  # Page Down
-            current_line_index = min(num_lines - (curses.LINES - 5), current_line_index + (curses.LINES - 5))  # Scroll down by one page
-        elif key == 27 or key == curses.KEY_LEFT:  # ESC key
+        if key == curses.KEY_UP:
+            if current_line_index == 0 and layout.first > 0:
+                added = layout.prepend()
+                current_line_index += added
+                pad_top += added
+            if current_line_index > 0:
+                current_line_index -= 1
+        elif key == curses.KEY_DOWN:
+            layout.extend(current_line_index + page + 1)
+            if current_line_index < len(layout.wrapped) - page:
+                current_line_index += 1
+        elif key == curses.KEY_PPAGE:  # Page Up
+            while current_line_index < page and layout.first > 0:
+                added = layout.prepend()
+                current_line_index += added
+                pad_top += added
+            current_line_index = max(0, current_line_index - page)  # Scroll up by one page
+        elif key == curses.KEY_NPAGE:  # Page Down
+            layout.extend(current_line_index + 2 * page)
+            current_line_index = max(current_line_index, min(len(layout.wrapped) - page, current_line_index + page))
+        elif key == curses.KEY_RESIZE:
+            # Lay out for the new width from the paragraph at the top, the rest when it is scrolled to
+            curses.update_lines_cols()
+            paragraph = layout.paragraphs[current_line_index] if layout.wrapped else 0
+            layout = get_entry_layout(conn, feed_item.id, maxlength(stdscr), layout.entry, paragraph)
+            current_line_index = layout.find(paragraph)
+            pad = None
+            redraw = True
+        elif key == curses.KEY_HOME:  # Home key
+            while layout.prepend():
+                pass
+            current_line_index = 0  # Scroll to the start
+            pad = None
+        elif key == curses.KEY_END:  # End key
+            layout.extend(sys.maxsize)
+            current_line_index = max(0, len(layout.wrapped) - page)  # Scroll to the end
+        else:
+            # Other keys draw on the screen or open another one
+            redraw = True
+        if key == 27 or key == curses.KEY_LEFT:  # ESC key
             break
         elif key == ord("h"):
             display_help_entry(stdscr)
@@ -1358,12 +4266,10 @@ def display_feed_entry(stdscr, conn, feed_item):
             fn = f"{time.strftime('%Y%m%d_%H%M%S')}_rss.txt"
             export_feed_entry_to_file(conn, feed_item, fn)
             footerpop(stdscr,f"Exported to: {fn}")
-        elif key == curses.KEY_HOME:  # Home key
-            current_line_index = 0  # Scroll to the start
-        elif key == curses.KEY_END:  # End key
-            current_line_index = num_lines - (curses.LINES - 5)  # Scroll to the end
         elif key == ord("l") or key == curses.KEY_RIGHT:
             display_links(stdscr, conn, feed_item)
+        elif key == ord("*"):
+            toggle_star_pop(stdscr, conn, feed_item.id)
         elif key == ord("1"):
             pyperclip.copy(title)
             footerpop(stdscr,"Title copied to clipboard")
@@ -1378,6 +4284,8 @@ def display_feed_entry(stdscr, conn, feed_item):
             footerpop(stdscr,"Content copied to clipboard")
         elif key == ord("x"):
             tts.stop()
+        elif key in (ord("["), ord("]")):
+            tts.skip(1 if key == ord("]") else -1)
         elif key == ord("s"):
             height, width = stdscr.getmaxyx()
             stdscr.addstr(height-1, 0, str("Speak: [T]itle [D]ate [B]ody [C]ancel").ljust(width-1), curses.color_pair(4) | curses.A_BOLD)
@@ -1387,7 +4295,7 @@ def display_feed_entry(stdscr, conn, feed_item):
             elif key == ord("d"):
                 tts.speak(f"{time.strftime('%Y-%m-%d / %H:%M:%S', time.localtime(last_updated))}")
             elif key == ord("b"):
-                tts.speak(SPEAK + ' "' + str(lines).strip())
+                tts.speak("\n".join(lines))
             elif key == ord("c"):
                 pass
 
@@ -1408,6 +4316,10 @@ def display_help_links(stdscr):
         "ESC/Left: Back\n"
         "c: Copy URL to clipboard\n"
         "m: Open with Media Player\n"
+        "d: Download to offline cache\n"
+        "U/I: Cached url/image, opened from the cache\n"
+        "e: Enclosure of the item (podcast episode, attachment)\n"
+        "D: Add to the downloads queue\n"
         "q: Quit\n"
         "h: Help\n"
     )
@@ -1417,31 +4329,16 @@ def display_help_links(stdscr):
     stdscr.getch()  # Wait for user input before returning
 
 def display_links(stdscr, conn, feed_item):
-    cursor = conn.cursor()
-    cursor.execute("SELECT summary, content FROM feed_items WHERE id = ?", (feed_item[0],))
-    result = cursor.fetchone()
-    summary = result[0] if result else None
-    content = result[1] if result else None
+    result = fetch_item_texts(conn, feed_item.id)
+    summary = result[1] if result else None
+    content = result[2] if result else None
     if not content:
         content = summary
-    soup = BeautifulSoup(content, "html.parser")
+    items = extract_links(content, feed_item.link)
+    enclosures = [(url, 'enclosure') for url, _, _ in fetch_enclosures(conn, feed_item.id)]
+    items = enclosures + [item for item in items if item[0] not in {url for url, _ in enclosures}]
+    cached = set(cached_links(conn, [item[0] for item in items]))
 
-    # Regular expression to find URLs
-    url_pattern = r'(https?://[^\s]+)'
-    found_links = re.findall(url_pattern, content)
-    
-    # Create a list of links and images
-    links = [(a['href'], 'url') for a in soup.find_all('a', href=True)]
-    images = [(img['src'], 'image') for img in soup.find_all('img', src=True)]
-    links.append((feed_item[6], 'url'))  # Assuming feed_item[6] is the link
-    
-    # Add found links to the items
-    items = []
-    items.extend(links)
-    items.extend(images)
-    items.extend([(link, 'url') for link in found_links])  # Add found links
-
-    
     current_item = 0
     start_index = 0  # Track the starting index for display
 
@@ -1458,6 +4355,10 @@ def display_links(stdscr, conn, feed_item):
                 tp = "u"
             elif items[i][1] == "image":
                 tp = 'i'
+            elif items[i][1] == "enclosure":
+                tp = 'e'
+            if items[i][0] in cached:
+                tp = tp.upper()
             display_str = f"{tp}: {items[i][0]}"
             if i == current_item:
                 display_str = "> " + display_str[:max_length-4]
@@ -1489,10 +4390,23 @@ def display_links(stdscr, conn, feed_item):
             current_item = len(items) - 1  # Scroll to the end
             start_index = max(0, len(items) - max_display)
         elif key == ord("\n") or key == curses.KEY_RIGHT:  # Enter key
-            run_program(stdscr, f"{browser} {items[current_item][0]}")
+            open_link(stdscr, conn, browser, items[current_item][0])
         elif key == ord("m"):
             footerpop(stdscr,"Opening media. Please wait...",1)
-            run_program(stdscr, f"{media} {items[current_item][0]}")
+            open_link(stdscr, conn, media, items[current_item][0])
+        elif key == ord("d"):  # Download to the offline cache
+            footer(stdscr, f"Downloading: {items[current_item][0]}")
+            stdscr.refresh()
+            try:
+                download_link(conn, items[current_item][0])
+                cached.add(items[current_item][0])
+            except Exception as e:
+                footerpop(stdscr, f"Error downloading: {str(e)}", 2, 1)
+        elif key == ord("D") and items:  # Add to the downloads queue
+            if queue_download(conn, items[current_item][0], feed_item.id):
+                footerpop(stdscr, f"Queued for download: {items[current_item][0]}", 1, 0)
+            else:
+                footerpop(stdscr, "Already in the downloads queue", 1, 0)
         elif key == 27 or key == curses.KEY_LEFT:  # ESC key
             break
         elif key == ord("h"):
@@ -1500,10 +4414,551 @@ def display_links(stdscr, conn, feed_item):
         elif key == ord("q"):
             exit(0)
         elif key == ord("c"):  # Shortcut to copy link to clipboard
-            pyperclip.copy(links[current_item][0])  # Copy the link to clipboard
-            footerpop(stdscr, f"Copied to clipboard: {links[current_item][0]}")
+            pyperclip.copy(items[current_item][0])  # Copy the link to clipboard
+            footerpop(stdscr, f"Copied to clipboard: {items[current_item][0]}")
             
 
+# Find the links and images of an entry
+def extract_links(content, link=None):
+    """
+    Parameters:
+        content: HTML content of the entry
+        link: Link of the entry itself
+    Returns:
+        List of (url, 'url' or 'image')
+    """
+    content = content or ""
+    soup = BeautifulSoup(content, "html.parser")
+
+    # Regular expression to find URLs
+    url_pattern = r'(https?://[^\s]+)'
+    found_links = re.findall(url_pattern, content)
+    
+    # Create a list of links and images
+    links = [(a['href'], 'url') for a in soup.find_all('a', href=True)]
+    images = [(img['src'], 'image') for img in soup.find_all('img', src=True)]
+    if link:
+        links.append((link, 'url'))
+    
+    # Add found links to the items
+    items = []
+    items.extend(links)
+    items.extend(images)
+    items.extend([(link, 'url') for link in found_links])  # Add found links
+    return items
+
+
+# On-disk cache of linked pages, images and media, named by content hash
+class ResourceCache:
+    """
+    Files are stored as <sha256><extension> in the cache directory, and
+    the url -> file index is kept in the resource_cache table. The least
+    recently used files are evicted when the cache grows over its budget.
+    """
+    def __init__(self, directory, budget_mb):
+        self.directory = directory
+        self.budget = budget_mb * 1024 * 1024
+
+    def path(self, digest, ext):
+        return os.path.join(self.directory, f"{digest}{ext}")
+
+    # Local copy of an url, or None if it isn't cached
+    def lookup(self, conn, url):
+        cursor = conn.cursor()
+        cursor.execute("SELECT hash, ext FROM resource_cache WHERE url = ?", (url,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        path = self.path(*row)
+        if not os.path.exists(path):
+            cursor.execute("DELETE FROM resource_cache WHERE url = ?", (url,))
+            conn.commit()
+            return None
+        cursor.execute("UPDATE resource_cache SET last_used = ? WHERE url = ?", (int(time.time()), url))
+        conn.commit()
+        return path
+
+    def cached_urls(self, conn, urls):
+        cursor = conn.cursor()
+        cursor.execute("SELECT url FROM resource_cache")
+        return {row[0] for row in cursor.fetchall()} & set(urls)
+
+    # Download an url into the cache directory, doesn't touch the index
+    def download(self, url):
+        """
+        Returns:
+            Tuple of (url, hash, extension, size, content type)
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        ext = os.path.splitext(urlsplit(url).path)[1][:8]
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as file, \
+                 requests.get(url, stream=True, timeout=(connect_timeout, reqtimeout)) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(65536):
+                    size += len(chunk)
+                    if size > self.budget:
+                        raise ValueError("Larger than the cache")
+                    digest.update(chunk)
+                    file.write(chunk)
+                content_type = response.headers.get("Content-Type", "")
+            os.replace(tmp, self.path(digest.hexdigest(), ext))
+        except BaseException:
+            os.remove(tmp)
+            raise
+        return url, digest.hexdigest(), ext, size, content_type
+
+    # Add a downloaded file to the index, and evict old files if needed
+    def store(self, conn, result):
+        url, digest, ext, size, content_type = result
+        now = int(time.time())
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT OR REPLACE INTO resource_cache (url, hash, ext, size, content_type, fetched, last_used)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (url, digest, ext, size, content_type, now, now))
+        self.evict(cursor)
+        conn.commit()
+
+    def evict(self, cursor):
+        cursor.execute("SELECT SUM(size) FROM (SELECT DISTINCT hash, ext, size FROM resource_cache)")
+        total = cursor.fetchone()[0] or 0
+        if total <= self.budget:
+            return
+        cursor.execute("""
+            SELECT hash, ext, size FROM resource_cache
+            GROUP BY hash, ext ORDER BY MAX(last_used) ASC
+        """)
+        for digest, ext, size in cursor.fetchall():
+            if total <= self.budget:
+                break
+            cursor.execute("DELETE FROM resource_cache WHERE hash = ? AND ext = ?", (digest, ext))
+            try:
+                os.remove(self.path(digest, ext))
+            except OSError:
+                pass
+            total -= size
+
+    def fetch(self, conn, url):
+        path = self.lookup(conn, url)
+        if path is None:
+            result = self.download(url)
+            self.store(conn, result)
+            path = self.path(result[1], result[2])
+        return path
+
+    # Download urls in a background thread, a few at a time
+    def prefetch(self, urls):
+        def run():
+            # sqlite connections can't be shared between threads
+            conn = sqlite3.connect(database, timeout=30)
+            todo = set(urls) - self.cached_urls(conn, urls)
+            done = failed = 0
+            with ThreadPoolExecutor(max_workers=prefetch_workers) as pool:
+                futures = [pool.submit(self.download, url) for url in todo]
+                for future in as_completed(futures):
+                    try:
+                        self.store(conn, future.result())
+                        done += 1
+                    except Exception:
+                        failed += 1
+            conn.close()
+            log_event(f"Prefetched {done} links into cache, {failed} failed")
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+
+resource_cache = ResourceCache(cache_dir, cache_size)
+
+
+# Links and images of the unread items in a category
+def unread_category_links(conn, category):
+    condition, params = category_condition(category)
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT COALESCE(NULLIF(content, ''), summary), link FROM feed_items
+        WHERE is_read = 0 AND {condition}
+    """, params)
+    urls = []
+    for content, link in cursor:
+        urls.extend(url for url, _ in extract_links(content, link) if url.startswith(("http://", "https://")))
+    return list(dict.fromkeys(urls))
+
+
+@daemon_api("prefetch")
+def prefetch_links(conn, category):
+    urls = unread_category_links(conn, category)
+    resource_cache.prefetch(urls)
+    return len(urls)
+
+
+@daemon_api("cached_links")
+def cached_links(conn, urls):
+    return list(resource_cache.cached_urls(conn, urls))
+
+
+@daemon_api("cached_path")
+def cached_link_path(conn, url):
+    return resource_cache.lookup(conn, url)
+
+
+@daemon_api("download")
+def download_link(conn, url):
+    return resource_cache.fetch(conn, url)
+
+
+def prefetch_category(stdscr, conn, category):
+    count = prefetch_links(conn, category)
+    footerpop(stdscr, f"Prefetching {count} links of {category} in background...", 1, 0)
+
+
+# Shared bandwidth cap of the downloads
+class RateLimiter:
+    def __init__(self, rate):
+        self.rate = rate  # Bytes per second, 0 for no limit
+        self.available = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Wait for the turn of this many bytes
+    def consume(self, size):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(self.available, now)
+            self.available = start + size / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+# File name of a download, in a folder per feed, not used by another download
+def download_path(conn, directory, url, feed_name):
+    def safe(name):
+        return re.sub(r"[^\w.\- ]+", "_", name).strip(" .")[:120]
+    folder = os.path.join(directory, safe(feed_name or "") or "Downloads")
+    name = safe(unquote(os.path.basename(urlsplit(url).path))) or "download"
+    base, ext = os.path.splitext(name)
+    path = os.path.join(folder, name)
+    number = 1
+    cursor = conn.cursor()
+    while True:
+        cursor.execute("SELECT 1 FROM downloads WHERE path = ?", (path,))
+        if cursor.fetchone() is None and not os.path.exists(path):
+            return path
+        number += 1
+        path = os.path.join(folder, f"{base} ({number}){ext}")
+
+
+# Parallel, resumable downloads, queued in the downloads table
+class DownloadManager:
+    """
+    Workers take the oldest queued download and write it to <path>.part,
+    resuming a part file left by an earlier run with an HTTP Range request.
+    The progress is saved every few seconds, and downloads that were
+    running when the program stopped are queued again by start().
+    """
+    def __init__(self, directory, workers, rate_kb):
+        self.directory = directory
+        self.workers = workers
+        self.limiter = RateLimiter(rate_kb * 1024)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.progress = {}  # Download id -> (bytes done, bytes per second)
+        self.claimed = set()  # Downloads taken by a worker, until it is done with them
+        self.stopping = set()  # Claimed downloads paused or removed since
+
+    def start(self):
+        conn = sqlite3.connect(database, timeout=30)
+        with conn:
+            conn.execute("UPDATE downloads SET state = 'queued' WHERE state = 'downloading'")
+        conn.close()
+        self.wake()
+
+    # Start workers for the queued downloads
+    def wake(self):
+        with self.lock:
+            while self.running < self.workers:
+                self.running += 1
+                threading.Thread(target=self.run, daemon=True).start()
+
+    def claim(self, conn):
+        with self.lock:
+            cursor = conn.cursor()
+            # A download resumed while its worker is stopping it is left to that worker
+            cursor.execute(f"SELECT id, url, path, size FROM downloads WHERE state = 'queued' "
+                           f"AND id NOT IN ({', '.join('?' * len(self.claimed))}) ORDER BY id LIMIT 1",
+                           tuple(self.claimed))
+            job = cursor.fetchone()
+            if job is None:
+                self.running -= 1
+                return None
+            cursor.execute("UPDATE downloads SET state = 'downloading', error = NULL WHERE id = ?", (job[0],))
+            conn.commit()
+            self.claimed.add(job[0])
+            return job
+
+    def run(self):
+        # sqlite connections can't be shared between threads
+        conn = sqlite3.connect(database, timeout=30)
+        while True:
+            job = self.claim(conn)
+            if job is None:
+                break
+            download_id, url, path = job[:3]
+            try:
+                done = self.download(conn, *job)
+                state, error = ("done", None) if done is not None else (None, None)
+            except Exception as e:
+                done, state, error = None, "failed", str(e)
+            self.progress.pop(download_id, None)
+            with self.lock:
+                # Resumed after the worker stopped, but before it let go of it
+                resumed = state is None and download_id not in self.stopping
+                self.stopping.discard(download_id)
+                self.claimed.discard(download_id)
+            if done is None:
+                done = os.path.getsize(path + ".part") if os.path.exists(path + ".part") else 0
+            if resumed:
+                conn.execute("UPDATE downloads SET state = 'queued', done = ? WHERE id = ? AND state = 'downloading'",
+                             (done, download_id))
+                conn.commit()
+                continue
+            if state is None:
+                # Paused or removed, the state is already set
+                cursor = conn.execute("UPDATE downloads SET done = ? WHERE id = ?", (done, download_id))
+                conn.commit()
+                if cursor.rowcount == 0 and os.path.exists(path + ".part"):
+                    os.remove(path + ".part")  # Removed, there is nothing to resume
+                continue
+            # A download that got to the end is done, even if it was paused meanwhile
+            states = ("downloading", "paused") if state == "done" else ("downloading",)
+            conn.execute(f"UPDATE downloads SET state = ?, error = ?, done = ? "
+                         f"WHERE id = ? AND state IN ({', '.join('?' * len(states))})",
+                         (state, error, done, download_id, *states))
+            conn.commit()
+            log_event(f"Download {state}: {url}{f' {error}' if error else ''}",
+                      logging.WARNING if error else logging.INFO)
+        conn.close()
+
+    def download(self, conn, download_id, url, path, size):
+        """
+        Returns:
+            Bytes in the file, or None if the download was paused or removed,
+            the part file is left to resume
+        """
+        part = path + ".part"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        done = os.path.getsize(part) if os.path.exists(part) else 0
+        headers = {"Range": f"bytes={done}-"} if done else {}
+        with requests.get(url, stream=True, headers=headers, timeout=(connect_timeout, reqtimeout)) as response:
+            if response.status_code == 416 and done:
+                # Nothing left after the part file
+                conn.execute("UPDATE downloads SET size = ? WHERE id = ?", (done, download_id))
+                if download_id in self.stopping:
+                    return None
+                os.replace(part, path)
+                return done
+            response.raise_for_status()
+            if response.status_code != 206:
+                done = 0  # The server sent the whole file
+            total = response.headers.get("Content-Range", "").rpartition("/")[2]
+            if not total.isdigit():
+                total = str(done + int(response.headers.get("Content-Length") or 0) or size)
+            conn.execute("UPDATE downloads SET size = ?, done = ? WHERE id = ?", (int(total), done, download_id))
+            conn.commit()
+            started = saved = time.monotonic()
+            start_done = done
+            with open(part, "ab" if done else "wb") as file:
+                for chunk in response.iter_content(DOWNLOAD_CHUNK):
+                    if download_id in self.stopping:
+                        return None
+                    self.limiter.consume(len(chunk))
+                    file.write(chunk)
+                    done += len(chunk)
+                    now = time.monotonic()
+                    self.progress[download_id] = (done, (done - start_done) / max(now - started, 0.001))
+                    if now - saved >= DOWNLOAD_SAVE_INTERVAL:
+                        file.flush()
+                        conn.execute("UPDATE downloads SET done = ? WHERE id = ?", (done, download_id))
+                        conn.commit()
+                        saved = now
+        if download_id in self.stopping:
+            return None
+        os.replace(part, path)
+        return done
+
+    def enqueue(self, conn, url, item_id=None, size=0):
+        """
+        Returns:
+            True if the url was queued, False if it already was
+        """
+        cursor = conn.cursor()
+        cursor.execute("SELECT f.name FROM feed_items fi JOIN feeds f ON fi.feed_id = f.id WHERE fi.id = ?",
+                       (item_id,))
+        row = cursor.fetchone()
+        path = download_path(conn, self.directory, url, row[0] if row else "")
+        cursor.execute("INSERT OR IGNORE INTO downloads (url, item_id, path, size, added) VALUES (?, ?, ?, ?, ?)",
+                       (url, item_id, path, size, int(time.time())))
+        conn.commit()
+        return cursor.rowcount == 1
+
+    def control(self, conn, download_id, action):
+        # Under the lock no worker claims the download in between
+        with self.lock:
+            cursor = conn.cursor()
+            if action == "pause":
+                cursor.execute("UPDATE downloads SET state = 'paused' "
+                               "WHERE id = ? AND state IN ('queued', 'downloading')", (download_id,))
+            elif action == "resume" and download_id in self.stopping:
+                # Its worker hasn't stopped yet, and goes on with it
+                cursor.execute("UPDATE downloads SET state = 'downloading' WHERE id = ? AND state = 'paused'",
+                               (download_id,))
+                if cursor.rowcount:
+                    self.stopping.discard(download_id)
+            elif action == "resume":
+                cursor.execute("UPDATE downloads SET state = 'queued', error = NULL "
+                               "WHERE id = ? AND state IN ('paused', 'failed')", (download_id,))
+            elif action == "remove":
+                cursor.execute("SELECT path, state FROM downloads WHERE id = ?", (download_id,))
+                row = cursor.fetchone()
+                if row:
+                    cursor.execute("DELETE FROM downloads WHERE id = ?", (download_id,))
+                    if row[1] != "done" and os.path.exists(row[0] + ".part"):
+                        os.remove(row[0] + ".part")
+            elif action == "clear":
+                cursor.execute("DELETE FROM downloads WHERE state = 'done'")
+            conn.commit()
+            # Only a worker stops a download, and forgets it when it is done with it
+            if action in ("pause", "remove") and download_id in self.claimed:
+                self.stopping.add(download_id)
+        if action == "resume":
+            self.wake()
+
+
+# Enclosures of an item
+@daemon_api("enclosures")
+def fetch_enclosures(conn, item_id):
+    """
+    Returns:
+        List of (url, length, type)
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT url, length, type FROM enclosures WHERE item_id = ? ORDER BY id", (item_id,))
+    return cursor.fetchall()
+
+
+@daemon_api("queue_download", notify=True)
+def queue_download(conn, url, item_id=None):
+    cursor = conn.cursor()
+    cursor.execute("SELECT length FROM enclosures WHERE item_id = ? AND url = ?", (item_id, url))
+    row = cursor.fetchone()
+    queued = download_manager.enqueue(conn, url, item_id, row[0] if row else 0)
+    download_manager.wake()
+    return queued
+
+
+# Queue the enclosures of the unread items of a category, that aren't queued yet
+@daemon_api("queue_episodes", notify=True)
+def queue_new_episodes(conn, category):
+    condition, params = category_condition(category)
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT e.url, e.item_id, e.length
+        FROM enclosures e JOIN feed_items fi ON fi.id = e.item_id
+        WHERE fi.is_read = 0 AND fi.{condition}
+          AND e.url NOT IN (SELECT url FROM downloads)
+        ORDER BY fi.last_updated
+    """, params)
+    queued = sum(download_manager.enqueue(conn, url, item_id, length) for url, item_id, length in cursor.fetchall())
+    download_manager.wake()
+    return queued
+
+
+# The download queue, with the progress of the running downloads
+@daemon_api("downloads", record=DownloadRecord)
+def fetch_downloads(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, url, path, size, done, state, error FROM downloads ORDER BY id")
+    downloads = [DownloadRecord(*row) for row in cursor.fetchall()]
+    for download in downloads:
+        if download.id in download_manager.progress:
+            download.done, download.speed = download_manager.progress[download.id]
+    return downloads
+
+
+@daemon_api("download_control", notify=True)
+def control_download(conn, download_id, action):
+    download_manager.control(conn, download_id, action)
+
+
+def queue_episodes_pop(stdscr, conn, category):
+    queued = queue_new_episodes(conn, category)
+    footerpop(stdscr, f"Queued {queued} new episodes of {category}" if queued else "No new episodes to download", 1, 0)
+
+
+# Download queue, refreshed every second
+def display_downloads(stdscr, conn):
+    current = 0
+    start_index = 0
+    stdscr.timeout(1000)
+    try:
+        while True:
+            downloads = fetch_downloads(conn)
+            current = min(current, max(0, len(downloads) - 1))
+            max_display = curses.LINES - 2
+            active = sum(download.state == "downloading" for download in downloads)
+            stdscr.clear()
+            header(stdscr, f": Downloads [{len(downloads)}, {active} running] [{download_dir}]")
+            width = maxlength(stdscr)
+            for i in range(start_index, min(start_index + max_display, len(downloads))):
+                download = downloads[i]
+                percent = f"{download.done * 100 // download.size:3}%" if download.size else "   ?"
+                size = format_file_size(download.size) if download.size else format_file_size(download.done)
+                speed = f"{format_file_size(int(download.speed))}/s" if download.state == "downloading" else ""
+                status = download.error if download.state == "failed" else download.state
+                display_str = (f"{percent} {size:>10} {speed:>13} {status[:12]:12} | "
+                               f"{os.path.basename(download.path)}")
+                display_str = ("> " if i == current else "  ") + display_str
+                attr = curses.color_pair(1) | (curses.A_BOLD if download.state == "downloading" else 0)
+                stdscr.addstr(i - start_index + 1, 0, display_str[:width - 1], attr)
+            footer(stdscr, "ESC:Back | p:Pause/Resume | r:Retry | x:Remove | c:Clear finished")
+            stdscr.refresh()
+
+            key = stdscr.getch()
+            selected = downloads[current] if downloads else None
+            if key == 27 or key == curses.KEY_LEFT:
+                break
+            elif key == ord("q"):
+                exit(0)
+            elif key == curses.KEY_UP and current > 0:
+                current -= 1
+                start_index = min(start_index, current)
+            elif key == curses.KEY_DOWN and current < len(downloads) - 1:
+                current += 1
+                if current >= start_index + max_display:
+                    start_index += 1
+            elif key == ord("p") and selected:
+                control_download(conn, selected.id, "resume" if selected.state == "paused" else "pause")
+            elif key == ord("r") and selected:
+                control_download(conn, selected.id, "resume")
+            elif key == ord("x") and selected:
+                control_download(conn, selected.id, "remove")
+            elif key == ord("c"):
+                control_download(conn, None, "clear")
+    finally:
+        stdscr.timeout(-1)
+
+
+# Open an url with a program, using the cached copy if there is one
+def open_link(stdscr, conn, program, url):
+    path = cached_link_path(conn, url)
+    run_program(stdscr, f"{program} {shlex.quote(path or url)}")
+
+
 def run_program(stdscr,param):
     try:
         os.system(param)
@@ -1511,9 +4966,7 @@ def run_program(stdscr,param):
         footer(stdscr,"Error:\n", e.stderr)  # Print the error if the command fails
 
 def export_feed_entry_to_file(conn, feed_item, filename):
-    cursor = conn.cursor()
-    cursor.execute("SELECT title, summary, content, last_updated FROM feed_items WHERE id = ?", (feed_item[0],))
-    title, summary, content, last_updated = cursor.fetchone()
+    title, summary, content, last_updated = fetch_item_texts(conn, feed_item.id)
 
     # Format the date
     formatted_date = time.strftime('%Y-%m-%d', time.localtime(last_updated))
@@ -1530,6 +4983,666 @@ def export_feed_entry_to_file(conn, feed_item, filename):
         file.write(export_content)
 
 
+# SQL condition selecting items to export, on feed_items fi joined with feeds f
+def item_selection(feed=None, category=None, since=None, until=None, read=None, since_id=None,
+                   search_text=None, search_where='all'):
+    """
+    Returns:
+        Tuple of (SQL condition, list of parameters)
+    """
+    conditions = []
+    params = []
+    if feed:
+        conditions.append("(f.name = ? OR f.url = ?)")
+        params += [feed, feed]
+    if category:
+        condition, cat_params = category_condition(category)
+        conditions.append("fi." + condition)
+        params += cat_params
+    if since is not None:
+        conditions.append("fi.last_updated >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append("fi.last_updated < ?")
+        params.append(until)
+    if read is not None:
+        conditions.append("fi.is_read = ?")
+        params.append(read)
+    if since_id is not None:
+        conditions.append("fi.id > ?")
+        params.append(since_id)
+    search, search_params = search_condition(search_text, search_where, "fi.")
+    if search:
+        conditions.append(search)
+        params += search_params
+    return " AND ".join(conditions) or "1", params
+
+
+ITEM_FIELDS = ("id", "feed_url", "feed_name", "title", "summary", "content", "full_content",
+               "link", "is_read", "last_updated", "created")
+
+
+# Date of a command line filter, as a timestamp
+def parse_date(text):
+    return int(time.mktime(time.strptime(text, "%Y-%m-%d")))
+
+
+# Stream feed items as NDJSON, one JSON object per line
+def export_items(conn, out, feed=None, category=None, since=None, until=None, read=None, since_id=None):
+    """
+    Parameters:
+        conn: Database connection
+        out: Text file to write to
+        feed: Only items of the feed with this name or url
+        category: Only items of this category
+        since, until: Only items updated in this range of timestamps
+        read: Only read (1) or unread (0) items
+        since_id: Only items with a larger id, the watermark of a previous export
+    Returns:
+        Tuple of (items written, last id written)
+    """
+    where, params = item_selection(feed, category, since, until, read, since_id)
+
+    cursor = conn.cursor()
+    # Ordered by id, so the last id is a watermark for the next export
+    cursor.execute(f"""
+        SELECT fi.id, f.url, f.name, fi.title, fi.summary, fi.content, fi.full_content,
+               fi.link, fi.is_read, fi.last_updated, fi.created
+        FROM feed_items fi
+        JOIN feeds f ON fi.feed_id = f.id
+        WHERE {where}
+        ORDER BY fi.id ASC
+    """, params)
+    count = 0
+    last_id = since_id
+    for row in cursor:
+        out.write(json.dumps(dict(zip(ITEM_FIELDS, row)), ensure_ascii=False))
+        out.write("\n")
+        count += 1
+        last_id = row[0]
+    return count, last_id
+
+
+# Upsert feed items from NDJSON, as written by export_items
+def import_items(conn, source):
+    """
+    Items are matched to feeds by url and to existing items by title, so
+    importing the same file again changes nothing. Items of feeds that
+    aren't in the feeds file are skipped.
+    Parameters:
+        conn: Database connection
+        source: Text file to read from
+    Returns:
+        Tuple of (items imported, items skipped)
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT url, id FROM feeds")
+    feed_ids = dict(cursor.fetchall())
+    skipped = 0
+
+    def rows():
+        nonlocal skipped
+        for line in source:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            feed_id = feed_ids.get(item.get("feed_url"))
+            if feed_id is None or not item.get("title"):
+                skipped += 1
+                continue
+            yield (feed_id, item["title"], item.get("summary"), item.get("content"),
+                   item.get("full_content"), item.get("link"), int(item.get("is_read") or 0),
+                   int(item.get("last_updated") or 0), int(item.get("created") or 0))
+
+    with conn:
+        # executemany consumes the generator one row at a time
+        cursor.executemany("""
+            INSERT INTO feed_items (feed_id, title, summary, content, full_content, link,
+                                    is_read, last_updated, created)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (feed_id, title) DO UPDATE SET
+                summary = excluded.summary, content = excluded.content,
+                full_content = COALESCE(excluded.full_content, full_content),
+                link = excluded.link, is_read = excluded.is_read,
+                last_updated = excluded.last_updated, created = excluded.created
+        """, rows())
+        imported = cursor.rowcount
+    data_changed()
+    return imported, skipped
+
+
+SYNC_FIELDS = ("feed_url", "title", "is_read", "changed")
+
+
+# Write the local read state changes since the last export to this target
+def sync_export(conn, out, target):
+    """
+    Only the latest change of each item is written. Items are identified
+    by feed url and title, so the other database can have different ids.
+    Parameters:
+        conn: Database connection
+        out: Text file to write NDJSON to
+        target: Name of the target, each target has its own watermark
+    Returns:
+        Number of changes written
+    """
+    name = "export " + (target if target == "-" else os.path.abspath(target))
+    cursor = conn.cursor()
+    with conn:
+        # Compact the journal: older changes of an item and deleted items are never needed
+        cursor.execute("""
+            DELETE FROM state_journal
+            WHERE seq NOT IN (SELECT MAX(seq) FROM state_journal GROUP BY item_id)
+               OR item_id NOT IN (SELECT id FROM feed_items)
+        """)
+        cursor.execute("SELECT seq FROM sync_marks WHERE name = ?", (name,))
+        row = cursor.fetchone()
+        watermark = row[0] if row else 0
+        cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM state_journal")
+        last_seq = cursor.fetchone()[0]
+        cursor.execute("""
+            SELECT f.url, fi.title, j.is_read, j.changed
+            FROM state_journal j
+            JOIN feed_items fi ON fi.id = j.item_id
+            JOIN feeds f ON fi.feed_id = f.id
+            WHERE j.seq > ? AND j.seq <= ? AND j.remote = 0
+            ORDER BY j.seq
+        """, (watermark, last_seq))
+        count = 0
+        for row in cursor:
+            out.write(json.dumps(dict(zip(SYNC_FIELDS, row)), ensure_ascii=False))
+            out.write("\n")
+            count += 1
+        cursor.execute("INSERT OR REPLACE INTO sync_marks (name, seq) VALUES (?, ?)", (name, last_seq))
+    return count
+
+
+# Find the feed here of a feed url from another database, which may have stored another form of it
+def sync_feed_matcher(cursor):
+    """
+    Returns:
+        Function of a feed url, returning the id of its feed here or None
+    """
+    cursor.execute("SELECT old_url, new_url FROM feed_redirects")
+    redirects = {feed_url_key(old): feed_url_key(new) for old, new in cursor.fetchall()}
+    cursor.execute("SELECT url, id FROM feeds")
+    feed_ids = {feed_url_key(url): feed_id for url, feed_id in cursor.fetchall()}
+
+    def feed_of(url):
+        return feed_ids.get(resolve_redirects(redirects, feed_url_key(url)))
+    return feed_of
+
+
+# Apply read states of another database, matched by feed url and item title
+def apply_read_states(cursor, changes):
+    """
+    A change wins only if it is newer than the last change of the item
+    here. Changes of items not fetched yet wait in sync_pending.
+    Parameters:
+        cursor: Cursor inside a transaction
+        changes: Iterable of (feed url, title, is_read, changed)
+    Returns:
+        Tuple of (applied, older, pending)
+    """
+    applied = older = pending = 0
+    feed_of = sync_feed_matcher(cursor)
+    for feed_url, title, is_read, changed in changes:
+        cursor.execute("""
+            SELECT fi.id, fi.is_read, (SELECT MAX(changed) FROM state_journal WHERE item_id = fi.id)
+            FROM feed_items fi WHERE fi.feed_id = ? AND fi.title = ?
+        """, (feed_of(feed_url), title))
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute("""
+                INSERT INTO sync_pending (feed_url, title, is_read, changed) VALUES (?, ?, ?, ?)
+                ON CONFLICT (feed_url, title) DO UPDATE SET is_read = excluded.is_read, changed = excluded.changed
+                WHERE excluded.changed > sync_pending.changed
+            """, (feed_url, title, is_read, changed))
+            pending += 1
+            continue
+        item_id, current, last_changed = row
+        if last_changed is not None and last_changed >= changed:
+            older += 1
+            continue
+        if current != is_read:
+            cursor.execute("UPDATE feed_items SET is_read = ? WHERE id = ?", (is_read, item_id))
+            # The trigger journaled it as a local change of now
+            cursor.execute("""
+                UPDATE state_journal SET changed = ?, remote = 1
+                WHERE seq = (SELECT MAX(seq) FROM state_journal WHERE item_id = ?)
+            """, (changed, item_id))
+        else:
+            # Same state, but its time still decides later conflicts
+            cursor.execute("INSERT INTO state_journal (item_id, is_read, changed, remote) VALUES (?, ?, ?, 1)",
+                           (item_id, is_read, changed))
+        applied += 1
+    return applied, older, pending
+
+
+# Apply read state changes written by sync_export
+def sync_import(conn, source):
+    """
+    Importing the same changes again changes nothing.
+    Parameters:
+        conn: Database connection
+        source: Text file to read NDJSON from
+    Returns:
+        Tuple of (applied, older than the local state, waiting for their items)
+    """
+    def changes():
+        for line in source:
+            if not line.strip():
+                continue
+            change = json.loads(line)
+            if not change.get("feed_url") or not change.get("title"):
+                continue
+            yield (change["feed_url"], change["title"], 1 if change.get("is_read") else 0,
+                   int(change.get("changed") or 0))
+
+    cursor = conn.cursor()
+    with conn:
+        cursor.execute("DELETE FROM sync_pending WHERE changed < ?",
+                       (int(time.time()) - SYNC_PENDING_DAYS * 86400,))
+        result = apply_read_states(cursor, changes())
+    data_changed()
+    log_event(f"Synced read states: {result[0]} applied, {result[1]} older, {result[2]} pending")
+    return result
+
+
+# Apply synced read states that arrived before the items of this feed
+def apply_pending_states(conn, feed):
+    cursor = conn.cursor()
+    cursor.execute("SELECT DISTINCT feed_url FROM sync_pending")
+    urls = [row[0] for row in cursor.fetchall()]
+    if not urls:
+        return
+    feed_of = sync_feed_matcher(cursor)
+    urls = [url for url in urls if feed_of(url) == feed.id]
+    if not urls:
+        return
+    marks = ", ".join("?" * len(urls))
+    cursor.execute(f"SELECT feed_url, title, is_read, changed FROM sync_pending WHERE feed_url IN ({marks})", urls)
+    apply_read_states(cursor, cursor.fetchall())
+    cursor.execute(f"""
+        DELETE FROM sync_pending WHERE feed_url IN ({marks})
+        AND title IN (SELECT title FROM feed_items WHERE feed_id = ?)
+    """, (*urls, feed.id))
+
+
+# Key of an item in an archive, stable across databases like the NDJSON import
+def archive_key(feed_url, title):
+    return hashlib.sha1(f"{feed_url}\n{title}".encode("utf-8")).hexdigest()[:24]
+
+
+def archive_body(item):
+    return strip_scripts(item["full_content"] or item["content"] or item["summary"] or "")
+
+
+# An item as a mail, with a plain text and an html part
+def archive_message(key, item):
+    message = EmailMessage()
+    message["Subject"] = " ".join((item["title"] or "(no title)").split())
+    message["From"] = Address(" ".join((item["feed_name"] or item["feed_url"]).split()), "feedln", "localhost")
+    message["Date"] = formatdate(item["last_updated"], localtime=True)
+    message["Message-ID"] = f"<{key}@feedln>"
+    message["X-Feedln-Link"] = item["link"] or ""
+    body = archive_body(item)
+    message.set_content("\n".join(html_to_lines(body)) + f"\n\n{item['link'] or ''}\n")
+    message.add_alternative(f"<h1>{escape(item['title'] or '')}</h1>\n{body}\n"
+                            f"<p><a href=\"{escape(item['link'] or '')}\">{escape(item['link'] or '')}</a></p>",
+                            subtype="html")
+    return message
+
+
+# Mails appended to an mbox file
+class MboxArchive:
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def existing(self):
+        keys = set()
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as file:
+                for line in file:
+                    if line.startswith(b"Message-ID: <") and line.rstrip().endswith(b"@feedln>"):
+                        keys.add(line[13:].split(b"@")[0].decode("ascii", "replace"))
+        return keys
+
+    def add(self, key, item):
+        if self.file is None:
+            self.file = open(self.path, "ab")
+        message = archive_message(key, item)
+        self.file.write(f"From feedln@localhost {time.asctime(time.gmtime(item['last_updated']))}\n".encode())
+        BytesGenerator(self.file, mangle_from_=True, policy=message.policy.clone(linesep="\n")).flatten(message)
+        self.file.write(b"\n")
+
+    def close(self):
+        if self.file:
+            self.file.close()
+
+
+# One file per mail in a Maildir, read items go to cur/ with the Seen flag
+class MaildirArchive:
+    def __init__(self, path):
+        self.path = path
+        self.host = socket.gethostname().replace("/", "\\057").replace(":", "\\072")
+        for folder in ("tmp", "new", "cur"):
+            os.makedirs(os.path.join(path, folder), exist_ok=True)
+
+    def existing(self):
+        keys = set()
+        for folder in ("new", "cur"):
+            for name in os.listdir(os.path.join(self.path, folder)):
+                unique = name.split(":")[0].split(".")
+                if len(unique) > 1 and unique[1].startswith("feedln-"):
+                    keys.add(unique[1][7:])
+        return keys
+
+    def add(self, key, item):
+        name = f"{int(item['last_updated'])}.feedln-{key}.{self.host}"
+        temporary = os.path.join(self.path, "tmp", name)
+        with open(temporary, "wb") as file:
+            file.write(archive_message(key, item).as_bytes(policy=email.policy.SMTP.clone(linesep="\n")))
+        if item["is_read"]:
+            os.rename(temporary, os.path.join(self.path, "cur", name + ":2,S"))
+        else:
+            os.rename(temporary, os.path.join(self.path, "new", name))
+
+    def close(self):
+        pass
+
+
+# A single static page, an index of the items followed by the items
+class HtmlArchive:
+    """
+    The sections are between marker comments, so an export copies the
+    sections of the previous file line by line, and adds the new items at
+    their end. New items are kept in temporary files until then.
+    """
+    MARKERS = ("<!-- feedln:index -->", "<!-- feedln:end-index -->",
+               "<!-- feedln:items -->", "<!-- feedln:end-items -->")
+
+    def __init__(self, path):
+        self.path = path
+        self.index = tempfile.TemporaryFile("w+", encoding="utf-8")
+        self.items = tempfile.TemporaryFile("w+", encoding="utf-8")
+
+    def section(self, start, end):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as file:
+            inside = False
+            for line in file:
+                if line.rstrip("\n") == start:
+                    inside = True
+                elif line.rstrip("\n") == end:
+                    return
+                elif inside:
+                    yield line
+
+    def existing(self):
+        return {match.group(1) for line in self.section(*self.MARKERS[:2])
+                for match in re.finditer(r'id="index-(\w+)"', line)}
+
+    def add(self, key, item):
+        date = time.strftime('%Y-%m-%d %H:%M', time.localtime(item["last_updated"]))
+        title = escape(item["title"] or "(no title)")
+        feed = escape(item["feed_name"] or item["feed_url"])
+        self.index.write(f'<li id="index-{key}"><a href="#item-{key}">{date} | {feed} | {title}</a></li>\n')
+        body = archive_body(item)
+        for marker in self.MARKERS:
+            body = body.replace(marker, "")
+        self.items.write(f'<article id="item-{key}">\n<h2><a href="{escape(item["link"] or "")}">{title}</a></h2>\n'
+                         f'<p>{date} | {feed}</p>\n{body}\n</article>\n')
+
+    def close(self):
+        temporary = self.path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as out:
+            out.write(f'<!DOCTYPE html>\n<html>\n<head><meta charset="utf-8"><title>{program} archive</title></head>\n'
+                      f'<body>\n<h1>{program} archive</h1>\n<ul>\n{self.MARKERS[0]}\n')
+            out.writelines(self.section(*self.MARKERS[:2]))
+            self.index.seek(0)
+            for line in self.index:
+                out.write(line)
+            out.write(f"{self.MARKERS[1]}\n</ul>\n{self.MARKERS[2]}\n")
+            out.writelines(self.section(*self.MARKERS[2:]))
+            self.items.seek(0)
+            for line in self.items:
+                out.write(line)
+            out.write(f"{self.MARKERS[3]}\n</body>\n</html>\n")
+        os.replace(temporary, self.path)
+        self.index.close()
+        self.items.close()
+
+
+ARCHIVE_FORMATS = {"mbox": MboxArchive, "maildir": MaildirArchive, "html": HtmlArchive}
+
+
+# Format of an archive from its name, a directory is a Maildir
+def archive_format(target):
+    extension = os.path.splitext(target.rstrip("/"))[1].lower()
+    if extension in (".html", ".htm"):
+        return "html"
+    if extension == ".mbox" or (os.path.isfile(target) and extension != ""):
+        return "mbox"
+    return "maildir"
+
+
+# Stream a selection of items into an mbox, Maildir or HTML archive
+def export_archive(conn, target, archive_type=None, progress=None, **selection):
+    """
+    Items already in the archive, by feed url and title, are skipped, so
+    exporting again to the same target only adds the new items.
+    Parameters:
+        conn: Database connection
+        target: mbox or html file, or Maildir directory
+        archive_type: 'mbox', 'maildir' or 'html', from the target name if None
+        progress: Called with (items done, total items)
+        selection: Filters of item_selection
+    Returns:
+        Tuple of (items written, items already in the archive)
+    """
+    archive = ARCHIVE_FORMATS[archive_type or archive_format(target)](target)
+    existing = archive.existing()
+    where, params = item_selection(**selection)
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT COUNT(*) FROM feed_items fi JOIN feeds f ON fi.feed_id = f.id WHERE {where}", params)
+    total = cursor.fetchone()[0]
+    cursor.row_factory = sqlite3.Row
+    cursor.execute(f"""
+        SELECT f.url AS feed_url, f.name AS feed_name, fi.title, fi.summary, fi.content,
+               fi.full_content, fi.link, fi.is_read, fi.last_updated
+        FROM feed_items fi
+        JOIN feeds f ON fi.feed_id = f.id
+        WHERE {where}
+        ORDER BY fi.last_updated ASC, fi.id ASC
+    """, params)
+    written = skipped = 0
+    try:
+        for done, item in enumerate(cursor, 1):
+            key = archive_key(item["feed_url"], item["title"])
+            if key in existing:
+                skipped += 1
+            else:
+                archive.add(key, item)
+                existing.add(key)
+                written += 1
+            if progress and (done % 50 == 0 or done == total):
+                progress(done, total)
+    finally:
+        archive.close()
+    log_event(f"Exported {written} items to {target}, {skipped} already there")
+    return written, skipped
+
+
+# Export the listed items of a category or search result
+def export_archive_prompt(stdscr, conn, category, search_text=None, search_where='all'):
+    target = prompt(stdscr, "Export to (file.mbox, file.html or Maildir directory): ")
+    if not target:
+        return
+    def progress(done, total):
+        footer(stdscr, f"Exporting: {done}/{total}")
+        stdscr.refresh()
+    # Reading is safe next to the daemon, it uses WAL
+    export_conn = sqlite3.connect(database) if is_attached(conn) else conn
+    try:
+        written, skipped = export_archive(export_conn, os.path.expanduser(target), progress=progress,
+                                          category=category, search_text=search_text, search_where=search_where)
+        footerpop(stdscr, f"Exported {written} items, {skipped} already in the archive", 2, 0)
+    except Exception as e:
+        log_event(f"Error exporting archive: {str(e)}", logging.ERROR)
+        footerpop(stdscr, f"Error exporting: {e}", 2, 1)
+    finally:
+        if export_conn is not conn:
+            export_conn.close()
+
+
+# Feeds to fetch and notifications for the daemon, on its own connection
+class FetchScheduler:
+    def __init__(self, server):
+        self.server = server
+        self.requests = queue.Queue()
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        conn = sqlite3.connect(database, timeout=30)
+        next_refresh = time.time()
+        while True:
+            try:
+                categories, feed_ids = self.requests.get(timeout=max(0, next_refresh - time.time()))
+            except queue.Empty:
+                # Scheduled refresh of everything
+                categories, feed_ids = None, None
+                next_refresh = time.time() + daemon_interval
+            try:
+                load_feeds_to_db(feedfile, conn)
+                report = RefreshReport(conn)
+                if feed_ids:
+                    cursor = conn.cursor()
+                    cursor.row_factory = FeedRecord.from_row
+                    for feed_id in feed_ids:
+                        cursor.execute(f"SELECT {FEED_COLUMNS} FROM feeds f WHERE f.id = ?", (feed_id,))
+                        feed = cursor.fetchone()
+                        if feed:
+                            update_feed_items(conn, feed, report.deadline)
+                else:
+                    if categories is None:
+                        categories = [category.name for category in fetch_categories(conn)]
+                    refresh_categories(conn, categories, report)
+                    log_event(f"Daemon refresh: {report.fetched} fetched, {len(report.failed)} failed, "
+                              f"{report.skipped} skipped, {report.missed} missed")
+            except Exception as e:
+                log_event(f"Daemon refresh error: {str(e)}", logging.ERROR)
+            self.server.notify()
+
+
+# Queue a refresh in the daemon
+@daemon_api("fetch")
+def fetch_now(conn, categories=None, feed_ids=None):
+    if daemon_server is None:
+        raise RuntimeError("Not running as daemon")
+    daemon_server.scheduler.requests.put((categories, feed_ids))
+    return True
+
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        # Replies and the events of notify() come from different threads, one line at a time
+        self.send_lock = threading.Lock()
+
+    def send(self, message):
+        data = json.dumps(message, ensure_ascii=False, default=record_to_json).encode("utf-8") + b"\n"
+        with self.send_lock:
+            self.wfile.write(data)
+            self.wfile.flush()
+
+    def handle(self):
+        for line in self.rfile:
+            notify = False
+            request = {}
+            try:
+                request = json.loads(line)
+                if request.get("cmd") == "subscribe":
+                    # Only events are sent on this connection, until it is closed
+                    self.server.subscribe(self)
+                    continue
+                if request.get("cmd") not in DAEMON_API:
+                    raise ValueError(f"Unknown command: {request.get('cmd')}")
+                function, notify = DAEMON_API[request["cmd"]]
+                with self.server.lock:
+                    result = function(self.server.conn, *request.get("args", []), **request.get("kwargs", {}))
+                response = {"result": result}
+            except Exception as e:
+                response = {"error": str(e)}
+            self.send(response)
+            if notify and "result" in response:
+                self.server.notify()
+
+    def finish(self):
+        self.server.unsubscribe(self)
+        super().finish()
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path):
+        super().__init__(path, DaemonHandler)
+        os.chmod(path, 0o600)
+        self.conn = sqlite3.connect(database, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")  # Readers don't wait for the fetcher
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.subscribers_lock = threading.Lock()
+        self.scheduler = FetchScheduler(self)
+
+    def subscribe(self, handler):
+        with self.subscribers_lock:
+            self.subscribers.add(handler)
+
+    def unsubscribe(self, handler):
+        with self.subscribers_lock:
+            self.subscribers.discard(handler)
+
+    # Tell the subscribed clients that the data changed
+    def notify(self):
+        with self.subscribers_lock:
+            subscribers = list(self.subscribers)
+        for handler in subscribers:
+            try:
+                handler.send({"event": "updated"})
+            except OSError:
+                self.unsubscribe(handler)
+
+
+daemon_server = None
+
+
+# Run as daemon, owning the database and the fetching
+def run_daemon(path):
+    global daemon_server
+    if connect_daemon(path):
+        print(f"A daemon is already running on {path}")
+        return
+    if os.path.exists(path):
+        os.remove(path)  # Left by a daemon that didn't exit cleanly
+    daemon_server = DaemonServer(path)
+    daemon_server.scheduler.start()
+    log_event(f"Daemon listening on {path}")
+    print(f"{program} daemon listening on {path}")
+    try:
+        daemon_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon_server.server_close()
+        os.remove(path)
+
+
 def initialize_screen(stdscr, conn):
     curses.start_color()
     curses.init_pair(1, curses.COLOR_WHITE, curses.COLOR_BLACK)  # Color pair 1: White text on black background
@@ -1541,15 +5654,97 @@ def initialize_screen(stdscr, conn):
 
 # Main function
 def main():
-    global feedfile, database, FETCHONLOAD
+    global feedfile, database, FETCHONLOAD, resource_cache, shared_response_cache
+    global daemon_socket, daemon_client, rules_file, download_manager
     args = parse_arguments()  # Parse command line arguments
     feedfile = args.file  # Update feedfile with command line argument if provided
     FETCHONLOAD = args.fetch
     database = os.path.splitext(feedfile)[0] + '.sq3'
+    socket_path = os.path.abspath(os.path.splitext(feedfile)[0] + '.sock')
     load_config()  # Load user defined variables
+    rules_file = rules_file or os.path.splitext(feedfile)[0] + '.rules'
+    if not (args.daemon or args.local or args.import_opml or args.export_opml or args.export_items
+            or args.import_items or args.export_archive or args.sync_export or args.sync_import
+            or args.compare_parsers is not None):
+        # Attach to a running daemon, it owns the database and the fetching
+        daemon_client = connect_daemon(socket_path)
+    # RotatingFileHandler can't share a file between processes, the daemon's log file is its own
+    setup_logging(to_file=daemon_client is None)
+    resource_cache = ResourceCache(cache_dir, cache_size)
+    download_manager = DownloadManager(download_dir, download_workers, download_rate)
+    if shared_cache:
+        shared_response_cache = SharedResponseCache(shared_cache, shared_cache_ttl)
     check_feed_file()  # Check feed file, add default if not exist
+    if args.daemon:
+        setup_database().close()
+        download_manager.start()
+        run_daemon(socket_path)
+        return
+    if daemon_client:
+        daemon_socket = socket_path
+        daemon_client.subscribe()
+        sync_feeds(daemon_client, feedfile)
+        curses.wrapper(lambda stdscr: initialize_screen(stdscr, daemon_client))
+        return
     conn = setup_database()
     load_feeds_to_db(feedfile, conn)
+    if args.import_opml:
+        added, skipped = import_opml(args.import_opml, conn, feedfile)
+        print(f"Imported {added} feeds from {args.import_opml}, {skipped} duplicates skipped")
+        return
+    if args.export_opml:
+        count = write_opml(conn, args.export_opml)
+        print(f"Exported {count} feeds to {args.export_opml}")
+        return
+    if args.export_items:
+        # stdout is left open, only a file opened here is closed
+        target = contextlib.nullcontext(sys.stdout) if args.export_items == "-" else open(args.export_items, "w",
+                                                                                          encoding="utf-8")
+        with target as out:
+            count, last_id = export_items(conn, out, args.feed, args.category, args.since, args.until,
+                                          args.read, args.since_id)
+        print(f"Exported {count} items, last id: {last_id}", file=sys.stderr)
+        return
+    if args.import_items:
+        target = contextlib.nullcontext(sys.stdin) if args.import_items == "-" else open(args.import_items,
+                                                                                         encoding="utf-8")
+        with target as source:
+            imported, skipped = import_items(conn, source)
+        print(f"Imported {imported} items, {skipped} skipped", file=sys.stderr)
+        return
+    if args.export_archive:
+        def progress(done, total):
+            print(f"\rExporting: {done}/{total}", end="", file=sys.stderr, flush=True)
+        written, skipped = export_archive(conn, args.export_archive, args.archive_format, progress,
+                                          feed=args.feed, category=args.category, since=args.since,
+                                          until=args.until, read=args.read, search_text=args.search)
+        print(f"\nExported {written} items, {skipped} already in the archive", file=sys.stderr)
+        return
+    if args.sync_export:
+        # Appended, an earlier export may not be imported yet. Importing again changes nothing
+        target = contextlib.nullcontext(sys.stdout) if args.sync_export == "-" else open(args.sync_export, "a",
+                                                                                         encoding="utf-8")
+        with target as out:
+            count = sync_export(conn, out, args.sync_export)
+        print(f"Exported {count} read state changes", file=sys.stderr)
+        return
+    if args.sync_import:
+        target = contextlib.nullcontext(sys.stdin) if args.sync_import == "-" else open(args.sync_import,
+                                                                                        encoding="utf-8")
+        with target as source:
+            applied, older, pending = sync_import(conn, source)
+        print(f"Applied {applied} read state changes, {older} older than the local ones, "
+              f"{pending} waiting for their items", file=sys.stderr)
+        return
+    if args.compare_parsers is not None:
+        sources = feed_bodies(conn, args.compare_parsers)
+        if args.save_samples:
+            sources = save_bodies(sources, args.save_samples)
+        compared, fallbacks, differences, fast_time, slow_time = compare_parsers(sources)
+        print(f"{compared} feeds compared, {fallbacks} left to feedparser, {differences} differences")
+        print(f"Fast parser {fast_time:.3f}s, feedparser {slow_time:.3f}s")
+        sys.exit(1 if differences else 0)
+    download_manager.start()
     curses.wrapper(lambda stdscr: initialize_screen(stdscr, conn))
 
 
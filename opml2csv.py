@@ -3,39 +3,169 @@ from lxml import etree as ET
 import csv
 import sys
 import argparse
+import os
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urljoin
 
-def opml_to_csv(opml_file, csv_file):
+PROBE_BYTES = 65536  # Start of a feed read to find its type and title
+PERMANENT_REDIRECTS = (301, 308)
+ATOM_NS = "{http://www.w3.org/2005/Atom}"
+RSS1_NS = "{http://purl.org/rss/1.0/}"
+
+
+def read_opml(opml_file):
+    """
+    Extracts feed title, XML URL, category and tags from OPML outlines.
+    Returns:
+        List of [title, url, category, tags]
+    """
+    parser = ET.XMLParser(recover=True)
+    tree = ET.parse(opml_file, parser)
+    root = tree.getroot()
+    feeds = []
+    # Find all outline elements (feeds)
+    for outline in root.findall('.//outline'):
+        # Check if it's a feed (has xmlUrl attribute)
+        xml_url = outline.get('xmlUrl')
+        if xml_url:
+            title = outline.get('title') or outline.get('text', '')
+            # Get the category by looking at parent outline's text/title
+            category = ''
+            parent = outline.getparent()
+            if parent is not None and parent.tag == 'outline':
+                category = parent.get('text') or parent.get('title', '')
+            feeds.append([title, xml_url.strip(), category, outline.get('category') or ''])
+    return feeds
+
+
+def feed_type(root):
+    """Type and title of a parsed feed, or (None, None) if it isn't one."""
+    if root is None:
+        return None, None
+    if root.tag == 'rss':
+        return f"RSS {root.get('version', '')}".strip(), root.findtext('channel/title')
+    if root.tag == ATOM_NS + 'feed':
+        return "Atom", root.findtext(ATOM_NS + 'title')
+    if root.tag.endswith('}RDF'):
+        return "RSS 1.0", root.findtext(f'{RSS1_NS}channel/{RSS1_NS}title')
+    return None, None
+
+
+def probe_feed(url, timeout):
+    """
+    Fetch the start of a feed, following redirects.
+    Returns:
+        Dictionary with the permanent url, the feed type and title, or the error
+    """
+    result = {"url": url, "type": None, "title": None, "error": None}
+    try:
+        with requests.get(url, timeout=timeout, stream=True, headers={"User-Agent": "Feedln"}) as response:
+            # Only a chain of permanent redirects moves the feed
+            for hop in response.history:
+                if hop.status_code not in PERMANENT_REDIRECTS:
+                    break
+                result["url"] = urljoin(hop.url, hop.headers.get("Location", ""))
+            if response.status_code >= 400:
+                result["error"] = f"HTTP {response.status_code}"
+                return result
+            data = b""
+            for chunk in response.iter_content(8192):
+                data += chunk
+                if len(data) >= PROBE_BYTES:
+                    break
+    except requests.exceptions.RequestException as e:
+        result["error"] = type(e).__name__
+        return result
+    try:
+        root = ET.fromstring(data, ET.XMLParser(recover=True, resolve_entities=False, no_network=True))
+    except (ET.XMLSyntaxError, ValueError):
+        root = None
+    result["type"], title = feed_type(root)
+    result["title"] = (title or "").strip()
+    if not result["type"]:
+        result["error"] = "Not a feed"
+    return result
+
+
+def validate_feeds(feeds, workers, timeout, report_file):
+    """
+    Probe every feed concurrently, move permanently redirected feeds, fill
+    in missing titles, drop duplicates and dead feeds.
+    Returns:
+        List of the live feeds, as [title, url, category, tags]
+    """
+    # The same url in several folders is one feed in several categories
+    unique = {}
+    for title, url, category, tags in feeds:
+        if url in unique:
+            if category and category not in unique[url][2].split(';'):
+                unique[url][2] = f"{unique[url][2]};{category}".strip(';')
+        else:
+            unique[url] = [title, url, category, tags]
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(probe_feed, url, timeout): url for url in unique}
+        for done, future in enumerate(as_completed(futures), 1):
+            results[futures[future]] = future.result()
+            print(f"\rValidated {done}/{len(futures)}", end="", file=sys.stderr, flush=True)
+    print(file=sys.stderr)
+
+    live = {}
+    dead = []
+    types = {}
+    redirected = 0
+    for url, feed in unique.items():
+        result = results[url]
+        if result["error"]:
+            dead.append(feed + [result["error"]])
+            continue
+        if result["url"] != url:
+            redirected += 1
+            feed[1] = result["url"]
+        if not feed[0]:
+            feed[0] = result["title"] or feed[1]
+        if feed[1] in live:
+            # Different urls of one feed, after the redirects
+            kept = live[feed[1]]
+            for category in feed[2].split(';'):
+                if category and category not in kept[2].split(';'):
+                    kept[2] = f"{kept[2]};{category}".strip(';')
+            continue
+        live[feed[1]] = feed
+        types[result["type"]] = types.get(result["type"], 0) + 1
+
+    with open(report_file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Name', 'URL', 'Category', 'Tags', 'Problem'])
+        writer.writerows(dead)
+    print(f"{len(feeds)} feeds: {len(live)} valid, {len(dead)} dead, {redirected} moved, "
+          f"{len(feeds) - len(live) - len(dead)} duplicates. Dead feeds are listed in {report_file}")
+    print(", ".join(f"{kind}: {count}" for kind, count in sorted(types.items())))
+    return list(live.values())
+
+
+def opml_to_csv(opml_file, csv_file, validate=False, workers=64, timeout=10, report_file=None):
     """
     Convert OPML file to CSV format for Feedln.
     Extracts feed title, XML URL, and category from OPML outlines.
     """
     try:
-        # Parse OPML file
-        parser = ET.XMLParser(recover=True)
-        tree = ET.parse(opml_file, parser)
-        root = tree.getroot()
-        
+        feeds = read_opml(opml_file)
+        if validate:
+            report_file = report_file or os.path.splitext(csv_file)[0] + '-dead.csv'
+            feeds = validate_feeds(feeds, workers, (min(timeout, 5), timeout), report_file)
+
         # Open CSV file for writing
         with open(csv_file, 'w', newline='', encoding='utf-8') as f:
             writer = csv.writer(f)
             # Write header
             writer.writerow(['Name', 'URL', 'Category', 'Tags'])
-            
-            # Find all outline elements (feeds)
-            for outline in root.findall('.//outline'):
-                # Check if it's a feed (has xmlUrl attribute)
-                xml_url = outline.get('xmlUrl')
-                if xml_url:
-                    title = outline.get('title') or outline.get('text', '')
-                    # Get the category by looking at parent outline's text/title
-                    category = ''
-                    parent = outline.getparent()
-                    if parent is not None and parent.tag == 'outline':
-                        category = parent.get('text') or parent.get('title', '')
-                    writer.writerow([title, xml_url, category])
-        
+            writer.writerows(feeds)
+
         print(f"Successfully converted {opml_file} to {csv_file}")
-        
+
     except ET.ParseError:
         print(f"Error: Could not parse {opml_file}. Make sure it's a valid OPML file.")
         sys.exit(1)
@@ -49,12 +179,20 @@ def main():
     parser.add_argument('opml_file', help='Input OPML file')
     parser.add_argument('-o', '--output', help='Output CSV file (default: output.csv)',
                       default='output.csv')
-    
+    parser.add_argument('--validate', action='store_true',
+                        help='Probe every feed: follow permanent redirects, fill in missing titles, '
+                             'drop duplicates and dead feeds')
+    parser.add_argument('--workers', type=int, default=64,
+                        help='Feeds probed at the same time (default: 64)')
+    parser.add_argument('--timeout', type=int, default=10,
+                        help='Seconds to wait for a feed (default: 10)')
+    parser.add_argument('--report', help='CSV file listing the dead feeds (default: <output>-dead.csv)')
+
     # Parse arguments
     args = parser.parse_args()
-    
+
     # Convert OPML to CSV
-    opml_to_csv(args.opml_file, args.output)
+    opml_to_csv(args.opml_file, args.output, args.validate, args.workers, args.timeout, args.report)
 
 if __name__ == '__main__':
     main()